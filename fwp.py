@@ -2,20 +2,4027 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, font, colorchooser
 from tkinter.simpledialog import askstring
 import tkinter.ttk as ttk
-from ttkthemes import ThemedTk
-from PIL import Image, ImageTk
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate, chain, cycle, islice, repeat
+from operator import add
+import _tkinter
+import argparse
+import base64
+import codecs
+import csv
+import io
+import json
+import math
+import mmap
 import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+# A single mutation of the text widget. Positions are (line, col) tuples; for
+# inserts `end` is the position after the new text, for deletes it is the end
+# of the removed range before deletion. "reset" means the whole buffer changed.
+# `objects` lists the models (None for images) behind the OBJECT_CHARs in
+# `text`; `tags` holds the formatting of deleted text when undo is recording.
+TextEdit = namedtuple("TextEdit", "kind start end text objects tags", defaults=(None, None))
+
+# Stands in for an embedded window (such as a table) in the document text
+OBJECT_CHAR = "\ufffc"
+
+
+def expand_objects(chunks, replacements):
+    """Yield text chunks with each OBJECT_CHAR replaced by the next replacement."""
+    replacements = iter(replacements)
+    for chunk in chunks:
+        if OBJECT_CHAR not in chunk:
+            yield chunk
+            continue
+        parts = chunk.split(OBJECT_CHAR)
+        yield parts[0]
+        for part in parts[1:]:
+            yield next(replacements, "")
+            yield part
+
+
+def text_end_position(start, text):
+    """Return the (line, col) position reached after inserting text at start."""
+    newlines = text.count("\n")
+    if not newlines:
+        return (start[0], start[1] + len(text))
+    return (start[0] + newlines, len(text) - text.rfind("\n") - 1)
+
+
+class FenwickTree:
+    """Prefix sums of a list of non-negative counts with O(log n) updates and searches."""
+
+    def __init__(self, values=()):
+        self.tree = [0]
+        self.tree.extend(values)
+        size = len(self.tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, index, delta):
+        """Add delta to the value at index."""
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, count):
+        """Return the sum of the first count values."""
+        total = 0
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def search(self, value):
+        """Return (index, rest) for the value whose span holds value, rest being the distance into it.
+
+        index is len(self) when value is beyond the total.
+        """
+        index = 0
+        step = 1 << (len(self).bit_length() - 1) if len(self) else 0
+        while step:
+            candidate = index + step
+            if candidate < len(self.tree) and self.tree[candidate] <= value:
+                index = candidate
+                value -= self.tree[candidate]
+            step >>= 1
+        return index, value
+
+
+class LineIndex:
+    """Line lengths with O(log n) conversion between offsets and (line, col).
+
+    Widths (length plus the newline) are kept in blocks of up to twice
+    block_size lines, with Fenwick trees over the blocks' line counts and
+    widths. Editing lines within one block updates the trees in place;
+    larger edits rebuild them from the blocks. Lines are 0-based.
+    """
+
+    def __init__(self, lengths=(0,), block_size=256):
+        self.block_size = block_size
+        self.reset(lengths)
+
+    def reset(self, lengths):
+        widths = [length + 1 for length in lengths]
+        self._build([widths[i:i + self.block_size] for i in range(0, len(widths), self.block_size)])
+
+    def _build(self, blocks):
+        self.blocks = blocks
+        self.counts = FenwickTree(len(block) for block in blocks)
+        self.widths = FenwickTree(sum(block) for block in blocks)
+        self.lines = self.counts.prefix(len(blocks))
+
+    def __len__(self):
+        return self.lines
+
+    def length(self, line):
+        block, i = self.counts.search(line)
+        return self.blocks[block][i] - 1
+
+    def lengths(self, first, stop):
+        """Return the lengths of lines first to stop - 1."""
+        block, i = self.counts.search(first)
+        widths = []
+        while len(widths) < stop - first and block < len(self.blocks):
+            widths += self.blocks[block][i:i + stop - first - len(widths)]
+            block += 1
+            i = 0
+        return [width - 1 for width in widths]
+
+    def start(self, line):
+        """Return the offset at which line starts."""
+        block, i = self.counts.search(line)
+        if block == len(self.blocks):
+            return self.widths.prefix(block)
+        return self.widths.prefix(block) + sum(self.blocks[block][:i])
+
+    def position(self, offset):
+        """Return the (line, col) of an offset, clamped to the end of the last line."""
+        block, rest = self.widths.search(offset)
+        if block == len(self.blocks):
+            return self.lines - 1, self.length(self.lines - 1)
+        ends = list(accumulate(self.blocks[block]))
+        i = bisect_right(ends, rest)
+        return self.counts.prefix(block) + i, rest - (ends[i - 1] if i else 0)
+
+    def replace(self, first, stop, lengths):
+        """Replace lines first to stop - 1 with lines of the given lengths."""
+        widths = [length + 1 for length in lengths]
+        first_block, i = self.counts.search(first)
+        last_block, j = self.counts.search(stop - 1)
+        if first_block == last_block:
+            block = self.blocks[first_block]
+            if 0 < len(block) - (j + 1 - i) + len(widths) <= 2 * self.block_size:
+                removed = sum(block[i:j + 1])
+                self.counts.add(first_block, len(widths) - (j + 1 - i))
+                self.widths.add(first_block, sum(widths) - removed)
+                self.lines += len(widths) - (j + 1 - i)
+                block[i:j + 1] = widths
+                return
+        widths = self.blocks[first_block][:i] + widths + self.blocks[last_block][j + 1:]
+        middle = [widths[k:k + self.block_size] for k in range(0, len(widths), self.block_size)]
+        self._build(self.blocks[:first_block] + middle + self.blocks[last_block + 1:])
+
+
+# Markdown ATX headings, "# Title" to "###### Title"
+MARKDOWN_HEADING = re.compile(r"(#{1,6})[ \t]+\S")
+
+
+def heading_level(line):
+    """Return the Markdown heading level of a line, or 0 if it is not a heading."""
+    match = MARKDOWN_HEADING.match(line) if line[:1] == "#" else None
+    return len(match.group(1)) if match else 0
+
+
+class DocumentStats:
+    """Per-line word counts, lengths and heading levels that are updated incrementally.
+
+    headings_version changes whenever an edit adds, removes or moves a
+    Markdown heading.
+    """
+
+    def __init__(self):
+        self.line_words = [0]
+        self.line_headings = [0]
+        self.line_index = LineIndex()
+        self.words = 0
+        self.chars = 0
+        self.headings = 0
+        self.headings_version = 0
+
+    @property
+    def lines(self):
+        return len(self.line_words)
+
+    def reset(self, text):
+        """Recount everything from the full document text."""
+        lines = text.split("\n")
+        lengths = [len(line) for line in lines]
+        self.line_words = [len(line.split()) for line in lines]
+        self.line_headings = [heading_level(line) for line in lines]
+        self.line_index.reset(lengths)
+        self.words = sum(self.line_words)
+        self.chars = sum(lengths) + len(lines) - 1
+        self.headings = len(self.line_headings) - self.line_headings.count(0)
+        self.headings_version += 1
+
+    def replace_lines(self, first, last, new_lines):
+        """Replace the counts of lines first..last (1-based, inclusive) with new_lines."""
+        words = [len(line.split()) for line in new_lines]
+        chars = [len(line) for line in new_lines]
+        headings = [heading_level(line) for line in new_lines]
+        old_headings = self.line_headings[first - 1:last]
+        self.words += sum(words) - sum(self.line_words[first - 1:last])
+        self.chars += sum(chars) - sum(self.line_index.lengths(first - 1, last))
+        self.chars += len(new_lines) - (last - first + 1)
+        self.line_words[first - 1:last] = words
+        self.line_headings[first - 1:last] = headings
+        self.line_index.replace(first - 1, last, chars)
+        added = len(headings) - headings.count(0)
+        removed = len(old_headings) - old_headings.count(0)
+        if added or removed or len(new_lines) != last - first + 1 and self.headings:
+            self.headings += added - removed
+            self.headings_version += 1
+
+
+class RefreshScheduler:
+    """Coalesce refresh requests for named views into one idle-time pass.
+
+    Views are marked dirty by request() and redrawn together the next time Tk
+    is idle, but never more often than max_rate passes per second.
+    """
+
+    def __init__(self, widget, max_rate=30):
+        self.widget = widget
+        self.max_rate = max_rate
+        self._views = {}
+        self._dirty = set()
+        self._pending = None
+        self._last_run = 0.0
+        self.requested = 0
+        self.executed = 0
+
+    def register(self, name, callback):
+        """Register a view callback to be run when name is refreshed."""
+        self._views[name] = callback
+
+    def request(self, *names):
+        """Mark views as dirty (all views when none are given) and schedule a pass."""
+        self.requested += 1
+        self._dirty.update(names or self._views)
+        if self._pending is not None:
+            return
+        delay = self._last_run + 1.0 / self.max_rate - time.monotonic() if self.max_rate else 0
+        if delay > 0:
+            self._pending = self.widget.after(int(delay * 1000) + 1, self._run)
+        else:
+            self._pending = self.widget.after_idle(self._run)
+
+    def flush(self):
+        """Run any pending refresh immediately."""
+        if self._pending is not None:
+            self.widget.after_cancel(self._pending)
+            self._run()
+
+    def _run(self):
+        self._pending = None
+        self._last_run = time.monotonic()
+        dirty, self._dirty = self._dirty, set()
+        self.executed += 1
+        for name, callback in self._views.items():
+            if name in dirty:
+                callback()
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task once it has been cancelled."""
+
+
+class Task:
+    """Handle for a TaskRunner job, shared by its worker and the Tk thread."""
+
+    def __init__(self, runner, on_done, on_progress):
+        self.runner = runner
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.future = None
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        """Stop delivering results; a task that has not started will not run."""
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """Raise TaskCancelled in the worker if the task was cancelled."""
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, value):
+        """Report progress from the worker; it reaches on_progress on the Tk thread."""
+        self.runner._events.put((self, "progress", value))
+
+
+class TaskRunner:
+    """Run long operations on a thread pool and hand their results back to Tk.
+
+    Workers never touch Tk: progress and results travel through a queue that
+    the Tk thread drains with after(), spending at most frame_budget seconds
+    per pass. Serial tasks share a single worker and run in submission order,
+    which keeps file writes to the same path ordered.
+    """
+
+    def __init__(self, widget, max_workers=4, poll_interval=20, frame_budget=0.03):
+        self.widget = widget
+        self.poll_interval = poll_interval
+        self.frame_budget = frame_budget
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TaskRunner")
+        self.serial = ThreadPoolExecutor(max_workers=1, thread_name_prefix="TaskRunnerSerial")
+        self._events = queue.Queue()
+        self._tasks = set()
+        self._poll = None
+
+    def submit(self, func, *args, on_done=None, on_progress=None, serial=False):
+        """Run func(task, *args) off the Tk thread and return its Task.
+
+        on_progress(value) and on_done(result, error) are called on the Tk
+        thread; neither is called once the task has been cancelled.
+        """
+        task = Task(self, on_done, on_progress)
+        executor = self.serial if serial else self.pool
+        task.future = executor.submit(self._run, task, func, args)
+        self._tasks.add(task)
+        if self._poll is None:
+            self._poll = self.widget.after(self.poll_interval, self._drain)
+        return task
+
+    def _run(self, task, func, args):
+        try:
+            task.check()
+            result = (func(task, *args), None)
+        except TaskCancelled:
+            result = (None, None)
+        except Exception as e:
+            result = (None, e)
+        self._events.put((task, "done", result))
+
+    def _drain(self):
+        """Deliver queued progress and results on the Tk thread."""
+        self._poll = None
+        deadline = time.monotonic() + self.frame_budget
+        while time.monotonic() < deadline:
+            try:
+                task, kind, value = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "done":
+                task.done = True
+            if task.cancelled:
+                continue
+            if kind == "progress":
+                if task.on_progress:
+                    task.on_progress(value)
+            elif task.on_done:
+                task.on_done(*value)
+        self._tasks = {task for task in self._tasks if not task.done and not task.future.cancelled()}
+        if self._tasks or not self._events.empty():
+            self._poll = self.widget.after(self.poll_interval, self._drain)
+
+    @property
+    def busy(self):
+        """True while tasks are running or results are waiting to be delivered."""
+        return bool(self._tasks) or not self._events.empty()
+
+    def shutdown(self):
+        """Cancel pending pool tasks; serial tasks (saves) are left to finish."""
+        for task in self._tasks:
+            if not task.future.running():
+                task.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.serial.shutdown(wait=False)
+
+
+class ChunkedLoader:
+    """Read a text file in chunks on a worker thread and deliver them to Tk.
+
+    The worker reads chunk_size bytes at a time (from a memory map when
+    use_mmap is set) and decodes them incrementally with universal newlines.
+    on_chunk(text, fraction) and on_done(error) run on the Tk thread. At most
+    max_pending chunks are in flight, so a slow widget holds the reader back
+    instead of piling decoded text up in memory. bytes_read is the number of
+    bytes delivered so far.
+    """
+
+    def __init__(self, runner, path, on_chunk, on_done, chunk_size=1 << 18,
+                 use_mmap=True, encoding="utf-8", max_pending=2):
+        self.runner = runner
+        self.path = path
+        self.on_chunk = on_chunk
+        self.on_done = on_done
+        self.chunk_size = chunk_size
+        self.use_mmap = use_mmap
+        self.encoding = encoding
+        self.task = None
+        self.bytes_read = 0
+        self._slots = threading.Semaphore(max_pending)
+
+    @property
+    def cancelled(self):
+        return self.task is not None and self.task.cancelled
+
+    def start(self):
+        """Start reading the file in the background; an error opening it reaches on_done."""
+        self.task = self.runner.submit(self._open_and_read, on_progress=self._deliver, on_done=self._done)
+
+    def _open_and_read(self, task):
+        # Opened by the worker, so a task cancelled before it runs leaves no handle behind
+        return self._read(task, open(self.path, "rb"))
+
+    def cancel(self):
+        """Stop loading; the text delivered so far is kept."""
+        if self.task is not None and not self.task.cancelled and not self.task.done:
+            self.task.cancel()
+            self._slots.release()
+            self.on_done(None)
+
+    def _read(self, task, file):
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            data_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.use_mmap and size else None
+            try:
+                decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(self.encoding)(), translate=True)
+                offset = 0
+                while True:
+                    self._slots.acquire()
+                    task.check()
+                    if data_map is not None:
+                        data = data_map[offset:offset + self.chunk_size]
+                    else:
+                        data = file.read(self.chunk_size)
+                    offset += len(data)
+                    final = not data or offset >= size
+                    task.progress((decoder.decode(data, final=final), offset, size))
+                    if final:
+                        return
+            finally:
+                if data_map is not None:
+                    data_map.close()
+
+    def _deliver(self, chunk):
+        text, offset, size = chunk
+        self.bytes_read = offset
+        if text:
+            self.on_chunk(text, offset / size if size else 1.0)
+        self._slots.release()
+
+    def _done(self, result, error):
+        self.on_done(error)
+
+
+class CsvLoader(ChunkedLoader):
+    """Parse a CSV or TSV file on a worker thread and deliver its rows to Tk.
+
+    Rows arrive in batches of batch_rows through on_chunk(rows, fraction).
+    The delimiter is a tab for .tsv and .tab files and is sniffed from the
+    start of the file otherwise.
+    """
+
+    def __init__(self, runner, path, on_chunk, on_done, batch_rows=1000, encoding="utf-8-sig", max_pending=2):
+        super().__init__(runner, path, on_chunk, on_done, encoding=encoding, max_pending=max_pending)
+        self.batch_rows = batch_rows
+
+    def _read(self, task, file):
+        size = os.fstat(file.fileno()).st_size
+        with io.TextIOWrapper(file, encoding=self.encoding, newline="") as text:
+            if self.path.lower().endswith((".tsv", ".tab")):
+                dialect = csv.excel_tab
+            else:
+                sample = text.read(1 << 16)
+                text.seek(0)
+                try:
+                    dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+                except csv.Error:
+                    dialect = csv.excel
+            reader = csv.reader(text, dialect)
+            while True:
+                self._slots.acquire()
+                task.check()
+                rows = list(islice(reader, self.batch_rows))
+                task.progress((rows, file.tell(), size))
+                if len(rows) < self.batch_rows:
+                    return
+
+
+class FileFollower:
+    """Watch a file that is being appended to and deliver the new text to Tk.
+
+    Every interval ms the Tk thread compares the file's size with the byte
+    offset read so far, and growth is read on a worker starting at that
+    offset. Text is decoded incrementally, so characters and CRLF pairs may
+    straddle reads, and reaches on_text(text) in chunks of at most
+    chunk_size bytes with at most max_pending chunks in flight. If the file
+    shrinks or is replaced, on_reset() is called and it is read again from
+    the start.
+    """
+
+    def __init__(self, runner, widget, path, offset, on_text, on_reset, interval=500,
+                 chunk_size=1 << 18, encoding="utf-8", max_pending=2):
+        self.runner = runner
+        self.widget = widget
+        self.path = path
+        self.offset = offset
+        self.on_text = on_text
+        self.on_reset = on_reset
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.max_pending = max_pending
+        self.task = None
+        self._identity = None
+        self._poll = None
+        self._slots = None
+        self._decoder = self._new_decoder()
+
+    def _new_decoder(self):
+        return io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(self.encoding)(), translate=True)
+
+    def start(self):
+        """Start polling; raises OSError if the file cannot be read."""
+        stat = os.stat(self.path)
+        self._identity = (stat.st_dev, stat.st_ino)
+        self._poll = self.widget.after(self.interval, self.poll)
+
+    def stop(self):
+        if self._poll is not None:
+            self.widget.after_cancel(self._poll)
+            self._poll = None
+        if self.task is not None and not self.task.done:
+            self.task.cancel()
+            # Wake a worker waiting for a slot so that it sees the cancellation
+            self._slots.release()
+        self.task = None
+
+    def poll(self):
+        """Start reading whatever was appended since the last read."""
+        self._poll = self.widget.after(self.interval, self.poll)
+        if self.task is not None:
+            return
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # The file may be missing for a moment while it is rotated
+            return
+        if (stat.st_dev, stat.st_ino) != self._identity or stat.st_size < self.offset:
+            self._identity = (stat.st_dev, stat.st_ino)
+            self.offset = 0
+            self._decoder = self._new_decoder()
+            self.on_reset()
+        if stat.st_size > self.offset:
+            # Each read has its own slots, so chunks dropped by a cancelled read cannot use them up
+            self._slots = threading.Semaphore(self.max_pending)
+            self.task = self.runner.submit(self._read, self.offset, self._slots,
+                                           on_progress=self._deliver, on_done=self._done)
+
+    def _read(self, task, offset, slots):
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            while True:
+                slots.acquire()
+                try:
+                    task.check()
+                    data = file.read(self.chunk_size)
+                    text = self._decoder.decode(data)
+                except BaseException:
+                    slots.release()
+                    raise
+                offset += len(data)
+                task.progress((text, offset))
+                if len(data) < self.chunk_size:
+                    return
+
+    def _deliver(self, chunk):
+        text, self.offset = chunk
+        if text:
+            self.on_text(text)
+        self._slots.release()
+
+    def _done(self, result, error):
+        # Read errors are retried at the next poll
+        self.task = None
+
+
+class MappedLines:
+    """Read-only, memory-mapped file exposed as a sequence of decoded lines.
+
+    Line start byte offsets are indexed once when the file is opened, so any
+    slice of lines is decoded straight from the map without reading the rest.
+    newline is the line ending of the first line, "\r\n" or "\n".
+    """
+
+    def __init__(self, path, encoding="utf-8"):
+        self.path = path
+        self.encoding = encoding
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.offsets = self._build_index()
+        first_end = self.offsets[1] - 1 if len(self.offsets) > 1 else 0
+        self.newline = "\r\n" if first_end and self.map[first_end - 1:first_end] == b"\r" else "\n"
+
+    def _build_index(self, chunk_size=1 << 24):
+        offsets = array("Q", [0])
+        for pos in range(0, self.size, chunk_size):
+            parts = self.map[pos:pos + chunk_size].split(b"\n")
+            starts = accumulate(map(add, map(len, parts[:-1]), repeat(1)), initial=pos)
+            next(starts)
+            offsets.extend(starts)
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def byte_range(self, start, stop):
+        """Return the byte span of lines start..stop-1, including their newlines."""
+        end = self.offsets[stop] if stop < len(self.offsets) else self.size
+        return self.offsets[start], end
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        if start >= stop:
+            return []
+        begin, end = self.byte_range(start, stop)
+        lines = self.map[begin:end].decode(self.encoding, errors="replace").split("\n")
+        if stop < len(self):
+            lines.pop()
+        return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+    def close(self):
+        if self.size:
+            self.map.close()
+        self._file.close()
+
+
+class PieceTable:
+    """Editable sequence stored as spans over an original and inserted buffers.
+
+    The original (a str, list or MappedLines) is never copied; edits only add
+    or split pieces. Pieces are kept in blocks of up to twice block_size, with
+    a Fenwick tree over the block lengths, so locating and editing a position
+    costs O(log n) plus a list operation within one block. An edit spanning
+    blocks, or one that overflows a block, rebuilds the tree in O(blocks).
+    join turns a list of buffer slices back into one value.
+    """
+
+    def __init__(self, original, join="".join, block_size=64):
+        self.join = join
+        self.block_size = block_size
+        # Only the identity is kept, so the original is freed once no piece refers to it
+        self._original_id = id(original)
+        if len(original):
+            self._build([[(original, 0, len(original))]], [len(original)])
+        else:
+            self._build([], [])
+
+    def _build(self, blocks, totals):
+        """Install blocks and the lengths they hold, rebuilding the tree in O(blocks)."""
+        self.blocks = blocks
+        self.totals = totals
+        self.lengths = FenwickTree(self.totals)
+        self._length = sum(self.totals)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def pieces(self):
+        """Iterate over all (buffer, start, length) pieces in order."""
+        return chain.from_iterable(self.blocks)
+
+    def _locate(self, pos):
+        """Return (block, index, rest): the piece holding pos and the distance into it.
+
+        block is len(self.blocks) when pos is at or beyond the end.
+        """
+        block, rest = self.lengths.search(pos)
+        if block == len(self.blocks):
+            return block, 0, 0
+        pieces = self.blocks[block]
+        i = 0
+        while rest >= pieces[i][2]:
+            rest -= pieces[i][2]
+            i += 1
+        return block, i, rest
+
+    def _split(self, pos):
+        """Return (block, index) of the piece starting at pos, splitting one if needed.
+
+        Splitting never moves pieces between blocks, so the indices of
+        earlier splits stay valid; callers rebalance oversized blocks.
+        """
+        block, i, rest = self._locate(pos)
+        if rest:
+            buf, start, length = self.blocks[block][i]
+            self.blocks[block][i:i + 1] = [(buf, start, rest), (buf, start + rest, length - rest)]
+            i += 1
+        return block, i
+
+    def _rebalance(self, block):
+        pieces = self.blocks[block]
+        halves = [pieces[k:k + self.block_size] for k in range(0, len(pieces), self.block_size)]
+        self._build(self.blocks[:block] + halves + self.blocks[block + 1:],
+                    self.totals[:block] + [sum(piece[2] for piece in half) for half in halves]
+                    + self.totals[block + 1:])
+
+    def insert(self, pos, items):
+        """Insert items (same type as the original) before position pos."""
+        if not len(items):
+            return
+        if not self.blocks:
+            self._build([[(items, 0, len(items))]], [len(items)])
+            return
+        block, i = self._split(pos)
+        if block == len(self.blocks):
+            # Appending: add to the end of the last block
+            block, i = block - 1, len(self.blocks[-1])
+        pieces = self.blocks[block]
+        if i and self._extendable(pieces[i - 1]):
+            # Typing appends to the previous insertion instead of adding a piece
+            buf, start, length = pieces[i - 1]
+            pieces[i - 1] = (buf + items, start, length + len(items))
+        elif i == 0 and block and self._extendable(self.blocks[block - 1][-1]):
+            block -= 1
+            pieces = self.blocks[block]
+            buf, start, length = pieces[-1]
+            pieces[-1] = (buf + items, start, length + len(items))
+        else:
+            pieces.insert(i, (items, 0, len(items)))
+        self.lengths.add(block, len(items))
+        self.totals[block] += len(items)
+        self._length += len(items)
+        if len(pieces) > 2 * self.block_size:
+            self._rebalance(block)
+
+    def _extendable(self, piece, limit=4096):
+        buf, start, length = piece
+        return id(buf) != self._original_id and start + length == len(buf) and len(buf) < limit
+
+    def delete(self, pos, length):
+        """Remove length items starting at pos."""
+        length = min(length, self._length - pos)
+        if length <= 0:
+            return
+        first, i = self._split(pos)
+        last, j = self._split(pos + length)
+        if first == last:
+            del self.blocks[first][i:j]
+            self.lengths.add(first, -length)
+            self.totals[first] -= length
+            self._length -= length
+            if not self.blocks[first]:
+                self._build(self.blocks[:first] + self.blocks[first + 1:],
+                            self.totals[:first] + self.totals[first + 1:])
+            elif len(self.blocks[first]) > 2 * self.block_size:
+                self._rebalance(first)
+            return
+        tail = self.blocks[last][j:] if last < len(self.blocks) else []
+        merged = self.blocks[first][:i] + tail
+        middle = [merged[k:k + self.block_size] for k in range(0, len(merged), self.block_size)]
+        self._build(self.blocks[:first] + middle + self.blocks[last + 1:],
+                    self.totals[:first] + [sum(piece[2] for piece in block) for block in middle]
+                    + self.totals[last + 1:])
+
+    def slice(self, start, stop):
+        """Return the items between start and stop as one joined value."""
+        parts = []
+        block, i, rest = self._locate(start)
+        remaining = stop - start
+        while remaining > 0 and block < len(self.blocks):
+            buf, begin, length = self.blocks[block][i]
+            take = min(length - rest, remaining)
+            parts.append(buf[begin + rest:begin + rest + take])
+            remaining -= take
+            rest = 0
+            i += 1
+            if i == len(self.blocks[block]):
+                block, i = block + 1, 0
+        return self.join(parts)
+
+    def chunks(self):
+        """Yield the contents piece by piece, without joining them."""
+        for buf, start, length in self.pieces:
+            yield buf[start:start + length]
+
+    def copy(self):
+        """Return a snapshot that shares all buffers with this table.
+
+        The block lists are copied, so this costs O(pieces) list copying but
+        never copies text.
+        """
+        snapshot = PieceTable.__new__(PieceTable)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.blocks = [list(block) for block in self.blocks]
+        snapshot.totals = list(self.totals)
+        snapshot.lengths = FenwickTree.__new__(FenwickTree)
+        snapshot.lengths.tree = list(self.lengths.tree)
+        return snapshot
+
+
+def join_lines(parts):
+    return list(chain.from_iterable(parts))
+
+
+class LargeFileView:
+    """Sliding window of lines over a memory-mapped file with a piece-table overlay.
+
+    Only window_lines lines are ever handed to the text widget. Edited windows
+    are committed back into the overlay, and write() streams the merged result.
+    """
+
+    def __init__(self, path, window_lines=2000):
+        self.source = MappedLines(path)
+        self.lines = PieceTable(self.source, join=join_lines)
+        self.window_lines = window_lines
+        self.start = 0
+        self.count = 0
+        self.dirty = False
+        self.loading = False
+        self.saving = False
+
+    @property
+    def total(self):
+        return len(self.lines)
+
+    def window(self, start):
+        """Return the lines of the window beginning near start."""
+        self.start = max(0, min(start, self.total - self.window_lines))
+        lines = self.lines.slice(self.start, self.start + self.window_lines)
+        self.count = len(lines)
+        return lines
+
+    def commit(self, lines):
+        """Replace the current window in the overlay with the edited lines."""
+        self.lines.delete(self.start, self.count)
+        self.lines.insert(self.start, lines)
+        self.count = len(lines)
+        self.dirty = False
+
+    def write(self, file, chunk_size=1 << 22):
+        """Stream the merged document to a binary file object.
+
+        Edited lines are written with the line ending of the source file.
+        """
+        source = self.source
+        newline = source.newline.encode(source.encoding)
+        for buf, start, length in self.lines.pieces:
+            if buf is source:
+                begin, end = source.byte_range(start, start + length)
+                for pos in range(begin, end, chunk_size):
+                    file.write(source.map[pos:min(end, pos + chunk_size)])
+                if start + length == len(source):
+                    file.write(newline)
+            else:
+                for i in range(start, start + length, 10000):
+                    chunk = buf[i:min(i + 10000, start + length)]
+                    file.write("".join(line + source.newline for line in chunk).encode(source.encoding))
+        # Every line was written with a newline; the last one has none
+        if file.tell():
+            file.truncate(file.tell() - len(newline))
+
+    def close(self):
+        self.source.close()
+
+
+class TextDocument:
+    """Document text held in a piece table, independent of any Tk widget.
+
+    Edits are addressed either by character offset or by (line, col) position
+    as reported in TextEdit events; per-line statistics are kept in step from
+    the model itself, so nothing has to be read back from the view.
+    """
+
+    def __init__(self, text=""):
+        self.reset(text)
+
+    def reset(self, text):
+        """Replace the whole document."""
+        self.version = getattr(self, "version", 0) + 1
+        self.text = PieceTable(text)
+        self.stats = DocumentStats()
+        self.stats.reset(text)
+
+    def __len__(self):
+        return len(self.text)
+
+    def offset(self, line, col):
+        """Convert a 1-based line and 0-based column to a character offset."""
+        return self.stats.line_index.start(line - 1) + col
+
+    def position(self, offset):
+        """Convert a character offset to a 1-based line and 0-based column."""
+        line, col = self.stats.line_index.position(offset)
+        return line + 1, col
+
+    def line_starts(self, first, last):
+        """Return the start offsets of lines first..last+1 (1-based)."""
+        return list(accumulate((chars + 1 for chars in self.stats.line_index.lengths(first - 1, last)),
+                               initial=self.offset(first, 0)))
+
+    def line(self, line):
+        """Return the text of a 1-based line."""
+        start = self.offset(line, 0)
+        return self.get(start, start + self.stats.line_index.length(line - 1))
+
+    def get(self, start=0, end=None):
+        """Return the text between two character offsets."""
+        return self.text.slice(start, len(self.text) if end is None else end)
+
+    def get_text(self):
+        return self.get()
+
+    def snapshot(self):
+        """Return a frozen copy of the text that later edits will not change."""
+        return self.text.copy()
+
+    def insert(self, line, col, text):
+        """Insert text at (line, col)."""
+        if not text:
+            return
+        start = self.offset(line, col)
+        line_start = start - col
+        old = self.text.slice(line_start, line_start + self.stats.line_index.length(line - 1))
+        self.text.insert(start, text)
+        self.stats.replace_lines(line, line, (old[:col] + text + old[col:]).split("\n"))
+
+    def delete(self, start, end):
+        """Delete the text between two (line, col) positions."""
+        first = self.offset(*start)
+        last = self.offset(*end)
+        if last <= first:
+            return
+        head = self.text.slice(first - start[1], first)
+        tail = self.text.slice(last, last - end[1] + self.stats.line_index.length(end[0] - 1))
+        self.text.delete(first, last - first)
+        self.stats.replace_lines(start[0], end[0], [head + tail])
+
+    def apply(self, edit):
+        """Apply an insert or delete TextEdit."""
+        self.version += 1
+        if edit.kind == "insert":
+            self.insert(edit.start[0], edit.start[1], edit.text)
+        elif edit.kind == "delete":
+            self.delete(edit.start, edit.end)
+
+
+# Permission bits removed from new files; reading the umask means setting it, so do it once at import
+FILE_UMASK = os.umask(0o022)
+os.umask(FILE_UMASK)
+
+
+def create_temp_file(path):
+    """Create a temporary file next to path and return (fd, temp_path).
+
+    The file gets the permissions of path, or those a new file would get
+    under the umask when path does not exist yet.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".", suffix=".tmp")
+    try:
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, 0o666 & ~FILE_UMASK)
+    except BaseException:
+        os.close(fd)
+        os.remove(temp_path)
+        raise
+    return fd, temp_path
+
+
+def replace_file(temp_path, path):
+    """Rename temp_path over path and fsync the directory so the rename survives a crash."""
+    os.replace(temp_path, path)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # directories cannot be opened on Windows
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, chunks, encoding="utf-8"):
+    """Write chunks to a temporary file next to path, fsync it and rename it over path.
+
+    Chunks are text, or bytes when encoding is None.
+    """
+    fd, temp_path = create_temp_file(path)
+    try:
+        with open(fd, "wb" if encoding is None else "w", encoding=encoding) as file:
+            for chunk in chunks:
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        replace_file(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class SearchEngine:
+    """Find every match of a pattern in a text and keep them as sorted offsets."""
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.current = -1
+
+    def __len__(self):
+        return len(self.starts)
+
+    @staticmethod
+    def compile(term, regex=False, match_case=False, whole_word=False):
+        """Build a pattern from the find options; raises re.error for a bad regex."""
+        pattern = term if regex else re.escape(term)
+        if whole_word:
+            pattern = rf"\b(?:{pattern})\b"
+        return re.compile(pattern, 0 if match_case else re.IGNORECASE)
+
+    @staticmethod
+    def find_spans(text, pattern):
+        """Return arrays of the start and end offsets of all non-empty matches."""
+        spans = [match.span() for match in pattern.finditer(text) if match.end() > match.start()]
+        return array("q", (span[0] for span in spans)), array("q", (span[1] for span in spans))
+
+    def set_matches(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+        self.current = -1
+
+    def find_all(self, text, pattern):
+        """Replace the match list with all non-empty matches of pattern in text."""
+        self.set_matches(*self.find_spans(text, pattern))
+
+    @staticmethod
+    def replace_all(text, pattern, replacement, regex=False, keep=OBJECT_CHAR):
+        """Rewrite every non-empty match, grouping nearby matches into segments.
+
+        Returns a list of (start, end, new_text, matches) segments in text
+        order: replacing text[start:end] with new_text applies the
+        replacements of matches, a list of (match start, match end,
+        replacement length). Text between two matches that contains keep
+        (embedded tables and images) is never part of a segment. With regex
+        set, the replacement may refer to groups as in re.sub.
+        """
+        segments = []
+        parts = matches = None
+        last = None
+        for match in pattern.finditer(text):
+            if match.end() == match.start():
+                continue
+            if matches is not None and keep in text[last:match.start()]:
+                segments.append((matches[0][0], last, "".join(parts), matches))
+                matches = None
+            if matches is None:
+                parts, matches = [], []
+            else:
+                parts.append(text[last:match.start()])
+            new_text = match.expand(replacement) if regex else replacement
+            parts.append(new_text)
+            matches.append((match.start(), match.end(), len(new_text)))
+            last = match.end()
+        if matches is not None:
+            segments.append((matches[0][0], last, "".join(parts), matches))
+        return segments
+
+    @staticmethod
+    def offset_map(matches):
+        """Return shift(offset, after=False) mapping offsets of the original text past the replaced matches.
+
+        An offset inside a match moves to the start of its replacement, or to
+        its end when after is set.
+        """
+        ends = [end for start, end, length in matches]
+        deltas = list(accumulate((length - (end - start) for start, end, length in matches), initial=0))
+
+        def shift(offset, after=False):
+            i = bisect_right(ends, offset)
+            if i < len(matches) and matches[i][0] < offset:
+                return matches[i][0] + deltas[i] + (matches[i][2] if after else 0)
+            return offset + deltas[i]
+
+        return shift
+
+    def clear(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.current = -1
+
+    def between(self, lo, hi):
+        """Return the range of match indices that start within [lo, hi)."""
+        return range(bisect_right(self.starts, lo - 1), bisect_right(self.starts, hi - 1))
+
+    def next(self, offset):
+        """Select and return the index of the first match starting at or after offset."""
+        if self.starts:
+            self.current = bisect_right(self.starts, offset - 1) % len(self.starts)
+        return self.current
+
+    def previous(self, offset):
+        """Select and return the index of the last match starting before offset."""
+        if self.starts:
+            self.current = (bisect_right(self.starts, offset - 1) - 1) % len(self.starts)
+        return self.current
+
+
+# Native ProWrite document: magic, a compression flag byte, then a JSON body
+DOCUMENT_MAGIC = b"PWD1"
+DOCUMENT_EXTENSION = ".pwd"
+
+
+def pack_document(content, compress=True):
+    """Serialize a document dictionary to the native container format.
+
+    content holds "text", "styles" (TextStyle fields), "runs" as
+    [style index or -1, length] pairs covering the text, "tags" mapping
+    other tag names to flat [start, length, ...] offset lists, "tag_config"
+    and "shapes" as [type, coords, options] canvas items.
+    """
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if compress:
+        return DOCUMENT_MAGIC + b"\x01" + zlib.compress(body, 6)
+    return DOCUMENT_MAGIC + b"\x00" + body
+
+
+def unpack_document(data):
+    """Parse bytes written by pack_document; raises ValueError if they are not a document."""
+    if data[:4] != DOCUMENT_MAGIC:
+        raise ValueError("Not a ProWrite document")
+    body = data[5:]
+    if data[4:5] == b"\x01":
+        body = zlib.decompress(body)
+    return json.loads(body.decode("utf-8"))
+
+
+def read_text_file(path):
+    """Return the plain text of a file, unpacking native documents."""
+    if path.lower().endswith(DOCUMENT_EXTENSION):
+        with open(path, "rb") as file:
+            return unpack_document(file.read())["text"]
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def merge_ranges(ranges):
+    """Sort (start, end) ranges and merge the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        elif start < end:
+            merged.append([start, end])
+    return merged
+
+
+def parse_index(index):
+    """Return a numeric "line.col" index as a (line, col) tuple."""
+    if isinstance(index, tuple):
+        return index
+    line, col = index.split(".")
+    return (int(line), int(col))
+
+
+class TagBatch:
+    """Collect tag additions and removals, then apply each tag with a single Tcl call.
+
+    Ranges are given as numeric "line.col" indices or (line, col) tuples and
+    are merged before flushing, so overlapping and adjacent ranges become one
+    pair. Removals are flushed before additions. Usable as a context manager
+    that flushes on exit.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+        self._add = {}
+        self._remove = {}
+
+    def add(self, tag, start, end):
+        self._add.setdefault(tag, []).append((parse_index(start), parse_index(end)))
+
+    def remove(self, tag, start, end):
+        self._remove.setdefault(tag, []).append((parse_index(start), parse_index(end)))
+
+    def flush(self):
+        """Apply the collected operations with one tag remove/add command per tag."""
+        for operations, command in ((self._remove, "remove"), (self._add, "add")):
+            for tag, ranges in operations.items():
+                indices = []
+                for start, end in merge_ranges(ranges):
+                    indices += ("%d.%d" % start, "%d.%d" % end)
+                if indices:
+                    self.text.tk.call(self.text._w, "tag", command, tag, *indices)
+                    self.calls += 1
+            operations.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+HIGHLIGHT_CONFIG = os.path.join(os.path.expanduser("~"), ".prowrite", "highlight.json")
+
+# Foreground colours of the highlighting tags; a language may override them with "colors"
+HIGHLIGHT_COLORS = {
+    "comment": "#6a737d", "string": "#032f62", "number": "#005cc5", "keyword": "#d73a49",
+    "key": "#6f42c1", "section": "#e36209", "tag": "#22863a", "timestamp": "#6a737d",
+    "error": "#cb2431", "warning": "#b08800", "info": "#22863a",
+}
+
+# Built-in file types. Each rule is [tag, pattern], or [tag, start, end] for a
+# region that may span lines. Patterns must not use numbered backreferences.
+HIGHLIGHT_LANGUAGES = {
+    "Log": {
+        "extensions": [".log", ".out"],
+        "rules": [
+            ["timestamp", r"\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:[.,]\d+)?(?:Z|[+-]\d\d:?\d\d)?"],
+            ["error", r"\b(?:ERROR|FATAL|CRITICAL|SEVERE|Traceback)\b"],
+            ["warning", r"\bWARN(?:ING)?\b"],
+            ["info", r"\b(?:INFO|DEBUG|TRACE|NOTICE)\b"],
+            ["string", r'"[^"]*"'],
+            ["number", r"\b\d+(?:\.\d+)?\b"],
+        ],
+    },
+    "INI / Config": {
+        "extensions": [".ini", ".cfg", ".conf", ".properties", ".toml", ".env"],
+        "rules": [
+            ["comment", r"^\s*[#;].*"],
+            ["section", r"^\s*\[[^\]]*\]"],
+            ["key", r"^\s*[\w.\-]+(?=\s*[=:])"],
+            ["string", r'"""', r'"""'],
+            ["string", r'"(?:[^"\\]|\\.)*"|\'[^\']*\''],
+            ["keyword", r"\b(?:true|false|yes|no|on|off)\b"],
+            ["number", r"\b\d+(?:\.\d+)?\b"],
+        ],
+    },
+    "YAML": {
+        "extensions": [".yaml", ".yml"],
+        "rules": [
+            ["comment", r"(?:^|\s)#.*"],
+            ["key", r"^\s*(?:- )?[\w.\-]+(?=:(?:\s|$))"],
+            ["string", r'"(?:[^"\\]|\\.)*"|\'[^\']*\''],
+            ["keyword", r"\b(?:true|false|null|yes|no)\b"],
+            ["number", r"\b\d+(?:\.\d+)?\b"],
+        ],
+    },
+    "JSON": {
+        "extensions": [".json"],
+        "rules": [
+            ["key", r'"(?:[^"\\]|\\.)*"(?=\s*:)'],
+            ["string", r'"(?:[^"\\]|\\.)*"'],
+            ["keyword", r"\b(?:true|false|null)\b"],
+            ["number", r"-?\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b"],
+        ],
+    },
+    "XML": {
+        "extensions": [".xml", ".html", ".htm", ".svg", ".xsd"],
+        "rules": [
+            ["comment", r"<!--", r"-->"],
+            ["tag", r"</?[\w:.\-]+|/?>"],
+            ["key", r"[\w:.\-]+(?==)"],
+            ["string", r'"[^"]*"'],
+        ],
+    },
+}
+
+
+def load_highlight_languages(path=HIGHLIGHT_CONFIG):
+    """Return the built-in languages, updated with those defined in the JSON file at path.
+
+    Raises ValueError if the file exists but cannot be parsed.
+    """
+    languages = dict(HIGHLIGHT_LANGUAGES)
+    try:
+        with open(path, encoding="utf-8") as file:
+            languages.update(json.load(file))
+    except FileNotFoundError:
+        pass
+    return languages
+
+
+def language_for(path, languages):
+    """Return the name of the language whose extensions match path, or None."""
+    extension = os.path.splitext(path)[1].lower()
+    for name, language in languages.items():
+        if extension in language.get("extensions", ()):
+            return name
+    return None
+
+
+class SyntaxHighlighter:
+    """Regex lexer that keeps the spans and start state of every line.
+
+    The state at the start of a line is 0, or k + 1 inside the region opened
+    by rule k, so any line can be lexed again on its own. Spans are stored
+    per line as a flat (rule, start, end, ...) tuple of columns. Lines before
+    valid are up to date; states has one entry more than there are lines.
+    """
+
+    def __init__(self, rules):
+        self.tags = [rule[0] for rule in rules]
+        self.ends = [re.compile(rule[2]) if len(rule) > 2 else None for rule in rules]
+        self.pattern = re.compile("|".join(f"(?P<r{i}>{rule[1]})" for i, rule in enumerate(rules)) or "(?!)")
+        # Rule index by capturing group number, for match.lastindex
+        self.group_rules = {index: int(name[1:]) for name, index in self.pattern.groupindex.items()
+                            if name[0] == "r" and name[1:].isdigit()}
+        self.reset(1)
+
+    def reset(self, lines):
+        """Forget all results for a document of the given number of lines."""
+        self.states = [0] * (lines + 1)
+        self.spans = [()] * lines
+        self.valid = 0
+
+    def lex_line(self, line, state=0):
+        """Return the spans of line, entered in state, and the state at its end."""
+        spans = []
+        pos = start = 0
+        while True:
+            if state:
+                match = self.ends[state - 1].search(line, pos)
+                if match is None:
+                    if len(line) > start:
+                        spans += (state - 1, start, len(line))
+                    return tuple(spans), state
+                spans += (state - 1, start, match.end())
+                pos = max(match.end(), pos)
+                state = 0
+            for match in self.pattern.finditer(line, pos):
+                start, end = match.span()
+                if end == start:
+                    continue
+                rule = self.group_rules[match.lastindex]
+                if self.ends[rule] is None:
+                    spans += (rule, start, end)
+                else:
+                    state = rule + 1
+                    pos = end
+                    break
+            else:
+                return tuple(spans), 0
+
+    def lex_batches(self, task, text, first, state, batch_lines=2000):
+        """Lex text, entered at line first in state, off the Tk thread.
+
+        Each batch is reported through task.progress as (first line, spans,
+        end states) for up to batch_lines lines.
+        """
+        lines = text.split("\n")
+        for i in range(0, len(lines), batch_lines):
+            task.check()
+            spans = []
+            ends = []
+            for line in lines[i:i + batch_lines]:
+                line_spans, state = self.lex_line(line, state)
+                spans.append(line_spans)
+                ends.append(state)
+            task.progress((first + i, spans, ends))
+
+    def apply_batch(self, first, spans, ends):
+        """Store a batch from lex_batches if it continues the lexed lines; return whether it did."""
+        if first != self.valid:
+            return False
+        count = min(len(spans), len(self.spans) - first)
+        self.spans[first:first + count] = spans[:count]
+        self.states[first + 1:first + count + 1] = ends[:count]
+        self.valid = first + count
+        return True
+
+    def edit(self, first, removed, added, line_text, budget=500):
+        """Replace removed lines from first (0-based) with added lines and lex them again.
+
+        line_text(i) returns the current text of line i. At most budget
+        lines are lexed here. Returns True when unlexed lines were touched,
+        so a background pass has to (re)start from valid.
+        """
+        self.spans[first:first + removed] = [()] * added
+        self.states[first + 1:first + removed] = [0] * (added - 1)
+        if first >= self.valid:
+            return True
+        if self.valid < first + removed:
+            self.valid = first
+            return True
+        self.valid += added - removed
+        return self.relex(first, first + added, line_text, budget)
+
+    def relex(self, first, stop, line_text, budget=500):
+        """Lex lines from first until past stop and back in step with the stored states.
+
+        Returns True when the change spilled over into the unlexed lines.
+        """
+        state = self.states[first]
+        for i in range(first, self.valid):
+            if i >= stop and state == self.states[i]:
+                return False
+            if i - first >= budget:
+                self.valid = i
+                self.states[i] = state
+                return True
+            self.states[i] = state
+            self.spans[i], state = self.lex_line(line_text(i), state)
+        changed = self.states[self.valid] != state
+        self.states[self.valid] = state
+        return changed and self.valid < len(self.spans)
+
+
+TextStyle = namedtuple("TextStyle", "family size weight slant underline color")
+
+
+class StyleRegistry:
+    """Cache of fonts and text tags, one per distinct character style.
+
+    Each TextStyle gets one tkinter Font and one tag, shared by every run of
+    text in that style, so combined styles (bold italic, coloured underline)
+    are simply other entries. At most max_styles tags are kept; when the
+    registry is full, the least recently used style no longer applied to any
+    text is evicted. Text widgets share the registry's tags through attach().
+    """
+
+    def __init__(self, root, max_styles=256):
+        self.root = root
+        self.texts = []
+        self.max_styles = max_styles
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._styles = OrderedDict()
+        self._keys = {}
+        self._fonts = {}
+        self._base = {}
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._styles)
+
+    def attach(self, text):
+        """Share the registry's tags with another text widget."""
+        self.texts.append(text)
+        for style, tag in self._styles.items():
+            text.tag_configure(tag, font=self._fonts[tag], foreground=style.color or "")
+
+    def detach(self, text):
+        self.texts.remove(text)
+
+    def base_style(self, text):
+        """Return the style of untagged text, derived from the widget font."""
+        spec = text.cget("font")
+        style = self._base.get(spec)
+        if style is None:
+            actual = font.Font(root=self.root, font=spec).actual()
+            style = TextStyle(actual["family"], actual["size"], actual["weight"],
+                              actual["slant"], bool(actual["underline"]), None)
+            self._base[spec] = style
+        return style
+
+    def tag_for(self, style):
+        """Return the tag for style, creating its font and tag on first use."""
+        tag = self._styles.get(style)
+        if tag is not None:
+            self._styles.move_to_end(style)
+            self.hits += 1
+            return tag
+        self.misses += 1
+        self._evict()
+        self._counter += 1
+        tag = f"style{self._counter}"
+        style_font = font.Font(root=self.root, family=style.family, size=style.size, weight=style.weight,
+                               slant=style.slant, underline=style.underline)
+        for text in self.texts:
+            text.tag_configure(tag, font=style_font, foreground=style.color or "")
+        self._fonts[tag] = style_font
+        self._styles[style] = tag
+        self._keys[tag] = style
+        return tag
+
+    def style_of(self, tag):
+        """Return the style behind a registry tag, or None for other tags."""
+        return self._keys.get(tag)
+
+    def style_at(self, text, index):
+        """Return the style of the character at index in text."""
+        for tag in text.tag_names(index):
+            if tag in self._keys:
+                return self._keys[tag]
+        return self.base_style(text)
+
+    def _evict(self):
+        if len(self._styles) < self.max_styles:
+            return
+        for style, tag in self._styles.items():
+            if not any(text.tag_ranges(tag) for text in self.texts):
+                del self._styles[style]
+                del self._keys[tag]
+                del self._fonts[tag]
+                for text in self.texts:
+                    text.tag_delete(tag)
+                self.evictions += 1
+                return
+
+    def runs(self, text, start, end):
+        """Yield (start, end, tag) runs of uniform style between two indices of text."""
+        start = text.index(start)
+        end = text.index(end)
+        current = next((tag for tag in text.tag_names(start) if tag in self._keys), None)
+        pos = start
+        for kind, tag, index in text.dump(start, end, tag=True):
+            if tag not in self._keys:
+                continue
+            if index != pos:
+                yield pos, index, current
+                pos = index
+            current = tag if kind == "tagon" else None
+        if text.compare(pos, "<", end):
+            yield pos, end, current
+
+    def restyle(self, text, start, end, **changes):
+        """Change style attributes over a range of text, keeping each run's other attributes."""
+        with TagBatch(text) as batch:
+            for run_start, run_end, tag in list(self.runs(text, start, end)):
+                style = self._keys[tag] if tag else self.base_style(text)
+                if tag:
+                    batch.remove(tag, run_start, run_end)
+                batch.add(self.tag_for(style._replace(**changes)), run_start, run_end)
+
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".prowrite", "journal")
+
+
+def coalesce_edit(ops, op):
+    """Append a journal operation to ops, merging it into the last one when possible."""
+    last = ops[-1] if ops else None
+    if op[0] == "s":
+        ops[:] = [op]
+    elif last is None or last[0] == "s":
+        ops.append(op)
+    elif op[0] == "i" and last[0] == "i" and last[1] + len(last[2]) == op[1]:
+        last[2] += op[2]
+    elif op[0] == "d" and last[0] == "i" and last[1] <= op[1] and op[1] + op[2] == last[1] + len(last[2]):
+        last[2] = last[2][:op[1] - last[1]]
+        if not last[2]:
+            ops.pop()
+    elif op[0] == "d" and last[0] == "d" and op[1] + op[2] == last[1]:
+        last[1] = op[1]
+        last[2] += op[2]
+    elif op[0] == "d" and last[0] == "d" and op[1] == last[1]:
+        last[2] += op[2]
+    else:
+        ops.append(op)
+
+
+def process_alive(pid):
+    """Return whether a process with the given id is running."""
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; ask for its exit code instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class EditJournal:
+    """Crash-recovery log of edits, appended in batches by a single-worker executor.
+
+    The journal file starts with a JSON header naming the base file (None for
+    an untitled document), followed by one JSON operation per line:
+    ["i", offset, text], ["d", offset, length] or ["s", text] for a full
+    snapshot. Replaying the operations over the base file reproduces the
+    unsaved document. Edits are coalesced in memory and written by flush(), so
+    the cost of a flush follows the edit rate, not the document size. File
+    names start with the id of the writing process (see owner_alive()).
+    """
+
+    def __init__(self, path, executor=None, compact_size=1 << 20, compact_factor=2):
+        self.path = path
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="EditJournal")
+        self.compact_size = compact_size
+        self.compact_factor = compact_factor
+        self.compacted_size = 0
+        self.pending = []
+        self.batches = 0
+        self.bytes_written = 0
+
+    def record_insert(self, offset, text):
+        coalesce_edit(self.pending, ["i", offset, text])
+
+    def record_delete(self, offset, length):
+        coalesce_edit(self.pending, ["d", offset, length])
+
+    def record_snapshot(self, text):
+        coalesce_edit(self.pending, ["s", text])
+
+    def reset(self, base_path, text=None):
+        """Start a fresh journal whose edits apply on top of base_path.
+
+        Pass the document text when base_path does not hold it character for
+        character (a plain text save with tables expanded); the journal then
+        starts from a snapshot of it instead.
+        """
+        self.pending = []
+        self._submit(self._write_header, base_path)
+        if text is not None:
+            self.record_snapshot(text)
+
+    def flush(self):
+        """Hand the edits recorded since the last flush to the writer thread."""
+        if self.pending:
+            lines = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in self.pending)
+            self.pending = []
+            self._submit(self._append, lines)
+
+    def discard(self):
+        """Forget pending edits and remove the journal file."""
+        self.pending = []
+        self._submit(self._remove)
+
+    def _submit(self, job, *args):
+        self.executor.submit(self._run, job, args)
+
+    @staticmethod
+    def _run(job, args):
+        try:
+            job(*args)
+        except OSError:
+            pass
+
+    def _write_header(self, base_path):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"path": base_path}) + "\n")
+        self.compacted_size = 0
+
+    def _append(self, lines):
+        if not os.path.exists(self.path):
+            self._write_header(None)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+            size = file.tell()
+        self.batches += 1
+        self.bytes_written += len(lines)
+        # Compact only once the file has grown by compact_factor since the last compaction,
+        # so journals whose operations do not merge are not rewritten on every flush
+        if size > max(self.compact_size, self.compacted_size * self.compact_factor):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the journal with adjacent operations merged."""
+        header, ops = self.read(self.path)
+        merged = []
+        for op in ops:
+            coalesce_edit(merged, op)
+        lines = [json.dumps(header) + "\n"]
+        lines.extend(json.dumps(op, ensure_ascii=False) + "\n" for op in merged)
+        write_atomic(self.path, lines)
+        self.compacted_size = os.path.getsize(self.path)
+
+    def _remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def owner_alive(path):
+        """Return whether the process that named the journal file is still running."""
+        pid = os.path.basename(path).split("-", 1)[0]
+        return pid.isdigit() and process_alive(int(pid))
+
+    @staticmethod
+    def read(path):
+        """Return the (header, operations) stored in a journal file."""
+        with open(path, encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            ops = []
+            for line in file:
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    break  # torn write at the end of a crashed session
+        return header, ops
+
+    @staticmethod
+    def replay(base_text, ops):
+        """Apply journal operations to base_text and return the result."""
+        text = PieceTable(base_text)
+        for op in ops:
+            if op[0] == "s":
+                text = PieceTable(op[1])
+            elif op[0] == "i":
+                text.insert(op[1], op[2])
+            elif op[0] == "d":
+                text.delete(op[1], op[2])
+        return text.slice(0, len(text))
+
+
+def undo_op_size(op):
+    """Estimate the memory held by an undo operation, in bytes."""
+    size = sys.getsizeof(op)
+    for value in op[1:]:
+        if isinstance(value, str):
+            size += sys.getsizeof(value)
+        elif isinstance(value, (list, tuple)):
+            size += sys.getsizeof(value) + 64 * len(value)
+        elif hasattr(value, "coords"):
+            size += 200 + 24 * len(value.coords)
+    return size
+
+
+def merge_typing(last, op):
+    """Merge a one-character text operation into the previous one if it continues it.
+
+    Typing and deleting run together until the edit jumps elsewhere or a
+    new word starts after whitespace. Returns True when op was merged.
+    """
+    kind, start, text, objects, tags = op
+    if kind != last[0] or len(text) != 1 or objects or tags or last[3] or last[4]:
+        return False
+    if kind == "insert":
+        if start != text_end_position(last[1], last[2]) or (last[2][-1].isspace() and not text.isspace()):
+            return False
+        last[2] += text
+    elif text_end_position(start, text) == last[1]:
+        last[1] = start
+        last[2] = text + last[2]
+    elif start == last[1]:
+        last[2] += text
+    else:
+        return False
+    return True
+
+
+class UndoManager:
+    """Application undo history of grouped operations with a memory cap.
+
+    Operations are lists whose first item names their kind; apply(op, undo)
+    performs one in either direction. Everything recorded while handling one
+    Tk event forms a group, closed at the next idle moment, and consecutive
+    keystrokes are merged into word-sized operations. Once the estimated
+    size of the history exceeds max_bytes the oldest groups are dropped.
+    """
+
+    def __init__(self, widget, apply, max_bytes=32 << 20):
+        self.widget = widget
+        self.apply = apply
+        self.max_bytes = max_bytes
+        self.recording = True
+        self.applying = False
+        self.memory = 0
+        self.evicted = 0
+        self._undo = deque()
+        self._redo = []
+        self._open = None
+        self._seal = None
+
+    @property
+    def accepting(self):
+        """True when recorded operations are kept."""
+        return self.recording and not self.applying
+
+    @property
+    def redo_steps(self):
+        return len(self._redo)
+
+    def __len__(self):
+        return len(self._undo)
+
+    def record(self, op):
+        if not self.accepting:
+            return
+        for group in self._redo:
+            self.memory -= group[1]
+        self._redo.clear()
+        if self._open is None:
+            last = self._undo[-1] if self._undo else None
+            if last and len(last[0]) == 1 and last[0][0][0] in ("insert", "delete") and \
+                    op[0] in ("insert", "delete") and merge_typing(last[0][0], op):
+                size = undo_op_size(last[0][0])
+                self.memory += size - last[1]
+                last[1] = size
+                return
+            self._open = [[], 0]
+            self._undo.append(self._open)
+            self._seal = self.widget.after_idle(self._close)
+        size = undo_op_size(op)
+        self._open[0].append(op)
+        self._open[1] += size
+        self.memory += size
+        self._evict()
+
+    def _close(self):
+        self._open = None
+        self._seal = None
+
+    def _evict(self):
+        keep = 1 if self._open is not None else 0
+        while self.memory > self.max_bytes and len(self._undo) > keep:
+            self.memory -= self._undo.popleft()[1]
+            self.evicted += 1
+
+    def undo(self):
+        """Revert the most recent group; returns False when there is nothing to undo."""
+        if not self._undo:
+            return False
+        self.close()
+        group = self._undo.pop()
+        self._run(group, True)
+        self._redo.append(group)
+        return True
+
+    def redo(self):
+        if not self._redo:
+            return False
+        self.close()
+        group = self._redo.pop()
+        self._run(group, False)
+        self._undo.append(group)
+        return True
+
+    def _run(self, group, undo):
+        self.applying = True
+        try:
+            for op in reversed(group[0]) if undo else group[0]:
+                self.apply(op, undo)
+        finally:
+            self.applying = False
+
+    def close(self):
+        """End the open group so the next operation starts a new one."""
+        if self._seal is not None:
+            self.widget.after_cancel(self._seal)
+        self._close()
+
+    def clear(self):
+        self.close()
+        self._undo.clear()
+        self._redo.clear()
+        self.memory = 0
+
+
+class TableModel:
+    """Cell text of a rows x columns table, with optional per-cell shading."""
+
+    def __init__(self, rows, cols):
+        self.cells = [[""] * cols for _ in range(rows)]
+        self.shading = {}
+
+    @property
+    def rows(self):
+        return len(self.cells)
+
+    @property
+    def cols(self):
+        return len(self.cells[0]) if self.cells else 0
+
+    def insert_row(self, index):
+        self.cells.insert(index, [""] * self.cols)
+        self.shading = {(r + (r >= index), c): color for (r, c), color in self.shading.items()}
+
+    def insert_column(self, index):
+        for row in self.cells:
+            row.insert(index, "")
+        self.shading = {(r, c + (c >= index)): color for (r, c), color in self.shading.items()}
+
+    def sort_rows(self, col, reverse=False):
+        """Sort the rows by column col, numbers before text and in numeric order; shading moves with its row."""
+        def key(row):
+            text = self.cells[row][col]
+            try:
+                return (0, float(text), "")
+            except ValueError:
+                return (1, 0.0, text.casefold())
+
+        order = sorted(range(self.rows), key=key, reverse=reverse)
+        position = {old: new for new, old in enumerate(order)}
+        self.cells = [self.cells[row] for row in order]
+        self.shading = {(position[r], c): color for (r, c), color in self.shading.items()}
+
+    def append_rows(self, rows):
+        """Append rows of cell text, padding short rows and widening the table for long ones."""
+        width = max(map(len, rows), default=0)
+        if width > self.cols:
+            for row in self.cells:
+                row.extend([""] * (width - len(row)))
+        width = max(width, self.cols)
+        self.cells.extend(row + [""] * (width - len(row)) if len(row) < width else row for row in rows)
+
+    def to_text(self):
+        """Return the table as tab-separated lines."""
+        return "\n".join("\t".join(row) for row in self.cells)
+
+    def to_dict(self):
+        return {"cells": self.cells, "shading": [[r, c, color] for (r, c), color in self.shading.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(0, 0)
+        model.cells = [list(row) for row in data["cells"]]
+        model.shading = {(r, c): color for r, c, color in data.get("shading", [])}
+        return model
+
+
+class TableView(ttk.Frame):
+    """Canvas view of a TableModel, embedded in the text widget as a window.
+
+    Only the rows inside the canvas viewport, plus overscan rows, have canvas
+    items; the rest are drawn as they scroll into view. Double-click edits a
+    cell in place, right-click offers row and column insertion and sorting.
+    """
+
+    def __init__(self, master, model, on_select=None, col_width=110, row_height=24,
+                 max_height=360, overscan=5):
+        super().__init__(master)
+        self.model = model
+        self.on_select = on_select
+        self.col_width = col_width
+        self.row_height = row_height
+        self.max_height = max_height
+        self.overscan = overscan
+        self.selected = None
+        self._rows = {}
+        self._editor = None
+
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0, yscrollincrement=row_height)
+        self.canvas.pack(side="left", fill="both")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._yview)
+        self.canvas.config(yscrollcommand=self._on_scroll)
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-Button-1>", self._on_double_click)
+        self.canvas.bind("<Button-3>", self._on_context_menu)
+        self.canvas.bind("<MouseWheel>", lambda e: self._yview("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self._yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self._yview("scroll", 1, "units"))
+
+        self.menu = tk.Menu(self, tearoff=0)
+        self.menu.add_command(label="Insert Row Above", command=lambda: self.insert_row(0))
+        self.menu.add_command(label="Insert Row Below", command=lambda: self.insert_row(1))
+        self.menu.add_command(label="Insert Column Left", command=lambda: self.insert_column(0))
+        self.menu.add_command(label="Insert Column Right", command=lambda: self.insert_column(1))
+        self.menu.add_separator()
+        self.menu.add_command(label="Sort Ascending", command=lambda: self.sort_rows(False))
+        self.menu.add_command(label="Sort Descending", command=lambda: self.sort_rows(True))
+        self.relayout()
+
+    def relayout(self):
+        """Resize the canvas to the model and redraw the visible rows."""
+        width = self.model.cols * self.col_width + 1
+        height = self.model.rows * self.row_height + 1
+        self.canvas.config(width=width, height=min(height, self.max_height), scrollregion=(0, 0, width, height))
+        if height > self.max_height:
+            self.scrollbar.pack(side="right", fill="y")
+        else:
+            self.scrollbar.pack_forget()
+        self.canvas.delete("all")
+        self._rows = {}
+        self.render()
+
+    def render(self):
+        """Draw the rows in view and drop the ones that scrolled away."""
+        top = self.canvas.canvasy(0)
+        first = max(int(top // self.row_height) - self.overscan, 0)
+        last = min(int((top + self.max_height) // self.row_height) + self.overscan + 1, self.model.rows)
+        for row in [row for row in self._rows if not first <= row < last]:
+            self.canvas.delete(*self._rows.pop(row))
+        for row in range(first, last):
+            if row not in self._rows:
+                self._rows[row] = self._draw_row(row)
+        self._draw_selection()
+
+    def redraw_row(self, row):
+        if row in self._rows:
+            self.canvas.delete(*self._rows.pop(row))
+            self._rows[row] = self._draw_row(row)
+            self._draw_selection()
+
+    def _draw_row(self, row):
+        items = []
+        y0 = row * self.row_height
+        max_chars = max(self.col_width // 8, 1)
+        for col, text in enumerate(self.model.cells[row]):
+            x0 = col * self.col_width
+            items.append(self.canvas.create_rectangle(
+                x0, y0, x0 + self.col_width, y0 + self.row_height,
+                fill=self.model.shading.get((row, col), "white"), outline="#c8c8c8"))
+            if text:
+                items.append(self.canvas.create_text(
+                    x0 + 4, y0 + self.row_height / 2, anchor="w", font=("Courier", 10),
+                    text=text if len(text) <= max_chars else text[:max_chars - 1] + "\u2026"))
+        return items
+
+    def _draw_selection(self):
+        self.canvas.delete("selection")
+        if self.selected:
+            row, col = self.selected
+            x0, y0 = col * self.col_width, row * self.row_height
+            self.canvas.create_rectangle(x0, y0, x0 + self.col_width, y0 + self.row_height,
+                                         outline="#0078d4", width=2, tags="selection")
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.render()
+
+    def cell_at(self, event):
+        row = int(self.canvas.canvasy(event.y) // self.row_height)
+        col = int(self.canvas.canvasx(event.x) // self.col_width)
+        if 0 <= row < self.model.rows and 0 <= col < self.model.cols:
+            return row, col
+        return None
+
+    def _on_click(self, event):
+        self.commit_edit()
+        self.selected = self.cell_at(event)
+        self._draw_selection()
+        if self.on_select:
+            self.on_select(self)
+
+    def _on_double_click(self, event):
+        cell = self.cell_at(event)
+        if cell:
+            self.edit_cell(*cell)
+
+    def _on_context_menu(self, event):
+        self._on_click(event)
+        if self.selected:
+            self.menu.tk_popup(event.x_root, event.y_root)
+
+    def edit_cell(self, row, col):
+        """Place an entry over a cell to edit its text."""
+        self.commit_edit()
+        entry = ttk.Entry(self.canvas)
+        entry.insert(0, self.model.cells[row][col])
+        entry.bind("<Return>", lambda e: self.commit_edit())
+        entry.bind("<Escape>", lambda e: self.cancel_edit())
+        entry.bind("<FocusOut>", lambda e: self.commit_edit())
+        item = self.canvas.create_window(col * self.col_width, row * self.row_height, anchor="nw",
+                                         window=entry, width=self.col_width, height=self.row_height)
+        self._editor = (entry, item, row, col)
+        entry.focus_set()
+
+    def commit_edit(self):
+        if self._editor:
+            entry, item, row, col = self._editor
+            self.model.cells[row][col] = entry.get()
+            self.cancel_edit()
+            self.redraw_row(row)
+
+    def cancel_edit(self):
+        if self._editor:
+            entry, item, row, col = self._editor
+            self._editor = None
+            self.canvas.delete(item)
+            entry.destroy()
+
+    def shade_selected(self, color):
+        if self.selected:
+            self.model.shading[self.selected] = color
+            self.redraw_row(self.selected[0])
+
+    def insert_row(self, below):
+        if self.selected:
+            row, col = self.selected
+            self.model.insert_row(row + below)
+            self.selected = (row + 1 - below, col)
+            self.relayout()
+
+    def insert_column(self, right):
+        if self.selected:
+            row, col = self.selected
+            self.model.insert_column(col + right)
+            self.selected = (row, col + 1 - right)
+            self.relayout()
+
+    def sort_rows(self, reverse):
+        """Sort the rows by the selected column."""
+        if self.selected:
+            self.commit_edit()
+            self.model.sort_rows(self.selected[1], reverse)
+            self.relayout()
+
+
+class Shape:
+    """A drawn shape: kind, flat coordinate list and canvas options."""
+
+    # Canvas item type used to draw each kind
+    ITEM_TYPES = {"line": "line", "rectangle": "rectangle", "oval": "oval", "freehand": "line"}
+
+    def __init__(self, kind, coords, options):
+        self.kind = kind
+        self.coords = list(coords)
+        self.options = options
+        self.item = None
+
+    @property
+    def bbox(self):
+        xs = self.coords[0::2]
+        ys = self.coords[1::2]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @property
+    def half_width(self):
+        return float(self.options.get("width", 1)) / 2
+
+    @property
+    def extent(self):
+        """Return the bounding box including the stroke width."""
+        x0, y0, x1, y1 = self.bbox
+        pad = self.half_width
+        return x0 - pad, y0 - pad, x1 + pad, y1 + pad
+
+    def distance(self, x, y):
+        """Return the distance from (x, y) to the shape, 0 inside closed shapes."""
+        x0, y0, x1, y1 = self.bbox
+        if self.kind == "rectangle":
+            return math.hypot(max(x0 - x, 0, x - x1), max(y0 - y, 0, y - y1))
+        if self.kind == "oval":
+            rx, ry = (x1 - x0) / 2 or 0.5, (y1 - y0) / 2 or 0.5
+            # Radial distance to the outline, never less than the true distance
+            norm = math.hypot((x - x0 - rx) / rx, (y - y0 - ry) / ry)
+            return max(norm - 1, 0) / norm * math.hypot(x - x0 - rx, y - y0 - ry) if norm else 0
+        points = list(zip(self.coords[0::2], self.coords[1::2]))
+        return min(segment_distance(x, y, *a, *b) for a, b in zip(points, points[1:] or points))
+
+    def to_list(self):
+        return [self.kind, self.coords, self.options]
+
+
+def segment_distance(x, y, ax, ay, bx, by):
+    """Return the distance from (x, y) to the segment (ax, ay)-(bx, by)."""
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    t = max(0, min(1, ((x - ax) * dx + (y - ay) * dy) / length)) if length else 0
+    return math.hypot(x - ax - t * dx, y - ay - t * dy)
+
+
+def _farthest_point(points, first, last):
+    """Return the index and distance of the point between first and last farthest from their chord."""
+    ax, ay = points[first]
+    dx, dy = points[last][0] - ax, points[last][1] - ay
+    length = math.hypot(dx, dy)
+    best, best_distance = first, -1.0
+    for i in range(first + 1, last):
+        x, y = points[i]
+        distance = abs(dx * (y - ay) - dy * (x - ax)) / length if length else math.hypot(x - ax, y - ay)
+        if distance > best_distance:
+            best, best_distance = i, distance
+    return best, best_distance
+
+
+def _farthest_point_numpy(points, first, last):
+    import numpy
+    inner = points[first + 1:last] - points[first]
+    dx, dy = points[last] - points[first]
+    length = math.hypot(dx, dy)
+    if length:
+        distances = numpy.abs(dx * inner[:, 1] - dy * inner[:, 0]) / length
+    else:
+        distances = numpy.hypot(inner[:, 0], inner[:, 1])
+    best = int(distances.argmax())
+    return first + 1 + best, float(distances[best])
+
+
+def simplify_stroke(coords, tolerance=1.5):
+    """Simplify a flat x, y coordinate list with Ramer-Douglas-Peucker.
+
+    Points closer than tolerance to the simplified polyline are dropped; the
+    end points are always kept. Distances are vectorized with NumPy when it is
+    installed.
+    """
+    count = len(coords) // 2
+    if count < 3:
+        return list(coords)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        points = numpy.asarray(coords, dtype=float).reshape(-1, 2)
+        farthest = _farthest_point_numpy
+    else:
+        points = list(zip(coords[0::2], coords[1::2]))
+        farthest = _farthest_point
+    keep = bytearray(count)
+    keep[0] = keep[-1] = 1
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, distance = farthest(points, first, last)
+        if distance > tolerance:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+    return [value for i in range(count) if keep[i] for value in coords[2 * i:2 * i + 2]]
+
+
+class GridIndex:
+    """Uniform grid spatial index mapping bounding boxes to keys.
+
+    Each key is registered in every cell its box overlaps, so a query only
+    looks at the keys in the cells it covers.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = {}
+
+    def _cells(self, box):
+        size = self.cell_size
+        x0, y0, x1, y1 = box
+        return [(cx, cy) for cx in range(int(x0 // size), int(x1 // size) + 1)
+                for cy in range(int(y0 // size), int(y1 // size) + 1)]
+
+    def insert(self, key, box):
+        self.boxes[key] = box
+        for cell in self._cells(box):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        for cell in self._cells(self.boxes.pop(key)):
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def update(self, key, box):
+        self.remove(key)
+        self.insert(key, box)
+
+    def query(self, box):
+        """Return the keys whose boxes overlap box."""
+        x0, y0, x1, y1 = box
+        found = set()
+        for cell in self._cells(box):
+            found.update(self.cells.get(cell, ()))
+        return {key for key in found if self.boxes[key][0] <= x1 and self.boxes[key][2] >= x0
+                and self.boxes[key][1] <= y1 and self.boxes[key][3] >= y0}
+
+    def clear(self):
+        self.cells.clear()
+        self.boxes.clear()
+
+
+class ShapeLayer:
+    """Retained model of the shapes drawn on a canvas.
+
+    Every shape owns one canvas item that is updated in place through
+    coords() and move(); a GridIndex over the shape bounding boxes answers
+    hit tests without asking the canvas.
+    """
+
+    def __init__(self, canvas, cell_size=64):
+        self.canvas = canvas
+        self.shapes = {}
+        self.index = GridIndex(cell_size)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __iter__(self):
+        return iter(sorted(self.shapes.values(), key=lambda shape: shape.item))
+
+    def add(self, kind, coords, options):
+        return self.restore(Shape(kind, coords, options))
+
+    def restore(self, shape):
+        """Draw a shape that is not on the canvas, such as one that was removed."""
+        shape.item = getattr(self.canvas, f"create_{Shape.ITEM_TYPES[shape.kind]}")(*shape.coords, **shape.options)
+        self.shapes[shape.item] = shape
+        self.index.insert(shape.item, shape.extent)
+        return shape
+
+    def remove(self, shape):
+        self.canvas.delete(shape.item)
+        self.index.remove(shape.item)
+        del self.shapes[shape.item]
+
+    def set_coords(self, shape, coords):
+        shape.coords = list(coords)
+        self.canvas.coords(shape.item, *shape.coords)
+        self.index.update(shape.item, shape.extent)
+
+    def move(self, shape, dx, dy):
+        shape.coords = [value + (dy if i % 2 else dx) for i, value in enumerate(shape.coords)]
+        self.canvas.move(shape.item, dx, dy)
+        self.index.update(shape.item, shape.extent)
+
+    def resize(self, shape, coords, box, new_box):
+        """Scale coords from box to new_box and apply them to shape."""
+        x0, y0, x1, y1 = box
+        nx0, ny0, nx1, ny1 = new_box
+        sx = (nx1 - nx0) / (x1 - x0) if x1 != x0 else 1
+        sy = (ny1 - ny0) / (y1 - y0) if y1 != y0 else 1
+        self.set_coords(shape, [nx0 + (value - x0) * sx if i % 2 == 0 else ny0 + (value - y0) * sy
+                                for i, value in enumerate(coords)])
+
+    def hit_test(self, x, y, tolerance=4):
+        """Return the topmost shape within tolerance of (x, y), or None."""
+        box = (x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+        for item in sorted(self.index.query(box), reverse=True):
+            shape = self.shapes[item]
+            if shape.distance(x, y) <= tolerance + shape.half_width:
+                return shape
+        return None
+
+    def clear(self):
+        for item in self.shapes:
+            self.canvas.delete(item)
+        self.shapes.clear()
+        self.index.clear()
+
+    def to_list(self):
+        return [shape.to_list() for shape in self]
+
+    def load(self, shapes):
+        self.clear()
+        for kind, coords, options in shapes:
+            self.add(kind, coords, options)
+
+
+ICON_DIR = "icons"  # Ensure you have an 'icons' folder with PNG images
+ICON_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".prowrite", "icons")
+
+
+def load_icon_data(task, names, size=20, icon_dir=ICON_DIR, cache_dir=ICON_CACHE_DIR):
+    """Return {name: PNG bytes of the icon resized to size, or None}.
+
+    Runs off the Tk thread. Resized icons are cached in cache_dir under a
+    name that includes the source file's mtime, so PIL is only imported and
+    used when an icon is new or has changed.
+    """
+    icons = {}
+    for name in names:
+        task.check()
+        source = os.path.join(icon_dir, f"{name}.png")
+        try:
+            mtime = os.stat(source).st_mtime_ns
+        except OSError:
+            icons[name] = None
+            continue
+        cached = os.path.join(cache_dir, f"{name}-{size}-{mtime}.png")
+        try:
+            with open(cached, "rb") as file:
+                icons[name] = file.read()
+            continue
+        except OSError:
+            pass
+        try:
+            from PIL import Image
+        except ImportError:
+            icons[name] = None
+            continue
+        output = io.BytesIO()
+        with Image.open(source) as image:
+            image.resize((size, size), Image.Resampling.LANCZOS).save(output, "PNG")
+        icons[name] = output.getvalue()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for stale in os.listdir(cache_dir):
+                if stale.startswith(f"{name}-{size}-"):
+                    os.remove(os.path.join(cache_dir, stale))
+            write_atomic(cached, [icons[name]], encoding=None)
+        except OSError:
+            pass
+    return icons
+
+
+class DocumentTab:
+    """One open document: its widgets, models, pending work and the commands acting on them.
+
+    The tab reaches shared state (root window, worker pool, styles, find bar
+    and status bar) through app. While a background tab is suspended, its
+    text and drawing live only in a snapshot file named by suspended.
+    """
+
+    # Tags saved with native documents besides the character styles
+    PERSISTENT_TAGS = ("wordart", "table_cell", "table_shading")
+
+    def __init__(self, app):
+        self.app = app
+        self.frame = ttk.Frame(app.notebook)
+        self.content_frame = self.frame
+        self.suspended = None
+        self._suspended_content = None
+        self.last_active = time.monotonic()
+
+        # Create Text Area
+        self.text_area = tk.Text(
+            self.content_frame,
+            wrap='word',
+            font=app.default_font,
+            undo=False,
+            bd=0,
+            relief="flat",
+            bg="white",
+            fg="black",
+            insertbackground="black",
+            selectbackground=app.accent_color
+        )
+        self.text_area.pack(side="left", expand=True, fill='both', padx=(0, 5))
+
+        # Progress indicator shown while a file streams into this tab
+        self.progress_frame = ttk.Frame(self.frame, padding=(5, 2))
+        self.progress_bar = ttk.Progressbar(self.progress_frame, mode="determinate", maximum=100)
+        self.progress_bar.pack(side="left", expand=True, fill="x")
+        ttk.Button(self.progress_frame, text="Cancel", command=self.cancel_load).pack(side="right", padx=(5, 0))
+
+        # The document model mirrors every edit made through the text widget
+        self.document = TextDocument()
+        self._edit_listeners = []
+        self._has_embedded = False
+        self.tables = {}
+        # Undo history for text, formatting and drawing; Tk's own undo stays off
+        self.history = UndoManager(app.root, self._apply_history)
+        self._install_edit_hook()
+        self.add_edit_listener(self._sync_document)
+        self.add_edit_listener(self._record_edit)
+        self.add_edit_listener(self._on_large_file_edit)
+        self.add_edit_listener(lambda edit: app.refresh.request("status"))
+
+        # Create Canvas for drawing
+        self.canvas = tk.Canvas(
+            self.content_frame,
+            bg="white",
+            width=200,
+            bd=1,
+            relief="flat",
+            highlightthickness=1,
+            highlightbackground="#d3d3d3"
+        )
+        self.canvas.pack(side="right", fill="y")
+        self.shapes = ShapeLayer(self.canvas)
+        self.selected_shape = None
+        self._selection_items = None
+
+        # Drag redraws are coalesced to at most one per frame
+        self.drag_refresh = RefreshScheduler(self.canvas, max_rate=60)
+        self.drag_refresh.register("drag", self._render_drag)
+        self.drag_pointer = None
+        self.drag_stats = {"motion_events": 0, "redraws": 0}
+
+        # Search state of the find bar
+        self.search = SearchEngine()
+        self._search_pattern = None
+        self._search_options = None
+        self._search_stale = None
+        self._search_region = None
+        self._search_task = None
+        self.text_area.tag_configure("search", background="#FFFF99")
+        self.text_area.tag_configure("search_current", background="#FFB347")
+        self.text_area.tag_raise("search_current", "search")
+
+        # Syntax highlighting, tagged only in the viewport
+        self.highlighter = None
+        self.highlight_language = None
+        self._highlight_task = None
+        self._highlight_restart = None
+        self._highlight_region = None
+        self.outline_version = None
+
+        # Initialize variables
+        self.file_path = None
+        self.drawing = None
+        self.word_wrap = True
+        self.start_x = None
+        self.start_y = None
+        self.stroke = None
+        self.current_shape = None
+        self._shape_drag = None
+        self.current_table = None
+        self.loader = None
+        self._csv_view = None
+        self.large_file = None
+        self._large_open = None
+        self._slide_pending = None
+        self.follower = None
+        self.file_offset = None
+        self.journal = EditJournal(os.path.join(app.journal_dir, f"{os.getpid()}-{id(self)}.pwj"), app.runner.serial)
+        self.add_edit_listener(self._journal_edit)
+
+        # Scrollbar spanning the whole document in large file mode
+        self.large_scrollbar = ttk.Scrollbar(self.content_frame, orient="vertical",
+                                             command=self._on_large_scrollbar)
+
+        # Bind events
+        self.canvas.bind("<ButtonPress-1>", self.on_mouse_press)
+        self.canvas.bind("<ButtonRelease-1>", self.on_mouse_release)
+        self.canvas.bind("<Delete>", self.delete_selected_shape)
+        self.text_area.bind("<Configure>", lambda e: app.refresh.request("viewport"), add="+")
+        self.add_edit_listener(self._invalidate_search)
+        self.add_edit_listener(self._highlight_edit)
+        self.add_edit_listener(self._outline_edit)
+        self.text_area.bind("<KeyRelease>", lambda e: app.refresh.request("status"))
+        self.text_area.bind("<ButtonRelease-1>", lambda e: app.refresh.request("status"))
+        self._bind_keys()
+
+        # Configure text area tags for tables and WordArt
+        self.text_area.tag_configure("table_cell", font=("Courier", 12), lmargin1=10, lmargin2=10, spacing1=2, spacing3=2)
+        self.text_area.tag_configure("wordart", spacing1=5, spacing3=5)
+
+        # Fonts and tags for character styles are shared through the registry
+        app.styles.attach(self.text_area)
+
+    def _bind_keys(self):
+        """Route the text widget's own shortcuts to the tab instead of Tk's class bindings."""
+        # The Text class maps Ctrl+Z/Ctrl+Y to <<Undo>>/<<Redo>>; breaking here
+        # also keeps the root bindings from running the same step twice
+        self.text_area.bind("<<Undo>>", self.on_undo_key)
+        self.text_area.bind("<<Redo>>", self.on_redo_key)
+        # Ctrl+T is also the Text class transpose; it must not edit the document
+        self.text_area.bind("<Control-t>", self.on_new_tab_key)
+
+    def on_undo_key(self, event):
+        self.undo()
+        return "break"
+
+    def on_redo_key(self, event):
+        self.redo()
+        return "break"
+
+    def on_new_tab_key(self, event):
+        self.app.new_tab()
+        return "break"
+
+    def close(self):
+        """Stop the tab's pending work and remove its journal and snapshot files."""
+        self.cancel_load()
+        self.close_large_file()
+        self._end_follow()
+        if self._search_task is not None:
+            self._search_task.cancel()
+        self.set_highlighting(None)
+        self.journal.discard()
+        if self.suspended is not None and self._suspended_content is None:
+            try:
+                os.remove(self.suspended)
+            except OSError:
+                pass
+        self.suspended = None
+        self.app.styles.detach(self.text_area)
+
+    def suspend(self):
+        """Release the text and drawing, writing them to a snapshot file in the background.
+
+        The undo history is dropped. Until the snapshot is written, the
+        collected content stays in memory and resume() uses it instead.
+        """
+        content = self._collect_formatting()
+        content["text"] = self.document.get_text()
+        fd, path = tempfile.mkstemp(prefix="prowrite-", suffix=".pwd")
+        os.close(fd)
+        self.suspended = path
+        self._suspended_content = content
+        self.app.runner.submit(self._write_suspended, path, content, serial=True,
+                               on_done=lambda result, error: self._on_suspended(path, error))
+        if self._highlight_task is not None:
+            self._highlight_task.cancel()
+            self._highlight_task = None
+        self.history.recording = False
+        self.text_area.delete("1.0", "end")
+        self.deselect_shape()
+        self.shapes.clear()
+        self.tables = {}
+        self.current_table = None
+        self.search.clear()
+        self.history.recording = True
+        self.history.clear()
+
+    @staticmethod
+    def _write_suspended(task, path, content):
+        with open(path, "wb") as file:
+            file.write(pack_document(content))
+
+    def _on_suspended(self, path, error):
+        if self.suspended != path or error:
+            # Resumed, closed or failed while writing: the file is not needed
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return
+        self._suspended_content = None
+
+    def resume(self):
+        """Restore the text and drawing of a suspended tab from its snapshot."""
+        path, content = self.suspended, self._suspended_content
+        self.suspended = None
+        self._suspended_content = None
+        if content is None:
+            with open(path, "rb") as file:
+                content = unpack_document(file.read())
+            os.remove(path)
+        self._show_document(content)
+
+    def clear_search(self):
+        """Forget the find bar's pattern and remove its match tags."""
+        self._search_pattern = None
+        self.search.clear()
+        self._clear_search_tags()
+
+    def _install_edit_hook(self):
+        """Route text widget mutations through Python so listeners see each edit."""
+        widget = str(self.text_area)
+        self._text_orig = widget + "_orig"
+        self.app.root.tk.call("rename", widget, self._text_orig)
+        self.app.root.tk.createcommand(widget, self._text_proxy)
+        self.text_area.bind("<Destroy>", lambda e: self.app.root.tk.deletecommand(widget), add="+")
+
+    def add_edit_listener(self, listener):
+        """Call listener(TextEdit) after every change to the text buffer."""
+        self._edit_listeners.append(listener)
+
+    def _emit_edit(self, edit):
+        for listener in self._edit_listeners:
+            listener(edit)
+
+    def _clamp_index(self, index):
+        """Normalize an index, clamping it to the last editable position."""
+        call = self.app.root.tk.call
+        index = call(self._text_orig, "index", index)
+        if call(self._text_orig, "compare", index, ">", "end-1c"):
+            index = call(self._text_orig, "index", "end-1c")
+        return index
+
+    def _text_proxy(self, command, *args):
+        """Stand-in for the Tcl widget command that reports inserts and deletes."""
+        call = self.app.root.tk.call
+        orig = self._text_orig
+        if command in ("window", "image") and args and args[0] == "create":
+            index = self._clamp_index(args[1])
+            result = call(orig, command, "create", index, *args[2:])
+            self._has_embedded = True
+            start = tuple(map(int, index.split(".")))
+            table = self.tables.get(str(dict(zip(args[2::2], args[3::2])).get("-window")))
+            self._emit_edit(TextEdit("insert", start, (start[0], start[1] + 1), OBJECT_CHAR,
+                                     [table.model if table else None]))
+            return result
+        if command not in ("insert", "delete", "replace", "edit") or \
+                call(orig, "cget", "-state") == "disabled":
+            result = call(orig, command, *args)
+            if command in ("yview", "see") and args:
+                self.app.refresh.request("viewport")
+            return result
+
+        if command == "insert" and len(args) >= 2:
+            index = self._clamp_index(args[0])
+            result = call(orig, command, index, *args[1:])
+            text = "".join(args[1::2])
+            start = tuple(map(int, index.split(".")))
+            self._emit_edit(TextEdit("insert", start, text_end_position(start, text), text))
+            return result
+
+        if command in ("delete", "replace") and len(args) >= 1:
+            if command == "delete" and len(args) > 2:
+                result = call(orig, command, *args)
+                self._emit_edit(TextEdit("reset", None, None, None))
+                return result
+            first = self._clamp_index(args[0])
+            last = self._clamp_index(args[1] if len(args) > 1 else f"{first}+1c")
+            start = tuple(map(int, first.split(".")))
+            deleting = call(orig, "compare", first, "<", last)
+            if deleting:
+                removed = self._widget_text(first, last)
+                end = tuple(map(int, last.split(".")))
+                objects = self._objects_in(first, last) if OBJECT_CHAR in removed else None
+                tags = self.capture_tags(first, last) if self.history.accepting else None
+            result = call(orig, command, first, last, *args[2:])
+            if deleting:
+                self._emit_edit(TextEdit("delete", start, end, removed, objects, tags or None))
+            if command == "replace":
+                text = "".join(args[2::2])
+                self._emit_edit(TextEdit("insert", start, text_end_position(start, text), text))
+            return result
+
+        result = call(orig, command, *args)
+        if command == "edit" and args and args[0] in ("undo", "redo"):
+            self._emit_edit(TextEdit("reset", None, None, None))
+        return result
+
+    def _objects_in(self, first, last):
+        """Return the table models (None for images) embedded between two indices."""
+        items = self.app.root.tk.splitlist(
+            self.app.root.tk.call(self._text_orig, "dump", "-window", "-image", first, last))
+        return [self.tables[name].model if key == "window" and name in self.tables else None
+                for key, name in zip(items[0::3], items[1::3])]
+
+    def _tracked_tag(self, tag):
+        """Return the undo key of a formatting tag: its style, its name, or None if untracked."""
+        style = self.app.styles.style_of(tag)
+        if style is not None:
+            return style
+        return tag if tag in self.PERSISTENT_TAGS else None
+
+    def capture_tags(self, first, last):
+        """Return (key, start, end) spans of the formatting tags between two indices."""
+        first = self.text_area.index(first)
+        last = parse_index(self.text_area.index(last))
+        spans = []
+        open_tags = {tag: parse_index(first) for tag in self.text_area.tag_names(first) if self._tracked_tag(tag)}
+        for kind, tag, index in self.text_area.dump(first, "%d.%d" % last, tag=True):
+            if not self._tracked_tag(tag):
+                continue
+            if kind == "tagon":
+                open_tags.setdefault(tag, parse_index(index))
+            elif tag in open_tags:
+                spans.append((self._tracked_tag(tag), open_tags.pop(tag), parse_index(index)))
+        spans.extend((self._tracked_tag(tag), start, last) for tag, start in open_tags.items())
+        return spans
+
+    def _restore_tags(self, spans, clear=None):
+        """Apply captured tag spans, first removing the tracked tags in the clear range."""
+        with TagBatch(self.text_area) as batch:
+            if clear:
+                for key, start, end in self.capture_tags(*clear):
+                    batch.remove(self.app.styles.tag_for(key) if isinstance(key, TextStyle) else key, start, end)
+            for key, start, end in spans:
+                batch.add(self.app.styles.tag_for(key) if isinstance(key, TextStyle) else key, start, end)
+
+    def _record_edit(self, edit):
+        """Record text edits in the undo history."""
+        if edit.kind == "reset":
+            self.history.clear()
+        else:
+            self.history.record([edit.kind, edit.start, edit.text, edit.objects, edit.tags])
+
+    def _apply_history(self, op, undo):
+        """Perform an undo history operation forwards or, when undo is set, backwards."""
+        kind = op[0]
+        if kind in ("insert", "delete"):
+            start, text, objects = op[1], op[2], op[3]
+            first, last = "%d.%d" % start, "%d.%d" % text_end_position(start, text)
+            if (kind == "insert") == undo:
+                if kind == "insert":
+                    op[4] = self.capture_tags(first, last) or None
+                self.text_area.delete(first, last)
+                self.text_area.mark_set("insert", first)
+            else:
+                self._insert_objects(start, text, objects)
+                if op[4]:
+                    self._restore_tags(op[4])
+                self.text_area.mark_set("insert", last)
+            self.text_area.see("insert")
+        elif kind == "format":
+            start, end, before, after = op[1:]
+            self._restore_tags(before if undo else after, clear=(start, end))
+        elif kind in ("shape_add", "shape_remove"):
+            if (kind == "shape_add") == undo:
+                if op[1] is self.selected_shape:
+                    self.deselect_shape()
+                self.shapes.remove(op[1])
+            else:
+                self.shapes.restore(op[1])
+        elif kind == "shape_coords":
+            self.shapes.set_coords(op[1], op[2] if undo else op[3])
+            self._draw_selection()
+
+    def _insert_objects(self, start, text, objects):
+        """Insert text at start, embedding tables again in place of their OBJECT_CHARs."""
+        if not objects:
+            self.text_area.insert("%d.%d" % start, text)
+            return
+        for i, part in enumerate(text.split(OBJECT_CHAR)):
+            if part:
+                self.text_area.insert("%d.%d" % start, part)
+                start = text_end_position(start, part)
+            if i < len(objects):
+                if objects[i] is not None:
+                    self.embed_table("%d.%d" % start, objects[i])
+                else:
+                    self.text_area.insert("%d.%d" % start, OBJECT_CHAR)
+                start = (start[0], start[1] + 1)
+
+    def _widget_text(self, first="1.0", last="end-1c"):
+        """Return widget text, with OBJECT_CHAR standing in for embedded windows and images."""
+        call = self.app.root.tk.call
+        if not self._has_embedded:
+            return call(self._text_orig, "get", first, last)
+        items = self.app.root.tk.splitlist(call(self._text_orig, "dump", "-text", "-window", "-image", first, last))
+        return "".join(value if key == "text" else OBJECT_CHAR
+                       for key, value in zip(items[0::3], items[1::3]))
+
+    def _sync_document(self, edit):
+        """Apply a widget edit to the document model."""
+        if edit.kind == "reset":
+            self.document.reset(self._widget_text())
+        else:
+            self.document.apply(edit)
+
+    def new_file(self):
+        if len(self.document):
+            if messagebox.askyesno("Save File", "Do you want to save the current document?"):
+                self.save_file()
+        self.close_large_file()
+        self._end_follow()
+        self.file_offset = None
+        self.text_area.delete(1.0, "end")
+        self.deselect_shape()
+        self.shapes.clear()
+        self.history.clear()
+        self.tables = {}
+        self.current_table = None
+        self.file_path = None
+        self.journal.reset(None)
+        self.set_highlighting(None)
+        self.app.refresh.request("status")
+
+    def load_document(self, file_path):
+        """Read and unpack a native document in the background, then display it."""
+        self.cancel_load()
+        self.close_large_file()
+        self._end_follow()
+        self.file_offset = None
+        self.app.show_status_message("Opening...", duration=None)
+        self.app.runner.submit(self._read_document, file_path,
+                               on_done=lambda content, error: self._on_document_read(file_path, content, error))
+
+    @staticmethod
+    def _read_document(task, path):
+        with open(path, "rb") as file:
+            return unpack_document(file.read())
+
+    def _on_document_read(self, file_path, content, error):
+        self.app.show_status_message(None)
+        if error:
+            messagebox.showerror("Error", f"Failed to open file: {error}")
+            return
+        self._show_document(content)
+        self.file_path = file_path
+        self.journal.reset(file_path)
+        self.set_highlighting(language_for(file_path, self.app.highlight_languages))
+        self.app.refresh.request("status")
+
+    def _show_document(self, content):
+        """Replace the text, formatting, tables and shapes with unpacked document content."""
+        self.history.recording = False
+        self.text_area.delete("1.0", "end")
+        self.deselect_shape()
+        self.text_area.insert("1.0", content["text"])
+        self._apply_formatting(content)
+        self.tables = {}
+        line_starts = self.document.line_starts(1, self.document.stats.lines)
+        for offset, data in reversed(content.get("tables", [])):
+            index = self._local_index(line_starts, 1, offset)
+            self.text_area.delete(index)
+            self.embed_table(index, TableModel.from_dict(data))
+        self.shapes.load(content.get("shapes", []))
+        self.history.recording = True
+        self.history.clear()
+
+    def _apply_formatting(self, content):
+        """Apply stored style runs and tag spans with one tag_add call per tag."""
+        line_starts = self.document.line_starts(1, self.document.stats.lines)
+
+        def index(offset):
+            return self._local_index(line_starts, 1, offset)
+
+        for tag, options in content.get("tag_config", {}).items():
+            self.text_area.tag_configure(tag, **options)
+        style_tags = [self.app.styles.tag_for(TextStyle(*style)) for style in content.get("styles", [])]
+        with TagBatch(self.text_area) as batch:
+            offset = 0
+            for style_id, length in content.get("runs", []):
+                if style_id >= 0:
+                    batch.add(style_tags[style_id], index(offset), index(offset + length))
+                offset += length
+            for tag, spans in content.get("tags", {}).items():
+                for i in range(0, len(spans), 2):
+                    batch.add(tag, index(spans[i]), index(spans[i] + spans[i + 1]))
+
+    def _collect_formatting(self):
+        """Return style runs, tag spans and shapes of the document for saving."""
+        line_starts = self.document.line_starts(1, self.document.stats.lines)
+        length = len(self.document)
+
+        def offset(index):
+            line, col = index.split(".")
+            return line_starts[int(line) - 1] + int(col)
+
+        spans = {}
+        open_tags = {}
+        for kind, tag, index in self.text_area.dump("1.0", "end-1c", tag=True):
+            if tag not in self.PERSISTENT_TAGS and self.app.styles.style_of(tag) is None:
+                continue
+            if kind == "tagon":
+                open_tags[tag] = offset(index)
+            elif tag in open_tags:
+                start = open_tags.pop(tag)
+                spans.setdefault(tag, []).append((start, offset(index)))
+        for tag, start in open_tags.items():
+            spans.setdefault(tag, []).append((start, length))
+
+        styles = []
+        style_spans = []
+        tags = {}
+        for tag, ranges in spans.items():
+            style = self.app.styles.style_of(tag)
+            if style is None:
+                tags[tag] = [value for start, end in ranges for value in (start, end - start)]
+            else:
+                styles.append(list(style))
+                style_spans.extend((start, end, len(styles) - 1) for start, end in ranges)
+        runs = []
+        position = 0
+        for start, end, style_id in sorted(style_spans):
+            if start > position:
+                runs.append([-1, start - position])
+            runs.append([style_id, end - start])
+            position = end
+        if position < length:
+            runs.append([-1, length - position])
+
+        shapes = self.shapes.to_list()
+        tables = [[offset(self.text_area.index(view)), view.model.to_dict()] for view in self._tables_in_order()]
+        tag_config = {tag: {"background": self.text_area.tag_cget(tag, "background")}
+                      for tag in ("table_shading",) if tag in tags}
+        return {"version": 1, "styles": styles, "runs": runs, "tags": tags,
+                "tag_config": tag_config, "shapes": shapes, "tables": tables}
+
+    def load_file(self, file_path):
+        """Stream a file into the text area without blocking the UI."""
+        self.cancel_load()
+        self.close_large_file()
+        self._end_follow()
+        loader = ChunkedLoader(self.app.runner, file_path, self._on_load_chunk, self._on_load_done)
+        loader.start()
+        self.loader = loader
+        # Neither the history nor the journal keeps the text being replaced
+        self.history.recording = False
+        self.history.clear()
+        self.text_area.delete(1.0, "end")
+        self.file_path = file_path
+        self.set_highlighting(language_for(file_path, self.app.highlight_languages))
+        self.progress_bar["value"] = 0
+        self.progress_frame.pack(side="bottom", fill="x", before=self.text_area)
+
+    def cancel_load(self):
+        if self.loader:
+            self.loader.cancel()
+        if self._large_open is not None:
+            self._large_open.cancel()
+            self._large_open = None
+            self.text_area.config(state="normal")
+            self.app.show_status_message(None)
+
+    def _on_load_chunk(self, text, fraction):
+        self.text_area.insert("end", text)
+        self.progress_bar["value"] = fraction * 100
+
+    def _on_load_done(self, error):
+        cancelled = self.loader.cancelled
+        self.file_offset = None if cancelled or error else self.loader.bytes_read
+        self.loader = None
+        self.journal.reset(self.file_path)
+        if cancelled or error:
+            self.journal.record_snapshot(self.document.get_text())
+        self.progress_frame.pack_forget()
+        self.history.recording = True
+        self.history.clear()
+        self._restart_highlighting(delay=0)
+        self.app.refresh.request("status", "outline")
+        if error:
+            messagebox.showerror("Error", f"Failed to open file: {error}")
+
+    def load_csv(self, file_path):
+        """Stream a CSV or TSV file into a new table at the insertion cursor."""
+        if self.large_file:
+            messagebox.showinfo("Import CSV", "Tables cannot be inserted in large file mode.")
+            return
+        self.cancel_load()
+        loader = CsvLoader(self.app.runner, file_path, self._on_csv_rows, self._on_csv_done)
+        loader.start()
+        self.loader = loader
+        self._csv_view = self.embed_table(self.text_area.index("insert"), TableModel(0, 0))
+        self.progress_bar["value"] = 0
+        self.progress_frame.pack(side="bottom", fill="x", before=self.text_area)
+
+    def _on_csv_rows(self, rows, fraction):
+        if not self._csv_view.winfo_exists():
+            self.cancel_load()
+            return
+        if rows:
+            self._csv_view.model.append_rows(rows)
+            self._csv_view.relayout()
+        self.progress_bar["value"] = fraction * 100
+
+    def _on_csv_done(self, error):
+        self.loader = None
+        self._csv_view = None
+        self.progress_frame.pack_forget()
+        self._restart_highlighting(delay=0)
+        self.app.refresh.request("status")
+        if error:
+            messagebox.showerror("Error", f"Failed to import file: {error}")
+
+    def toggle_follow(self):
+        if self.app.follow_var.get():
+            self.start_follow()
+        else:
+            self.stop_follow()
+
+    def start_follow(self):
+        """Append text written to the open file from now on, reading only the new bytes."""
+        if self.follower:
+            return
+        self.app.follow_var.set(False)
+        if self.file_offset is None or self.loader:
+            messagebox.showinfo("Follow File", "Follow mode needs a text file opened with File > Open.")
+            return
+        follower = FileFollower(self.app.runner, self.app.root, self.file_path, self.file_offset,
+                                self._on_follow_text, self._on_follow_reset)
+        try:
+            follower.start()
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to follow file: {e}")
+            return
+        self.follower = follower
+        self.app.follow_var.set(True)
+        self.trim_followed_lines()
+        self.app.refresh.request("status")
+
+    def stop_follow(self):
+        """Stop following and journal the text as it now stands."""
+        if not self.follower:
+            return
+        self._end_follow()
+        self.journal.reset(self.file_path)
+        self.journal.record_snapshot(self.document.get_text())
+        self.app.refresh.request("status")
+
+    def _end_follow(self):
+        if self.follower:
+            self.file_offset = self.follower.offset
+            self.follower.stop()
+            self.follower = None
+            self.app.follow_var.set(False)
+
+    def _on_follow_text(self, text):
+        """Append text from the followed file, scrolling along only when the view is at the bottom."""
+        pinned = self.text_area.yview()[1] >= 1.0
+        self.history.recording = False
+        self.text_area.insert("end", text)
+        self.history.recording = True
+        self.trim_followed_lines()
+        if pinned:
+            self.text_area.see("end")
+
+    def _on_follow_reset(self):
+        self.app.show_status_message("File truncated; following from the start")
+
+    def trim_followed_lines(self):
+        """Delete lines from the top beyond follow_max_lines."""
+        excess = self.document.stats.lines - self.app.follow_max_lines if self.app.follow_max_lines else 0
+        if excess > 0:
+            # The journal replays over the whole file, so it needs the trim to place later edits
+            self.journal.record_delete(0, self.document.offset(excess + 1, 0))
+            self.history.recording = False
+            self.text_area.delete("1.0", f"{excess + 1}.0")
+            self.history.recording = True
+            self.history.clear()
+
+    def load_large_file(self, file_path, top=0, message=None):
+        """Open a file in large file mode, showing only a window of its lines.
+
+        The line index is built on a worker; message is shown once the file is up.
+        """
+        self.cancel_load()
+        self.app.show_status_message("Opening...", duration=None)
+        self._large_open = self.app.runner.submit(
+            self._open_large_file, file_path,
+            on_done=lambda view, error: self._on_large_file_opened(file_path, top, message, view, error))
+
+    @staticmethod
+    def _open_large_file(task, path):
+        view = LargeFileView(path)
+        if task.cancelled:
+            view.close()
+            task.check()
+        return view
+
+    def _on_large_file_opened(self, file_path, top, message, view, error):
+        self._large_open = None
+        self.text_area.config(state="normal")
+        self.app.show_status_message(message)
+        if error:
+            messagebox.showerror("Error", f"Failed to open file: {error}")
+            return
+        self.close_large_file()
+        self._end_follow()
+        self.file_offset = None
+        self.large_file = view
+        self.file_path = file_path
+        self.journal.reset(None)
+        self.set_highlighting(language_for(file_path, self.app.highlight_languages))
+        self.text_area.config(yscrollcommand=self._on_large_yscroll)
+        self.large_scrollbar.pack(side="left", fill="y", after=self.text_area)
+        self._show_large_window(top - view.window_lines // 2, top)
+
+    def close_large_file(self):
+        if self.large_file:
+            self.large_file.close()
+            self.large_file = None
+            self.text_area.config(yscrollcommand="")
+            self.large_scrollbar.pack_forget()
+
+    def _on_large_file_edit(self, edit):
+        if self.large_file and not self.large_file.loading:
+            self.large_file.dirty = True
+
+    def _show_large_window(self, start, top):
+        """Load the window beginning near start and scroll absolute line top into view."""
+        view = self.large_file
+        lines = view.window(start)
+        view.loading = True
+        self.history.recording = False
+        self.text_area.delete("1.0", "end")
+        self.text_area.insert("1.0", "\n".join(lines))
+        self.history.recording = True
+        self.history.clear()
+        view.loading = False
+        view.dirty = False
+        self.text_area.yview(f"{top - view.start + 1}.0")
+        self.app.refresh.request("status")
+
+    def _commit_large_window(self):
+        if self.large_file.dirty:
+            self.large_file.commit(self.document.get_text().split("\n"))
+
+    def _slide_large_window(self, top=None):
+        """Recenter the window on absolute line top (default: the first visible line)."""
+        self._slide_pending = None
+        view = self.large_file
+        if not view or view.saving:
+            return
+        if top is None:
+            top = view.start + int(self.text_area.index("@0,0").split(".")[0]) - 1
+        line, col = self.text_area.index("insert").split(".")
+        cursor = view.start + int(line) - 1
+        self._commit_large_window()
+        self._show_large_window(top - view.window_lines // 2, top)
+        if view.start <= cursor < view.start + view.count:
+            self.text_area.mark_set("insert", f"{cursor - view.start + 1}.{col}")
+
+    def _on_large_yscroll(self, first, last):
+        """Map the text widget's window fractions onto the whole document."""
+        view = self.large_file
+        if not view:
+            return
+        first, last = float(first), float(last)
+        total = max(view.total, 1)
+        self.large_scrollbar.set((view.start + first * view.count) / total,
+                                 (view.start + last * view.count) / total)
+        near_top = first < 0.1 and view.start > 0
+        near_bottom = last > 0.9 and view.start + view.count < view.total
+        if (near_top or near_bottom) and self._slide_pending is None:
+            self._slide_pending = self.app.root.after_idle(self._slide_large_window)
+
+    def _on_large_scrollbar(self, action, *args):
+        view = self.large_file
+        if not view:
+            return
+        if action != "moveto":
+            self.text_area.yview(action, *args)
+            return
+        target = min(int(float(args[0]) * view.total), view.total - 1)
+        local = target - view.start
+        if view.count // 10 <= local < view.count - view.count // 10:
+            self.text_area.yview(f"{local + 1}.0")
+        else:
+            self._slide_large_window(max(target, 0))
+
+    def _save_large_file(self):
+        """Stream the merged large file to a temporary file, then swap it in."""
+        view = self.large_file
+        path = self.file_path
+        top = view.start + int(self.text_area.index("@0,0").split(".")[0]) - 1
+        self._commit_large_window()
+        view.saving = True
+        self.text_area.config(state="disabled")
+        self.app.show_status_message("Saving...", duration=None)
+        self.app.runner.submit(
+            self._write_large_file, view, path, serial=True,
+            on_done=lambda temp_path, error: self._on_large_file_saved(path, temp_path, top, error))
+
+    @staticmethod
+    def _write_large_file(task, view, path):
+        """Write the merged file to a synced temporary file next to path and return its name."""
+        fd, temp_path = create_temp_file(path)
+        try:
+            with open(fd, "wb") as file:
+                view.write(file)
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path
+
+    def _on_large_file_saved(self, path, temp_path, top, error):
+        """Swap the saved file in, then index it again; the text stays read-only until it is shown."""
+        if not error:
+            try:
+                # The mapping must be closed before the file can be replaced on Windows
+                self.close_large_file()
+                replace_file(temp_path, path)
+            except OSError as e:
+                error = e
+        if error:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.app.show_status_message(None)
+            if self.large_file:
+                self.large_file.saving = False
+                self.text_area.config(state="normal")
+            else:
+                self.load_large_file(path, top)
+            messagebox.showerror("Error", f"Failed to save file: {error}")
+            return
+        self.load_large_file(path, top, message="File saved successfully")
+
+    def save_file(self):
+        if self.large_file:
+            if not self.large_file.saving:
+                self._save_large_file()
+            return
+        if not self.file_path:
+            self.file_path = filedialog.asksaveasfilename(
+                defaultextension=".txt",
+                filetypes=[("Text files", "*.txt"), ("ProWrite documents", "*.pwd"), ("All files", "*.*")]
+            )
+        if self.file_path:
+            path = self.file_path
+            # The saved file replaces the one being followed
+            self._end_follow()
+            self.file_offset = None
+            if path.lower().endswith(DOCUMENT_EXTENSION):
+                self.app.runner.submit(self._write_document, path, self.document.snapshot(),
+                                       self._collect_formatting(), serial=True,
+                                       on_done=lambda result, error: self._on_file_saved(path, error))
+                self.journal.reset(path)
+            else:
+                snapshot = self.document.snapshot()
+                tables = [view.model.to_text() for view in self._tables_in_order()]
+                self.app.runner.submit(self._write_snapshot, path, snapshot, tables, serial=True,
+                                       on_done=lambda result, error: self._on_file_saved(path, error))
+                # Tables and images are expanded or dropped in the file, so journal offsets would not match it
+                lossy = any(OBJECT_CHAR in chunk for chunk in snapshot.chunks())
+                self.journal.reset(path, "".join(snapshot.chunks()) if lossy else None)
+            self.app.show_status_message("Saving...", duration=None)
+
+    @staticmethod
+    def _write_snapshot(task, path, snapshot, tables=()):
+        write_atomic(path, expand_objects(snapshot.chunks(), tables))
+
+    @staticmethod
+    def _write_document(task, path, snapshot, content):
+        content["text"] = "".join(snapshot.chunks())
+        write_atomic(path, [pack_document(content)], encoding=None)
+
+    def _on_file_saved(self, path, error):
+        if error:
+            self.app.show_status_message(None)
+            self.journal.record_snapshot(self.document.get_text())
+            messagebox.showerror("Error", f"Failed to save file: {error}")
+        else:
+            self.app.show_status_message(f"Saved {os.path.basename(path)}")
+
+    def show_word_count(self):
+        """Count words, characters, lines and paragraphs in the background."""
+        self.app.runner.submit(self._count_words, self.document.snapshot(), on_done=self._on_word_count)
+
+    @staticmethod
+    def _count_words(task, snapshot):
+        text = "".join(snapshot.chunks())
+        return {
+            "Words": len(text.split()),
+            "Characters": len(text),
+            "Characters (no spaces)": len(text) - sum(map(text.count, " \t\n")),
+            "Lines": text.count("\n") + 1,
+            "Paragraphs": sum(1 for block in re.split(r"\n\s*\n", text) if block.strip()),
+        }
+
+    def _on_word_count(self, counts, error):
+        if error:
+            messagebox.showerror("Error", f"Failed to count words: {error}")
+        else:
+            messagebox.showinfo("Word Count", "\n".join(f"{name}: {value}" for name, value in counts.items()))
+
+    def _journal_edit(self, edit):
+        """Record an edit in the crash-recovery journal."""
+        # Text streamed in by a loader or appended by follow mode is not recorded in the history
+        if self.loader or self.large_file or not self.history.recording:
+            return
+        if edit.kind == "reset":
+            self.journal.record_snapshot(self.document.get_text())
+        elif edit.kind == "insert":
+            self.journal.record_insert(self.document.offset(*edit.start), edit.text)
+        else:
+            self.journal.record_delete(self.document.offset(*edit.start), len(edit.text))
+
+    def undo(self):
+        self.history.undo()
+        self.app.refresh.request("status")
+
+    def redo(self):
+        self.history.redo()
+        self.app.refresh.request("status")
+
+    def show_undo_history(self):
+        """Report the size of the undo history."""
+        messagebox.showinfo(
+            "Undo History",
+            f"Undo steps: {len(self.history)}\n"
+            f"Redo steps: {self.history.redo_steps}\n"
+            f"Memory: {self.history.memory / 1048576:.1f} MB of {self.history.max_bytes / 1048576:.0f} MB\n"
+            f"Steps dropped to stay under the limit: {self.history.evicted}"
+        )
+
+    def cut(self):
+        self.text_area.event_generate("<<Cut>>")
+        self.app.refresh.request("status")
+
+    def copy(self):
+        self.text_area.event_generate("<<Copy>>")
+
+    def paste(self):
+        self.text_area.event_generate("<<Paste>>")
+        self.app.refresh.request("status")
+
+    def bold_text(self):
+        self._toggle_style("weight", "bold", "normal")
+
+    def italic_text(self):
+        self._toggle_style("slant", "italic", "roman")
+
+    def underline_text(self):
+        self._toggle_style("underline", True, False)
+
+    def _toggle_style(self, attribute, on, off):
+        """Toggle a style attribute over the selection, based on its first character."""
+        try:
+            current = getattr(self.app.styles.style_at(self.text_area, "sel.first"), attribute)
+            self.restyle_selection(**{attribute: off if current == on else on})
+        except tk.TclError:
+            messagebox.showwarning("Warning", "No text selected")
+
+    def restyle_selection(self, **changes):
+        """Change style attributes of the selection as one undoable step."""
+        start, end = self.text_area.index("sel.first"), self.text_area.index("sel.last")
+        before = self.capture_tags(start, end)
+        self.app.styles.restyle(self.text_area, start, end, **changes)
+        self.history.record(["format", start, end, before, self.capture_tags(start, end)])
+
+    def change_font(self):
+        font_name = askstring("Font", "Enter font name (e.g., Segoe UI):")
+        if font_name:
+            try:
+                font_size = askstring("Font Size", "Enter font size (e.g., 12):")
+                font_size = int(font_size)
+                self.text_area.config(font=(font_name, font_size))
+                self.app.refresh.request("status")
+            except ValueError:
+                messagebox.showerror("Error", "Invalid font size")
+
+    def change_color(self):
+        try:
+            color = colorchooser.askcolor(title="Choose Text Color")[1]
+            if color:
+                self.restyle_selection(color=color)
+        except tk.TclError:
+            messagebox.showwarning("Warning", "No text selected")
+
+    def run_search(self, on_ready=None):
+        """Search a snapshot of the document in the background, then highlight the matches.
+
+        on_ready is called once the new matches are in place.
+        """
+        self._search_options = self._find_options()
+        self._search_stale = None
+        if self._search_task is not None:
+            self._search_task.cancel()
+            self._search_task = None
+        term = self.app.find_var.get()
+        if not term:
+            self._search_pattern = None
+            self.search.clear()
+            self._clear_search_tags()
+            self._update_find_count()
+            return
+        try:
+            self._search_pattern = SearchEngine.compile(
+                term, self.app.find_regex.get(), self.app.find_case.get(), self.app.find_word.get())
+        except re.error as e:
+            self.app.find_count.config(text=f"Invalid pattern: {e}")
+            return
+        self._search_task = self.app.runner.submit(
+            self._find_matches, self.document.snapshot(), self._search_pattern,
+            on_done=lambda spans, error: self._on_search_done(spans, error, on_ready))
+
+    @staticmethod
+    def _find_matches(task, snapshot, pattern):
+        return SearchEngine.find_spans("".join(snapshot.chunks()), pattern)
+
+    def _on_search_done(self, spans, error, on_ready):
+        self._search_task = None
+        if error:
+            self.app.find_count.config(text=f"Search failed: {error}")
+            return
+        self.search.set_matches(*spans)
+        self._clear_search_tags()
+        self._update_find_count()
+        self.app.refresh.request("viewport")
+        if on_ready:
+            on_ready()
+
+    def _invalidate_search(self, edit):
+        """Re-run an active search shortly after the text stops changing."""
+        if self._search_pattern is None:
+            return
+        if self._search_stale is not None:
+            self.app.root.after_cancel(self._search_stale)
+        self._search_stale = self.app.root.after(300, self._rerun_search)
+
+    def _rerun_search(self):
+        current = self.search.current
+        self.run_search(on_ready=lambda: self._restore_current_match(current))
+
+    def _restore_current_match(self, current):
+        if 0 <= current < len(self.search):
+            self.search.current = current
+            self._update_find_count()
+
+    def find_next(self):
+        self._find_step(forward=True)
+
+    def find_previous(self):
+        self._find_step(forward=False)
+
+    def _find_options(self):
+        return (self.app.find_var.get(), self.app.find_regex.get(), self.app.find_case.get(), self.app.find_word.get())
+
+    def _find_step(self, forward):
+        """Move the cursor to the next or previous match, searching first if needed."""
+        if self._search_pattern is None or self._search_stale is not None or \
+                self._search_task is not None or self._search_options != self._find_options():
+            self.run_search(on_ready=lambda: self._find_step(forward))
+            return
+        line, col = map(int, self.text_area.index("insert").split("."))
+        offset = self.document.offset(line, col)
+        if forward:
+            if self.search.current >= 0:
+                offset = self.search.starts[self.search.current] + 1
+            index = self.search.next(offset)
+        else:
+            index = self.search.previous(offset)
+        if index < 0:
+            return
+        start = self._offset_index(self.search.starts[index])
+        self.text_area.mark_set("insert", start)
+        self.text_area.see(start)
+        self._update_find_count()
+        self.app.refresh.request("viewport")
+
+    def replace_next(self):
+        """Replace the current match, then move to the next one."""
+        current = self.search.current
+        if self._search_pattern is not None and self._search_stale is None and self._search_task is None and \
+                self._search_options == self._find_options() and current >= 0:
+            start, end = self.search.starts[current], self.search.ends[current]
+            text = self.document.get(start, end)
+            match = self._search_pattern.fullmatch(text)
+            if match:
+                try:
+                    replacement = match.expand(self.app.replace_var.get()) if self.app.find_regex.get() \
+                        else self.app.replace_var.get()
+                except (re.error, IndexError) as e:
+                    self.app.find_count.config(text=f"Invalid replacement: {e}")
+                    return
+                self.text_area.replace(self._offset_index(start), self._offset_index(end), replacement)
+                self.text_area.mark_set("insert", self._offset_index(start + len(replacement)))
+        self.find_next()
+
+    def replace_all(self):
+        """Compute every replacement in the background and apply them as one undoable edit.
+
+        Formatting of the text between matches is kept, and embedded tables
+        and images between matches are left in place.
+        """
+        term = self.app.find_var.get()
+        if not term:
+            return
+        try:
+            pattern = SearchEngine.compile(term, self.app.find_regex.get(), self.app.find_case.get(),
+                                           self.app.find_word.get())
+        except re.error as e:
+            self.app.find_count.config(text=f"Invalid pattern: {e}")
+            return
+        self.app.find_count.config(text="Replacing...")
+        self._start_replace_all(pattern, self.app.replace_var.get(), self.app.find_regex.get())
+
+    def _start_replace_all(self, pattern, replacement, regex, retries=2):
+        version = self.document.version
+        self.app.runner.submit(
+            self._compute_replace_all, self.document.snapshot(), pattern, replacement, regex,
+            on_done=lambda result, error: self._apply_replace_all(
+                version, (pattern, replacement, regex), retries, result, error))
+
+    @staticmethod
+    def _compute_replace_all(task, snapshot, pattern, replacement, regex):
+        return SearchEngine.replace_all("".join(snapshot.chunks()), pattern, replacement, regex)
+
+    def _apply_replace_all(self, version, request, retries, segments, error):
+        if error:
+            self.app.find_count.config(text=f"Invalid replacement: {error}")
+            return
+        if version != self.document.version:
+            # The text changed while replacements were computed; start over with the same request, a few times
+            if retries:
+                self._start_replace_all(*request, retries=retries - 1)
+            else:
+                self.app.find_count.config(text="Document changed; nothing replaced")
+            return
+        if not segments:
+            self.app.find_count.config(text="No matches")
+            return
+        # Replace back to front, so earlier offsets stay valid, within this one callback and undo group
+        for start, end, text, matches in reversed(segments):
+            first, last = self._offset_index(start), self._offset_index(end)
+            spans = [(key, self.document.offset(*span_start), self.document.offset(*span_end))
+                     for key, span_start, span_end in self.capture_tags(first, last)]
+            self.text_area.replace(first, last, text)
+            shift = SearchEngine.offset_map(matches)
+            shifted = []
+            for key, span_start, span_end in spans:
+                span_start, span_end = shift(span_start), shift(span_end, after=True)
+                if span_start < span_end:
+                    shifted.append((key, self.document.position(span_start), self.document.position(span_end)))
+            self._restore_tags(shifted)
+        count = sum(len(matches) for start, end, text, matches in segments)
+        self.run_search(on_ready=lambda: self.app.find_count.config(text=f"Replaced {count} matches"))
+
+    def _offset_index(self, offset):
+        """Convert a character offset to a Tk text index."""
+        return "%d.%d" % self.document.position(offset)
+
+    def _update_find_count(self):
+        total = len(self.search)
+        if not total:
+            self.app.find_count.config(text="No matches" if self._search_pattern else "")
+        elif self.search.current >= 0:
+            self.app.find_count.config(text=f"{self.search.current + 1} of {total}")
+        else:
+            self.app.find_count.config(text=f"{total} matches")
+
+    def _clear_search_tags(self):
+        self.text_area.tag_remove("search", "1.0", "end")
+        self.text_area.tag_remove("search_current", "1.0", "end")
+        self._search_region = None
+
+    def _visible_lines(self, margin=50):
+        """Return the first and last line of the viewport, widened by margin lines."""
+        first = int(self.text_area.index("@0,0").split(".")[0])
+        last = int(self.text_area.index(f"@0,{self.text_area.winfo_height()}").split(".")[0])
+        return max(first - margin, 1), min(last + margin, self.document.stats.lines)
+
+    def refresh_viewport(self):
+        """Update everything that is only drawn for the visible region."""
+        self._highlight_visible_syntax()
+        self._highlight_visible_matches()
+
+    def _highlight_visible_matches(self):
+        """Tag only the matches within the viewport and a margin around it."""
+        if not len(self.search):
+            return
+        first, last = self._visible_lines()
+        if self._search_region:
+            self.text_area.tag_remove("search", *self._search_region)
+            self.text_area.tag_remove("search_current", *self._search_region)
+        line_starts = self.document.line_starts(first, last)
+        with TagBatch(self.text_area) as batch:
+            for i in self.search.between(line_starts[0], line_starts[-1]):
+                start = self._local_index(line_starts, first, self.search.starts[i])
+                end = self._local_index(line_starts, first, self.search.ends[i])
+                batch.add("search_current" if i == self.search.current else "search", start, end)
+        self._search_region = (f"{first}.0", f"{last}.0 lineend")
+
+    def set_highlighting(self, name):
+        """Highlight the document with a language's rules, or stop highlighting when name is None."""
+        if self._highlight_task is not None:
+            self._highlight_task.cancel()
+            self._highlight_task = None
+        if self._highlight_restart is not None:
+            self.app.root.after_cancel(self._highlight_restart)
+            self._highlight_restart = None
+        if self.highlighter is not None:
+            self.text_area.tag_delete(*{"syntax_" + tag for tag in self.highlighter.tags})
+        self.highlighter = None
+        self.highlight_language = None
+        self._highlight_region = None
+        self.app.highlight_var.set("None")
+        if name is None:
+            return
+        language = self.app.highlight_languages[name]
+        try:
+            highlighter = SyntaxHighlighter(language["rules"])
+        except (re.error, KeyError, IndexError, TypeError) as e:
+            messagebox.showerror("Error", f"Invalid highlighting rules for {name}: {e}")
+            return
+        colors = dict(HIGHLIGHT_COLORS, **language.get("colors", {}))
+        for tag in set(highlighter.tags):
+            self.text_area.tag_configure("syntax_" + tag, foreground=colors.get(tag, "black"))
+            self.text_area.tag_lower("syntax_" + tag)
+        highlighter.reset(self.document.stats.lines)
+        self.highlighter = highlighter
+        self.highlight_language = name
+        self.app.highlight_var.set(name)
+        self._restart_highlighting(delay=0)
+
+    def _highlight_edit(self, edit):
+        """Lex the lines an edit touched again, restarting the background pass if needed."""
+        highlighter = self.highlighter
+        if highlighter is None:
+            return
+        if edit.kind == "reset":
+            highlighter.reset(self.document.stats.lines)
+            restart = True
+        else:
+            lines = edit.end[0] - edit.start[0] + 1
+            removed, added = (1, lines) if edit.kind == "insert" else (lines, 1)
+            restart = highlighter.edit(edit.start[0] - 1, removed, added, self._line_text)
+            # Batches still on their way would land on shifted lines
+            restart = restart or (added != removed and self._highlight_task is not None)
+        if restart:
+            self._restart_highlighting()
+        self.app.refresh.request("viewport")
+
+    def _line_text(self, line):
+        """Return the text of a 0-based line."""
+        return self._widget_text(f"{line + 1}.0", f"{line + 1}.0 lineend")
+
+    def _restart_highlighting(self, delay=300):
+        """Cancel the background pass and start a new one once the text stops changing."""
+        if self.highlighter is None:
+            return
+        if self._highlight_task is not None:
+            self._highlight_task.cancel()
+            self._highlight_task = None
+        if self._highlight_restart is not None:
+            self.app.root.after_cancel(self._highlight_restart)
+        self._highlight_restart = self.app.root.after(delay, self._start_highlight_pass)
+
+    def _start_highlight_pass(self):
+        """Lex the lines from the first one that is not up to date in the background."""
+        self._highlight_restart = None
+        highlighter = self.highlighter
+        if highlighter is None or self.loader or highlighter.valid >= len(highlighter.spans):
+            return
+        first = highlighter.valid
+        self._highlight_task = self.app.runner.submit(
+            self._lex_snapshot, highlighter, self.document.snapshot(), self.document.offset(first + 1, 0),
+            first, highlighter.states[first],
+            on_progress=self._on_highlight_batch, on_done=self._on_highlight_done)
+
+    @staticmethod
+    def _lex_snapshot(task, highlighter, snapshot, offset, first, state):
+        highlighter.lex_batches(task, snapshot.slice(offset, len(snapshot)), first, state)
+
+    def _on_highlight_batch(self, batch):
+        first, spans, ends = batch
+        if not self.highlighter.apply_batch(first, spans, ends):
+            return
+        region = self._highlight_region
+        if region is None or first < region[1] and first + len(spans) >= region[0]:
+            self.app.refresh.request("viewport")
+
+    def _on_highlight_done(self, result, error):
+        self._highlight_task = None
+        if error:
+            self.app.show_status_message(f"Highlighting failed: {error}")
+
+    def _highlight_visible_syntax(self):
+        """Tag the lexed lines within the viewport and a margin around it."""
+        highlighter = self.highlighter
+        if highlighter is None:
+            return
+        first, last = self._visible_lines()
+        names = ["syntax_" + tag for tag in highlighter.tags]
+        with TagBatch(self.text_area) as batch:
+            for start, end in filter(None, (self._highlight_region, (first, last))):
+                for name in set(names):
+                    batch.remove(name, (start, 0), (end + 1, 0))
+            for line in range(first, min(last, highlighter.valid) + 1):
+                spans = highlighter.spans[line - 1]
+                for k in range(0, len(spans), 3):
+                    batch.add(names[spans[k]], (line, spans[k + 1]), (line, spans[k + 2]))
+        self._highlight_region = (first, last)
+
+    @staticmethod
+    def _local_index(line_starts, first, offset):
+        """Convert an offset to line.col using the start offsets of lines from first."""
+        k = min(bisect_right(line_starts, offset) - 1, len(line_starts) - 2)
+        return f"{first + k}.{offset - line_starts[k]}"
+
+    def go_to_line(self, line=None):
+        """Move the cursor to the start of a line, asking for its number when none is given."""
+        total = self.large_file.total if self.large_file else self.document.stats.lines
+        if line is None:
+            answer = askstring("Go To Line", f"Enter line number (1-{total}):")
+            if answer is None:
+                return
+            try:
+                line = int(answer)
+                if not 1 <= line <= total:
+                    raise ValueError("Line number out of range")
+            except ValueError:
+                messagebox.showerror("Error", "Invalid line number")
+                return
+        if self.large_file:
+            view = self.large_file
+            if not view.start < line <= view.start + view.count:
+                self._slide_large_window(line - 1)
+            line -= view.start
+        index = f"{line}.0"
+        self.text_area.mark_set("insert", index)
+        self.text_area.see(index)
+        self.text_area.focus_set()
+        self.app.refresh.request("status")
+
+    def _outline_edit(self, edit):
+        """Refresh the outline after edits that add, remove or move headings."""
+        if not self.app.outline_var.get():
+            return
+        if edit.kind == "reset" or edit.start[0] != edit.end[0] or \
+                self.document.stats.headings_version != self.outline_version:
+            self.app.refresh.request("outline")
+
+    def increase_font_size(self):
+        current_font = font.Font(self.text_area, self.text_area.cget("font"))
+        current_size = current_font.actual("size")
+        new_size = min(current_size + 2, 72)
+        self.text_area.config(font=(current_font.actual("family"), new_size))
+        self.app.refresh.request("status")
+
+    def decrease_font_size(self):
+        current_font = font.Font(self.text_area, self.text_area.cget("font"))
+        current_size = current_font.actual("size")
+        new_size = max(current_size - 2, 8)
+        self.text_area.config(font=(current_font.actual("family"), new_size))
+        self.app.refresh.request("status")
+
+    def toggle_word_wrap(self):
+        self.word_wrap = not self.word_wrap
+        wrap_mode = 'word' if self.word_wrap else 'none'
+        self.text_area.config(wrap=wrap_mode)
+        self.app.refresh.request("status")
+
+    def insert_table(self):
+        """Insert a table with user-specified rows and columns."""
+        rows = askstring("Table Rows", "Enter number of rows:")
+        cols = askstring("Table Columns", "Enter number of columns:")
+        try:
+            rows = int(rows)
+            cols = int(cols)
+            if rows < 1 or cols < 1:
+                raise ValueError("Rows and columns must be positive integers")
+        except (ValueError, TypeError):
+            messagebox.showerror("Error", "Invalid number of rows or columns")
+            return
+        self.embed_table(self.text_area.index("insert"), TableModel(rows, cols))
+        self.app.refresh.request("status")
+
+    def embed_table(self, index, model):
+        """Embed a table view for model at index and return it."""
+        view = TableView(self.text_area, model, on_select=self._select_table)
+        self.tables[str(view)] = view
+        # Tk destroys the view when its character is deleted; undo keeps the model and embeds a new view
+        view.bind("<Destroy>", lambda event: self._forget_table(view), add="+")
+        self.text_area.window_create(index, window=view)
+        return view
+
+    def _forget_table(self, view):
+        self.tables.pop(str(view), None)
+        if self.current_table is view:
+            self.current_table = None
+
+    def _select_table(self, view):
+        self.current_table = view
+
+    def _tables_in_order(self):
+        """Return the embedded tables in document order."""
+        names = [name for name in self.text_area.window_names() if name in self.tables]
+        return [self.tables[name] for name in sorted(names, key=lambda name: parse_index(self.text_area.index(name)))]
+
+    def table_shading(self):
+        """Apply shading to the selected table cell, or else to the selected text."""
+        if self.current_table and self.current_table.selected and self.current_table.winfo_exists():
+            color = colorchooser.askcolor(title="Choose Shading Color")[1]
+            if color:
+                self.current_table.shade_selected(color)
+            return
+        try:
+            color = colorchooser.askcolor(title="Choose Shading Color")[1]
+            if color:
+                start, end = self.text_area.index("sel.first"), self.text_area.index("sel.last")
+                before = self.capture_tags(start, end)
+                self.text_area.tag_add("table_shading", start, end)
+                self.text_area.tag_configure("table_shading", background=color)
+                self.history.record(["format", start, end, before, self.capture_tags(start, end)])
+        except tk.TclError:
+            messagebox.showwarning("Warning", "No text selected or not in a table")
+
+    def insert_wordart(self):
+        """Insert WordArt text with stylized effects."""
+        text = askstring("WordArt", "Enter text for WordArt:")
+        if text:
+            try:
+                color = colorchooser.askcolor(title="Choose WordArt Color")[1]
+                font_name = askstring("Font", "Enter font name (e.g., Arial):")
+                font_size = int(askstring("Font Size", "Enter font size (e.g., 14):"))
+                style = TextStyle(font_name, font_size, "bold", "roman", False, color)
+                cursor_pos = self.text_area.index("insert")
+                self.text_area.insert(cursor_pos, text, ("wordart", self.app.styles.tag_for(style)), "\n", ())
+                self.app.refresh.request("status")
+            except (ValueError, TypeError):
+                messagebox.showerror("Error", "Invalid font size or input")
+
+    def start_draw_line(self):
+        self.drawing = "line"
+        self.canvas.config(cursor="cross")
+
+    def start_draw_rectangle(self):
+        self.drawing = "rectangle"
+        self.canvas.config(cursor="cross")
+
+    def start_draw_circle(self):
+        self.drawing = "circle"
+        self.canvas.config(cursor="cross")
+
+    def start_draw_freehand(self):
+        self.drawing = "freehand"
+        self.canvas.config(cursor="pencil")
+
+    def on_mouse_press(self, event):
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        self.drag_refresh.requested = self.drag_refresh.executed = 0
+        if self.drawing:
+            self.deselect_shape()
+            self.start_x = x
+            self.start_y = y
+            self.drag_pointer = (x, y)
+            self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
+            # One preview item per drag, reshaped with coords() as the pointer moves
+            if self.drawing == "freehand":
+                self.stroke = [x, y]
+                self.current_shape = self.canvas.create_line(
+                    x, y, x, y, fill=self.app.accent_color, width=2, capstyle="round", joinstyle="round"
+                )
+            elif self.drawing == "line":
+                self.current_shape = self.canvas.create_line(x, y, x, y, fill=self.app.accent_color, width=2)
+            elif self.drawing == "rectangle":
+                self.current_shape = self.canvas.create_rectangle(x, y, x, y, outline=self.app.accent_color, width=2)
+            elif self.drawing == "circle":
+                self.current_shape = self.canvas.create_oval(x, y, x, y, outline=self.app.accent_color, width=2)
+            return
+        shape = self.selected_shape
+        handle = shape is not None and "handle" in self.canvas.gettags(self.canvas.find_withtag("current"))
+        if not handle:
+            shape = self.shapes.hit_test(x, y)
+            self.select_shape(shape)
+        if shape is not None:
+            self.drag_pointer = (x, y)
+            self._shape_drag = (handle, x, y, list(shape.coords), shape.bbox)
+            self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
+
+    def on_mouse_drag(self, event):
+        """Record the pointer and leave the redraw to the next drag refresh pass."""
+        self.drag_pointer = (self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        if self.drawing == "freehand" and self.stroke is not None:
+            self.stroke += self.drag_pointer
+        self.drag_refresh.request("drag")
+
+    def _render_drag(self):
+        """Bring the drag preview or the dragged shape up to the latest pointer position."""
+        end_x, end_y = self.drag_pointer
+        if self.drawing and self.current_shape:
+            if self.drawing == "freehand":
+                self.canvas.coords(self.current_shape, *self.stroke)
+            else:
+                self.canvas.coords(self.current_shape, self.start_x, self.start_y, end_x, end_y)
+        elif self.selected_shape is not None and self._shape_drag:
+            shape = self.selected_shape
+            handle, start_x, start_y, coords, box = self._shape_drag
+            dx = end_x - start_x
+            dy = end_y - start_y
+            if handle:
+                self.shapes.resize(shape, coords, box, (box[0], box[1], max(box[2] + dx, box[0] + 1),
+                                                        max(box[3] + dy, box[1] + 1)))
+            else:
+                self.shapes.move(shape, coords[0] + dx - shape.coords[0], coords[1] + dy - shape.coords[1])
+            self._draw_selection()
+
+    def on_mouse_release(self, event):
+        self.drag_refresh.flush()
+        self.drag_stats = {"motion_events": self.drag_refresh.requested, "redraws": self.drag_refresh.executed}
+        if self.drawing and self.start_x is not None:
+            end_x = self.canvas.canvasx(event.x)
+            end_y = self.canvas.canvasy(event.y)
+            if self.current_shape:
+                self.canvas.delete(self.current_shape)
+            coords = (self.start_x, self.start_y, end_x, end_y)
+            if self.drawing == "line":
+                shape = self.shapes.add("line", coords, {"fill": self.app.accent_color, "width": 2})
+            elif self.drawing == "rectangle":
+                shape = self.shapes.add("rectangle", coords, {"outline": self.app.accent_color, "width": 2})
+            elif self.drawing == "circle":
+                shape = self.shapes.add("oval", coords, {"outline": self.app.accent_color, "width": 2})
+            else:
+                self.stroke += (end_x, end_y)
+                shape = self.shapes.add("freehand", simplify_stroke(self.stroke), {
+                    "fill": self.app.accent_color, "width": 2, "capstyle": "round", "joinstyle": "round"
+                })
+                self.stroke = None
+            self.history.record(["shape_add", shape])
+            self.drawing = None
+            self.start_x = None
+            self.start_y = None
+            self.canvas.config(cursor="")
+        elif self._shape_drag and self.selected_shape is not None and \
+                self.selected_shape.coords != self._shape_drag[3]:
+            self.history.record(["shape_coords", self.selected_shape, self._shape_drag[3],
+                                 list(self.selected_shape.coords)])
+        self._shape_drag = None
+        self.current_shape = None
+        self.canvas.unbind("<B1-Motion>")
+
+    def select_shape(self, shape):
+        self.selected_shape = shape
+        self._draw_selection()
+        if shape is not None:
+            self.canvas.focus_set()
+
+    def deselect_shape(self):
+        self.select_shape(None)
+
+    def delete_selected_shape(self, event=None):
+        if self.selected_shape is not None:
+            self.history.record(["shape_remove", self.selected_shape])
+            self.shapes.remove(self.selected_shape)
+            self.deselect_shape()
+
+    def _draw_selection(self):
+        """Draw a dashed box and a resize handle around the selected shape."""
+        if self.selected_shape is None:
+            self.canvas.delete("selection")
+            self._selection_items = None
+            return
+        x0, y0, x1, y1 = self.selected_shape.bbox
+        if self._selection_items is None:
+            self._selection_items = (
+                self.canvas.create_rectangle(0, 0, 0, 0, outline="#0078d4", dash=(3, 2), tags="selection"),
+                self.canvas.create_rectangle(0, 0, 0, 0, fill="#0078d4", outline="", tags=("selection", "handle")),
+            )
+        frame, handle = self._selection_items
+        self.canvas.coords(frame, x0 - 3, y0 - 3, x1 + 3, y1 + 3)
+        self.canvas.coords(handle, x1, y1, x1 + 6, y1 + 6)
+        self.canvas.tag_raise("selection")
+
 
 class WordProcessor:
-    def __init__(self, root):
+    def __init__(self, root, journal_dir=None):
         self.root = root
+        # Crash-recovery journals of all tabs are kept here
+        self.journal_dir = journal_dir or JOURNAL_DIR
         self.root.title("ProWrite - Word Processor")
         self.root.geometry("1000x700")
         self.root.minsize(800, 600)
 
-        # Apply modern theme
-        self.root.set_theme('arc')
-
         # Fonts and colors
         self.default_font = ("Segoe UI", 12)
         self.bg_color = "#f5f5f5"
@@ -23,48 +4030,54 @@ class WordProcessor:
 
         # Create main container
         self.main_frame = ttk.Frame(self.root)
-        self.main_frame.pack(expand=True, fill='both', padx=10, pady=10)
-        
-        # Load icons before creating the toolbar
-        self.icons = self.load_icons()
-
-        # Create toolbar
-        self.create_toolbar()
-
-        # Create main frame for text and canvas
-        self.content_frame = ttk.Frame(self.main_frame)
-        self.content_frame.pack(expand=True, fill='both')
-
-        # Create Text Area
-        self.text_area = tk.Text(
-            self.content_frame,
-            wrap='word',
-            font=self.default_font,
-            undo=True,
-            bd=0,
-            relief="flat",
-            bg="white",
-            fg="black",
-            insertbackground="black",
-            selectbackground=self.accent_color
-        )
-        self.text_area.pack(side="left", expand=True, fill='both', padx=(0, 5))
-
-        # Create Canvas for drawing
-        self.canvas = tk.Canvas(
-            self.content_frame,
-            bg="white",
-            width=200,
-            bd=1,
-            relief="flat",
-            highlightthickness=1,
-            highlightbackground="#d3d3d3"
-        )
-        self.canvas.pack(side="right", fill="y")
+        self.main_frame.pack(expand=True, fill='both', padx=10, pady=10)
+
+        # Create toolbar; its icons are loaded in the background once the window is up
+        self.icons = {}
+        self.create_toolbar()
+
+        # Each document lives in its own notebook tab
+        self.notebook = ttk.Notebook(self.main_frame)
+        self.notebook.pack(expand=True, fill='both')
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self.tabs = []
+        self.max_live_tabs = 8
+
+        # Outline of the active document's headings, shown on demand beside the tabs
+        self.outline_var = tk.BooleanVar(value=False)
+        self.outline_frame = ttk.Frame(self.main_frame)
+        self.outline = ttk.Treeview(self.outline_frame, show="tree", selectmode="browse")
+        outline_scrollbar = ttk.Scrollbar(self.outline_frame, orient="vertical", command=self.outline.yview)
+        self.outline.config(yscrollcommand=outline_scrollbar.set)
+        outline_scrollbar.pack(side="right", fill="y")
+        self.outline.pack(side="left", expand=True, fill="both")
+        self.outline.column("#0", width=220)
+        self.outline.bind("<ButtonRelease-1>", self._on_outline_click)
+
+        # All view refreshes go through one coalescing scheduler
+        self.refresh = RefreshScheduler(self.root, max_rate=30)
+        self.refresh.register("status", self.update_status_bar)
+        self.refresh.register("viewport", lambda: self.tab.refresh_viewport())
+        self.refresh.register("outline", self._refresh_outline)
+
+        # Highlighting rules per file type, extended from the user's configuration
+        try:
+            self.highlight_languages = load_highlight_languages()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to read highlighting rules: {e}")
+            self.highlight_languages = dict(HIGHLIGHT_LANGUAGES)
+        self.highlight_var = tk.StringVar(value="None")
+
+        # Follow mode appends what is written to the open file; older lines beyond the limit are trimmed
+        self.follow_var = tk.BooleanVar(value=False)
+        self.follow_max_lines = None
 
         # Create Menu Bar
         self.create_menu_bar()
 
+        # Find bar, shown above the text area on demand
+        self.create_find_bar()
+
         # Status Bar
         self.status_bar = ttk.Label(
             self.root,
@@ -74,39 +4087,106 @@ class WordProcessor:
         )
         self.status_bar.pack(side="bottom", fill="x")
 
-        # Initialize variables
-        self.file_path = None
-        self.drawing = None
-        self.word_wrap = True
-        self.start_x = None
-        self.start_y = None
-        self.current_table = None
+        # Worker pool and character styles are shared by all tabs
+        self.runner = TaskRunner(self.root)
+        self.styles = StyleRegistry(self.root)
+        self.status_message = None
+        self._status_message_timer = None
 
-        # Bind events
-        self.canvas.bind("<ButtonPress-1>", self.on_mouse_press)
-        self.canvas.bind("<ButtonRelease-1>", self.on_mouse_release)
-        self.text_area.bind("<KeyRelease>", self.update_status_bar)
-        self.text_area.bind("<ButtonRelease-1>", self.update_status_bar)
+        self.new_tab()
 
-        # Load icons
-        self.icons = self.load_icons()
+        # Journal edits for crash recovery and flush them periodically
+        self.autosave_interval = 5000
+        self.root.after(self.autosave_interval, self._autosave)
+        self.root.after_idle(self.offer_recovery)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
 
-        # Configure text area tags for tables and WordArt
-        self.text_area.tag_configure("table_cell", font=self.default_font, borderwidth=1, relief="solid")
-        self.text_area.tag_configure("wordart", font=("Arial", 14, "bold"), foreground=self.accent_color)
+        # Apply the theme and load icons once the window is up; importing ttkthemes is slow
+        self.root.after_idle(self.apply_theme, "arc")
+        self.root.after_idle(self.load_icons)
 
-    def load_icons(self):
-        """Load icons for toolbar buttons."""
-        icon_dir = "icons"  # Ensure you have an 'icons' folder with PNG images
-        icons = {}
-        icon_names = ["save", "undo", "cut", "copy", "paste", "bold", "italic", "underline", "table", "wordart"]
-        for name in icon_names:
+    def new_tab(self):
+        """Open an empty document in a new tab and make it the active one."""
+        tab = DocumentTab(self)
+        self.tabs.append(tab)
+        self.tab = tab
+        self.notebook.add(tab.frame, text="Untitled")
+        self.notebook.select(tab.frame)
+        return tab
+
+    def close_tab(self):
+        """Close the active tab, offering to save it first."""
+        if len(self.tab.document):
+            if messagebox.askyesno("Save File", "Do you want to save the current document?"):
+                self.tab.save_file()
+        tab = self.tab
+        tab.close()
+        self.tabs.remove(tab)
+        if not self.tabs:
+            self.new_tab()
+        self.notebook.forget(tab.frame)
+        tab.frame.destroy()
+        self._on_tab_changed()
+
+    def _on_tab_changed(self, event=None):
+        selected = self.notebook.select()
+        for tab in self.tabs:
+            if str(tab.frame) == selected:
+                break
+        else:
+            return
+        self.tab = tab
+        if tab.suspended is not None:
             try:
-                img = Image.open(f"{icon_dir}/{name}.png").resize((20, 20), Image.Resampling.LANCZOS)
-                icons[name] = ImageTk.PhotoImage(img)
-            except FileNotFoundError:
-                icons[name] = None
-        return icons
+                tab.resume()
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Failed to restore document: {e}")
+        self.highlight_var.set(tab.highlight_language or "None")
+        self.follow_var.set(tab.follower is not None)
+        tab.last_active = time.monotonic()
+        self._suspend_idle_tabs()
+        self.refresh.request()
+
+    def suspend_tab(self, tab):
+        """Release a background tab's text and drawing to a snapshot file.
+
+        Tabs that are loading, saving, following, in large file mode or visible are left
+        alone. The tab's undo history is dropped.
+        """
+        if tab is self.tab or tab.suspended is not None or tab.loader or tab.large_file or tab.follower:
+            return False
+        tab.suspend()
+        return True
+
+    def _suspend_idle_tabs(self):
+        live = [tab for tab in self.tabs if tab.suspended is None and tab is not self.tab]
+        live.sort(key=lambda tab: tab.last_active)
+        for tab in live[:max(len(live) + 1 - self.max_live_tabs, 0)]:
+            self.suspend_tab(tab)
+
+    def suspend_inactive_tabs(self):
+        for tab in self.tabs:
+            self.suspend_tab(tab)
+
+    def apply_theme(self, theme):
+        """Apply a ttkthemes theme, importing ttkthemes only when it is needed."""
+        try:
+            from ttkthemes import ThemedStyle
+        except ImportError:
+            return
+        ThemedStyle(self.root).set_theme(theme)
+
+    def load_icons(self):
+        """Load icons for toolbar buttons in the background."""
+        self.runner.submit(load_icon_data, list(self.toolbar_buttons), on_done=self._attach_icons)
+
+    def _attach_icons(self, icons, error):
+        if error:
+            return
+        for name, data in icons.items():
+            if data is not None:
+                self.icons[name] = tk.PhotoImage(data=base64.b64encode(data), format="png")
+                self.toolbar_buttons[name].config(image=self.icons[name])
 
     def create_toolbar(self):
         """Create a styled toolbar with icons."""
@@ -114,18 +4194,19 @@ class WordProcessor:
         self.toolbar.pack(side="top", fill="x", padx=5, pady=5)
 
         buttons = [
-            ("Save", self.save_file, "save"),
-            ("Undo", self.undo, "undo"),
-            ("Cut", self.cut, "cut"),
-            ("Copy", self.copy, "copy"),
-            ("Paste", self.paste, "paste"),
-            ("Bold", self.bold_text, "bold"),
-            ("Italic", self.italic_text, "italic"),
-            ("Underline", self.underline_text, "underline"),
-            ("Insert Table", self.insert_table, "table"),
-            ("Insert WordArt", self.insert_wordart, "wordart")
+            ("Save", lambda: self.tab.save_file(), "save"),
+            ("Undo", lambda: self.tab.undo(), "undo"),
+            ("Cut", lambda: self.tab.cut(), "cut"),
+            ("Copy", lambda: self.tab.copy(), "copy"),
+            ("Paste", lambda: self.tab.paste(), "paste"),
+            ("Bold", lambda: self.tab.bold_text(), "bold"),
+            ("Italic", lambda: self.tab.italic_text(), "italic"),
+            ("Underline", lambda: self.tab.underline_text(), "underline"),
+            ("Insert Table", lambda: self.tab.insert_table(), "table"),
+            ("Insert WordArt", lambda: self.tab.insert_wordart(), "wordart")
         ]
 
+        self.toolbar_buttons = {}
         for text, command, icon_key in buttons:
             btn = ttk.Button(
                 self.toolbar,
@@ -134,6 +4215,7 @@ class WordProcessor:
                 compound="left",
                 command=command
             )
+            self.toolbar_buttons[icon_key] = btn
             btn.pack(side="left", padx=2, pady=2)
             btn.bind("<Enter>", lambda e, b=btn: b.config(style="Hover.TButton"))
             btn.bind("<Leave>", lambda e, b=btn: b.config(style="TButton"))
@@ -150,353 +4232,669 @@ class WordProcessor:
         # File menu
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
-        self.file_menu.add_command(label="New", command=self.new_file, accelerator="Ctrl+N")
+        self.file_menu.add_command(label="New", command=lambda: self.tab.new_file(), accelerator="Ctrl+N")
+        self.file_menu.add_command(label="New Tab", command=self.new_tab, accelerator="Ctrl+T")
         self.file_menu.add_command(label="Open", command=self.open_file, accelerator="Ctrl+O")
-        self.file_menu.add_command(label="Save", command=self.save_file, accelerator="Ctrl+S")
+        self.file_menu.add_command(label="Open Large File...", command=self.open_large_file)
+        self.file_menu.add_command(label="Import CSV as Table...", command=self.import_csv)
+        self.file_menu.add_command(label="Save", command=lambda: self.tab.save_file(), accelerator="Ctrl+S")
+        self.file_menu.add_separator()
+        self.file_menu.add_checkbutton(label="Follow File", variable=self.follow_var,
+                                       command=lambda: self.tab.toggle_follow())
+        self.file_menu.add_command(label="Follow Line Limit...", command=self.set_follow_limit)
         self.file_menu.add_separator()
-        self.file_menu.add_command(label="Exit", command=self.root.quit)
+        self.file_menu.add_command(label="Close Tab", command=self.close_tab, accelerator="Ctrl+W")
+        self.file_menu.add_command(label="Suspend Inactive Tabs", command=self.suspend_inactive_tabs)
+        self.file_menu.add_command(label="Exit", command=self.exit_app)
 
         # Edit menu
         self.edit_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="Edit", menu=self.edit_menu)
-        self.edit_menu.add_command(label="Undo", command=self.undo, accelerator="Ctrl+Z")
-        self.edit_menu.add_command(label="Redo", command=self.redo, accelerator="Ctrl+Y")
+        self.edit_menu.add_command(label="Undo", command=lambda: self.tab.undo(), accelerator="Ctrl+Z")
+        self.edit_menu.add_command(label="Redo", command=lambda: self.tab.redo(), accelerator="Ctrl+Y")
         self.edit_menu.add_separator()
-        self.edit_menu.add_command(label="Cut", command=self.cut, accelerator="Ctrl+X")
-        self.edit_menu.add_command(label="Copy", command=self.copy, accelerator="Ctrl+C")
-        self.edit_menu.add_command(label="Paste", command=self.paste, accelerator="Ctrl+V")
+        self.edit_menu.add_command(label="Cut", command=lambda: self.tab.cut(), accelerator="Ctrl+X")
+        self.edit_menu.add_command(label="Copy", command=lambda: self.tab.copy(), accelerator="Ctrl+C")
+        self.edit_menu.add_command(label="Paste", command=lambda: self.tab.paste(), accelerator="Ctrl+V")
         self.edit_menu.add_command(label="Find", command=self.search_text, accelerator="Ctrl+F")
+        self.edit_menu.add_command(label="Replace", command=self.replace_text, accelerator="Ctrl+R")
+        self.edit_menu.add_command(label="Go To Line...", command=lambda: self.tab.go_to_line(), accelerator="Ctrl+G")
+        self.edit_menu.add_checkbutton(label="Show Outline", variable=self.outline_var, command=self.toggle_outline)
+        self.edit_menu.add_separator()
+        self.edit_menu.add_command(label="Word Count", command=lambda: self.tab.show_word_count())
+        self.edit_menu.add_command(label="Undo History...", command=lambda: self.tab.show_undo_history())
 
         # Format menu
         self.format_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="Format", menu=self.format_menu)
-        self.format_menu.add_command(label="Bold", command=self.bold_text, accelerator="Ctrl+B")
-        self.format_menu.add_command(label="Italic", command=self.italic_text, accelerator="Ctrl+I")
-        self.format_menu.add_command(label="Underline", command=self.underline_text, accelerator="Ctrl+U")
+        self.format_menu.add_command(label="Bold", command=lambda: self.tab.bold_text(), accelerator="Ctrl+B")
+        self.format_menu.add_command(label="Italic", command=lambda: self.tab.italic_text(), accelerator="Ctrl+I")
+        self.format_menu.add_command(label="Underline", command=lambda: self.tab.underline_text(), accelerator="Ctrl+U")
         self.format_menu.add_separator()
-        self.format_menu.add_command(label="Font", command=self.change_font)
-        self.format_menu.add_command(label="Text Color", command=self.change_color)
-        self.format_menu.add_command(label="Table Shading", command=self.table_shading)
+        self.format_menu.add_command(label="Font", command=lambda: self.tab.change_font())
+        self.format_menu.add_command(label="Text Color", command=lambda: self.tab.change_color())
+        self.format_menu.add_command(label="Table Shading", command=lambda: self.tab.table_shading())
         self.format_menu.add_separator()
-        self.format_menu.add_command(label="Increase Font Size", command=self.increase_font_size)
-        self.format_menu.add_command(label="Decrease Font Size", command=self.decrease_font_size)
-        self.format_menu.add_command(label="Toggle Word Wrap", command=self.toggle_word_wrap)
+        self.format_menu.add_command(label="Increase Font Size", command=lambda: self.tab.increase_font_size())
+        self.format_menu.add_command(label="Decrease Font Size", command=lambda: self.tab.decrease_font_size())
+        self.format_menu.add_command(label="Toggle Word Wrap", command=lambda: self.tab.toggle_word_wrap())
+        self.highlight_menu = tk.Menu(self.format_menu, tearoff=0)
+        self.format_menu.add_cascade(label="Syntax Highlighting", menu=self.highlight_menu)
+        self.highlight_menu.add_radiobutton(label="None", value="None", variable=self.highlight_var,
+                                            command=lambda: self.tab.set_highlighting(None))
+        for name in self.highlight_languages:
+            self.highlight_menu.add_radiobutton(label=name, value=name, variable=self.highlight_var,
+                                                command=lambda name=name: self.tab.set_highlighting(name))
 
         # Draw menu
         self.draw_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="Draw", menu=self.draw_menu)
-        self.draw_menu.add_command(label="Draw Line", command=self.start_draw_line)
-        self.draw_menu.add_command(label="Draw Rectangle", command=self.start_draw_rectangle)
-        self.draw_menu.add_command(label="Draw Circle", command=self.start_draw_circle)
+        self.draw_menu.add_command(label="Draw Line", command=lambda: self.tab.start_draw_line())
+        self.draw_menu.add_command(label="Draw Rectangle", command=lambda: self.tab.start_draw_rectangle())
+        self.draw_menu.add_command(label="Draw Circle", command=lambda: self.tab.start_draw_circle())
+        self.draw_menu.add_command(label="Freehand Pen", command=lambda: self.tab.start_draw_freehand())
 
         # Bind keyboard shortcuts
-        self.root.bind("<Control-n>", lambda e: self.new_file())
+        self.root.bind("<Control-n>", lambda e: self.tab.new_file())
+        self.root.bind("<Control-t>", lambda e: self.new_tab())
+        self.root.bind("<Control-w>", lambda e: self.close_tab())
         self.root.bind("<Control-o>", lambda e: self.open_file())
-        self.root.bind("<Control-s>", lambda e: self.save_file())
-        self.root.bind("<Control-z>", lambda e: self.undo())
-        self.root.bind("<Control-y>", lambda e: self.redo())
-        self.root.bind("<Control-x>", lambda e: self.cut())
-        self.root.bind("<Control-c>", lambda e: self.copy())
-        self.root.bind("<Control-v>", lambda e: self.paste())
+        self.root.bind("<Control-s>", lambda e: self.tab.save_file())
+        self.root.bind("<Control-z>", lambda e: self.tab.undo())
+        self.root.bind("<Control-y>", lambda e: self.tab.redo())
+        self.root.bind("<Control-x>", lambda e: self.tab.cut())
+        self.root.bind("<Control-c>", lambda e: self.tab.copy())
+        self.root.bind("<Control-v>", lambda e: self.tab.paste())
         self.root.bind("<Control-f>", lambda e: self.search_text())
-        self.root.bind("<Control-b>", lambda e: self.bold_text())
-        self.root.bind("<Control-i>", lambda e: self.italic_text())
-        self.root.bind("<Control-u>", lambda e: self.underline_text())
-
-    def new_file(self):
-        if self.text_area.get("1.0", "end-1c"):
-            if messagebox.askyesno("Save File", "Do you want to save the current document?"):
-                self.save_file()
-        self.text_area.delete(1.0, "end")
-        self.canvas.delete("all")
-        self.file_path = None
-        self.update_status_bar()
+        self.root.bind("<Control-r>", lambda e: self.replace_text())
+        self.root.bind("<Control-g>", lambda e: self.tab.go_to_line())
+        self.root.bind("<Control-b>", lambda e: self.tab.bold_text())
+        self.root.bind("<Control-i>", lambda e: self.tab.italic_text())
+        self.root.bind("<Control-u>", lambda e: self.tab.underline_text())
 
     def open_file(self):
         file_path = filedialog.askopenfilename(
             defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("Text files", "*.txt"), ("ProWrite documents", "*.pwd"), ("All files", "*.*")]
         )
         if file_path:
-            try:
-                with open(file_path, "r", encoding="utf-8") as file:
-                    content = file.read()
-                self.text_area.delete(1.0, "end")
-                self.text_area.insert(1.0, content)
-                self.file_path = file_path
-                self.update_status_bar()
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to open file: {e}")
+            self._open_target_tab()
+            if file_path.lower().endswith(DOCUMENT_EXTENSION):
+                self.tab.load_document(file_path)
+            else:
+                self.tab.load_file(file_path)
 
-    def save_file(self):
-        if not self.file_path:
-            self.file_path = filedialog.asksaveasfilename(
-                defaultextension=".txt",
-                filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
-            )
-        if self.file_path:
-            try:
-                with open(self.file_path, "w", encoding="utf-8") as file:
-                    content = self.text_area.get("1.0", "end-1c")
-                    file.write(content)
-                messagebox.showinfo("Success", "File saved successfully")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {e}")
+    def _open_target_tab(self):
+        """Open a new tab for a file unless the active one is an empty, untitled document."""
+        if len(self.tab.document) or self.tab.file_path or self.tab.large_file or self.tab.loader:
+            self.new_tab()
 
-    def undo(self):
-        try:
-            self.text_area.edit_undo()
-        except Exception:
-            pass
+    def import_csv(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv"), ("TSV files", "*.tsv *.tab"), ("All files", "*.*")]
+        )
+        if file_path:
+            self.tab.load_csv(file_path)
 
-    def redo(self):
+    def set_follow_limit(self):
+        """Ask for the number of lines to keep while following."""
+        limit = askstring("Follow Line Limit", "Keep at most this many lines while following (0 for no limit):",
+                          initialvalue=str(self.follow_max_lines or 0))
+        if limit is None:
+            return
         try:
-            self.text_area.edit_redo()
-        except Exception:
-            pass
+            limit = int(limit)
+            if limit < 0:
+                raise ValueError("The line limit must not be negative")
+        except ValueError:
+            messagebox.showerror("Error", "Invalid line limit")
+            return
+        self.follow_max_lines = limit or None
+        if self.tab.follower:
+            self.tab.trim_followed_lines()
 
-    def cut(self):
-        self.text_area.event_generate("<<Cut>>")
-        self.update_status_bar()
+    def open_large_file(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("Text files", "*.txt"), ("Log files", "*.log"), ("All files", "*.*")]
+        )
+        if file_path:
+            self._open_target_tab()
+            self.tab.load_large_file(file_path)
 
-    def copy(self):
-        self.text_area.event_generate("<<Copy>>")
+    def _autosave(self):
+        for tab in self.tabs:
+            tab.journal.flush()
+        self.root.after(self.autosave_interval, self._autosave)
 
-    def paste(self):
-        self.text_area.event_generate("<<Paste>>")
-        self.update_status_bar()
+    def offer_recovery(self):
+        """Offer to restore a document from a journal left by a crashed session."""
+        if not os.path.isdir(self.journal_dir):
+            return
+        for name in sorted(os.listdir(self.journal_dir)):
+            journal_path = os.path.join(self.journal_dir, name)
+            if not name.endswith(".pwj") or EditJournal.owner_alive(journal_path):
+                # Journals of this or another running editor are still being written
+                continue
+            try:
+                header, ops = EditJournal.read(journal_path)
+                base_path = header.get("path")
+                if ops and messagebox.askyesno(
+                        "Recover Document",
+                        f"Recover unsaved changes to {base_path or 'an untitled document'}?"):
+                    base_text = ""
+                    if base_path and os.path.exists(base_path):
+                        base_text = read_text_file(base_path)
+                    text = EditJournal.replay(base_text, ops)
+                    self.tab.text_area.delete("1.0", "end")
+                    self.tab.text_area.insert("1.0", text)
+                    self.tab.file_path = base_path
+                    os.remove(journal_path)
+                    return
+                os.remove(journal_path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Failed to recover document: {e}")
 
-    def bold_text(self):
-        try:
-            current_tags = self.text_area.tag_names("sel.first")
-            if "bold" in current_tags:
-                self.text_area.tag_remove("bold", "sel.first", "sel.last")
-            else:
-                self.text_area.tag_add("bold", "sel.first", "sel.last")
-                bold_font = font.Font(self.text_area, self.text_area.cget("font"))
-                bold_font.config(weight="bold")
-                self.text_area.tag_configure("bold", font=bold_font)
-        except tk.TclError:
-            messagebox.showwarning("Warning", "No text selected")
+    def exit_app(self):
+        for tab in self.tabs:
+            tab.close()
+        self.runner.shutdown()
+        self.root.quit()
 
-    def italic_text(self):
-        try:
-            current_tags = self.text_area.tag_names("sel.first")
-            if "italic" in current_tags:
-                self.text_area.tag_remove("italic", "sel.first", "sel.last")
-            else:
-                self.text_area.tag_add("italic", "sel.first", "sel.last")
-                italic_font = font.Font(self.text_area, self.text_area.cget("font"))
-                italic_font.config(slant="italic")
-                self.text_area.tag_configure("italic", font=italic_font)
-        except tk.TclError:
-            messagebox.showwarning("Warning", "No text selected")
+    def show_status_message(self, message, duration=3000):
+        """Show a transient message in the status bar; duration=None keeps it."""
+        if self._status_message_timer is not None:
+            self.root.after_cancel(self._status_message_timer)
+            self._status_message_timer = None
+        self.status_message = message
+        if message and duration:
+            self._status_message_timer = self.root.after(duration, self.show_status_message, None)
+        self.refresh.request("status")
 
-    def underline_text(self):
-        try:
-            current_tags = self.text_area.tag_names("sel.first")
-            if "underline" in current_tags:
-                self.text_area.tag_remove("underline", "sel.first", "sel.last")
-            else:
-                self.text_area.tag_add("underline", "sel.first", "sel.last")
-                underline_font = font.Font(self.text_area, self.text_area.cget("font"))
-                underline_font.config(underline=True)
-                self.text_area.tag_configure("underline", font=underline_font)
-        except tk.TclError:
-            messagebox.showwarning("Warning", "No text selected")
+    def create_find_bar(self):
+        """Create the find bar with its search options."""
+        self.find_bar = ttk.Frame(self.main_frame, padding=(0, 2))
+        self.find_var = tk.StringVar()
+        self.find_regex = tk.BooleanVar(value=False)
+        self.find_case = tk.BooleanVar(value=False)
+        self.find_word = tk.BooleanVar(value=False)
+        self.replace_var = tk.StringVar()
 
-    def change_font(self):
-        font_name = askstring("Font", "Enter font name (e.g., Segoe UI):")
-        if font_name:
-            try:
-                font_size = askstring("Font Size", "Enter font size (e.g., 12):")
-                font_size = int(font_size)
-                self.text_area.config(font=(font_name, font_size))
-                self.update_status_bar()
-            except ValueError:
-                messagebox.showerror("Error", "Invalid font size")
+        find_row = ttk.Frame(self.find_bar)
+        find_row.pack(fill="x")
 
-    def change_color(self):
-        try:
-            color = colorchooser.askcolor(title="Choose Text Color")[1]
-            if color:
-                self.text_area.tag_add("color", "sel.first", "sel.last")
-                self.text_area.tag_configure("color", foreground=color)
-        except tk.TclError:
-            messagebox.showwarning("Warning", "No text selected")
+        ttk.Label(find_row, text="Find:").pack(side="left", padx=(0, 2))
+        self.find_entry = ttk.Entry(find_row, textvariable=self.find_var, width=30)
+        self.find_entry.pack(side="left", padx=2)
+        self.find_entry.bind("<Return>", lambda e: self.tab.find_next())
+        self.find_entry.bind("<Shift-Return>", lambda e: self.tab.find_previous())
+        self.find_entry.bind("<Escape>", lambda e: self.close_find_bar())
+        for text, var in (("Regex", self.find_regex), ("Match case", self.find_case), ("Whole word", self.find_word)):
+            ttk.Checkbutton(find_row, text=text, variable=var,
+                            command=lambda: self.tab.run_search()).pack(side="left", padx=2)
+        ttk.Button(find_row, text="Previous", command=lambda: self.tab.find_previous()).pack(side="left", padx=2)
+        ttk.Button(find_row, text="Next", command=lambda: self.tab.find_next()).pack(side="left", padx=2)
+        self.find_count = ttk.Label(find_row, text="")
+        self.find_count.pack(side="left", padx=5)
+        ttk.Button(find_row, text="Close", command=self.close_find_bar).pack(side="right", padx=2)
+
+        # Replace row, only shown by replace_text()
+        self.replace_row = ttk.Frame(self.find_bar)
+        ttk.Label(self.replace_row, text="Replace:").pack(side="left", padx=(0, 2))
+        self.replace_entry = ttk.Entry(self.replace_row, textvariable=self.replace_var, width=30)
+        self.replace_entry.pack(side="left", padx=2)
+        self.replace_entry.bind("<Return>", lambda e: self.tab.replace_next())
+        self.replace_entry.bind("<Escape>", lambda e: self.close_find_bar())
+        ttk.Button(self.replace_row, text="Replace", command=lambda: self.tab.replace_next()).pack(side="left", padx=2)
+        ttk.Button(self.replace_row, text="Replace All",
+                   command=lambda: self.tab.replace_all()).pack(side="left", padx=2)
 
     def search_text(self):
-        search_term = askstring("Search", "Enter search term:")
-        if search_term:
-            self.text_area.tag_remove("search", "1.0", "end")
-            start_pos = "1.0"
-            while True:
-                start_pos = self.text_area.search(search_term, start_pos, stopindex="end")
-                if not start_pos:
-                    break
-                end_pos = f"{start_pos}+{len(search_term)}c"
-                self.text_area.tag_add("search", start_pos, end_pos)
-                self.text_area.tag_configure("search", background="#FFFF99")
-                start_pos = end_pos
+        """Show the find bar."""
+        self.find_bar.pack(fill="x", before=self.notebook)
+        self.find_entry.focus_set()
+        self.find_entry.select_range(0, "end")
 
-    def increase_font_size(self):
-        current_font = font.Font(self.text_area, self.text_area.cget("font"))
-        current_size = current_font.actual("size")
-        new_size = min(current_size + 2, 72)
-        self.text_area.config(font=(current_font.actual("family"), new_size))
-        self.update_status_bar()
+    def replace_text(self):
+        """Show the find bar together with the replace row."""
+        self.replace_row.pack(fill="x", pady=(2, 0))
+        self.search_text()
 
-    def decrease_font_size(self):
-        current_font = font.Font(self.text_area, self.text_area.cget("font"))
-        current_size = current_font.actual("size")
-        new_size = max(current_size - 2, 8)
-        self.text_area.config(font=(current_font.actual("family"), new_size))
-        self.update_status_bar()
+    def close_find_bar(self):
+        self.replace_row.pack_forget()
+        self.find_bar.pack_forget()
+        self.tab.clear_search()
+        self.tab.text_area.focus_set()
 
-    def toggle_word_wrap(self):
-        self.word_wrap = not self.word_wrap
-        wrap_mode = 'word' if self.word_wrap else 'none'
-        self.text_area.config(wrap=wrap_mode)
-        self.update_status_bar()
+    def toggle_outline(self):
+        if self.outline_var.get():
+            self.outline_frame.pack(side="left", fill="y", padx=(0, 5), before=self.notebook)
+            self.tab.outline_version = None
+            self.refresh.request("outline")
+        else:
+            self.outline_frame.pack_forget()
 
-    def insert_table(self):
-        """Insert a table with user-specified rows and columns."""
-        rows = askstring("Table Rows", "Enter number of rows:")
-        cols = askstring("Table Columns", "Enter number of columns:")
-        try:
-            rows = int(rows)
-            cols = int(cols)
-            if rows < 1 or cols < 1:
-                raise ValueError("Rows and columns must be positive integers")
-        except (ValueError, TypeError):
-            messagebox.showerror("Error", "Invalid number of rows or columns")
+    def _refresh_outline(self):
+        """List the Markdown headings and WordArt lines of the active document, nested by level."""
+        if not self.outline_var.get() or self.tab.loader:
             return
-        #Default columnwidth
-        column_width=15
-
-        # Insert table structure using text widget
-        table_content = ""
-        for i in range(rows):
-            for j in range(cols):
-                cell_content = f"Cell {i+1},{j+1}"
-                table_content += f"{cell_content:<{column_width}}"
-                if j < cols - 1:
-                    table_content += "|"
-                table_content+="\n"
-            if i<rows-1:
-             table_content += "\n" + "-" * (column_width * cols + (cols - 1)) + "\n"
-
-        # Insert table at cursor position
-        cursor_pos = self.text_area.index("insert")
-        self.text_area.insert(cursor_pos, table_content)
-
-        # Apply table_cell tag to the inserted table
-        start_idx = cursor_pos
-        end_idx = f"{cursor_pos}+{len(table_content)}c"
-        self.text_area.tag_add("table_cell", start_idx, end_idx)
-        self.text_area.tag_configure("table_cell", font=("Courier", 12), lmargin1=10, lmargin2=10, spacing1=2, spacing3=2)
-        self.update_status_bar()
+        self.tab.outline_version = self.tab.document.stats.headings_version
+        levels = {line: level for line, level in enumerate(self.tab.document.stats.line_headings, 1) if level}
+        ranges = self.tab.text_area.tag_ranges("wordart")
+        for start in ranges[0::2]:
+            levels.setdefault(int(str(start).split(".")[0]), 1)
+        offset = self.tab.large_file.start if self.tab.large_file else 0
+        self.outline.delete(*self.outline.get_children())
+        parents = [""]
+        for line in sorted(levels):
+            level = min(levels[line], len(parents))
+            del parents[level:]
+            title = self.tab.document.line(line).lstrip("#").strip() or f"Line {line + offset}"
+            parents.append(self.outline.insert(parents[-1], "end", text=title, values=(line + offset,), open=True))
 
-    def table_shading(self):
-        """Apply shading to selected table cells."""
-        try:
-            color = colorchooser.askcolor(title="Choose Shading Color")[1]
-            if color:
-                self.text_area.tag_add("table_shading", "sel.first", "sel.last")
-                self.text_area.tag_configure("table_shading", background=color)
-        except tk.TclError:
-            messagebox.showwarning("Warning", "No text selected or not in a table")
+    def _on_outline_click(self, event):
+        item = self.outline.identify_row(event.y)
+        if item:
+            self.tab.go_to_line(int(self.outline.item(item, "values")[0]))
 
-    def insert_wordart(self):
-        """Insert WordArt text with stylized effects."""
-        text = askstring("WordArt", "Enter text for WordArt:")
-        if text:
-            try:
-                color = colorchooser.askcolor(title="Choose WordArt Color")[1]
-                font_name = askstring("Font", "Enter font name (e.g., Arial):")
-                font_size = int(askstring("Font Size", "Enter font size (e.g., 14):"))
-                wordart_font = font.Font(family=font_name, size=font_size, weight="bold")
-                cursor_pos = self.text_area.index("insert")
-                self.text_area.insert(cursor_pos, text + "\n")
-                self.text_area.tag_add("wordart", cursor_pos, f"{cursor_pos}+{len(text)}c")
-                self.text_area.tag_configure("wordart", font=wordart_font, foreground=color, spacing1=5, spacing3=5)
-                self.update_status_bar()
-            except (ValueError, TypeError):
-                messagebox.showerror("Error", "Invalid font size or input")
+    def update_status_bar(self, event=None):
+        line, col = self.tab.text_area.index("insert").split(".")
+        line = int(line)
+        col = int(col)
+        wrap_status = "On" if self.tab.word_wrap else "Off"
+        if self.tab.large_file:
+            line += self.tab.large_file.start
+            status = f"Line: {line} | Col: {col} | Lines: {self.tab.large_file.total} | Word Wrap: {wrap_status}"
+        else:
+            words = self.tab.document.stats.words
+            status = f"Line: {line} | Col: {col} | Words: {words} | Word Wrap: {wrap_status}"
+        if self.tab.follower:
+            status += " | Following"
+        if self.status_message:
+            status += f" | {self.status_message}"
+        self.status_bar.config(text=status)
+        title = os.path.basename(self.tab.file_path) if self.tab.file_path else "Untitled"
+        if self.notebook.tab(self.tab.frame, "text") != title:
+            self.notebook.tab(self.tab.frame, text=title)
 
-    def start_draw_line(self):
-        self.drawing = "line"
-        self.canvas.config(cursor="cross")
 
-    def start_draw_rectangle(self):
-        self.drawing = "rectangle"
-        self.canvas.config(cursor="cross")
+def resident_memory():
+    """Return the resident set size of this process in bytes, or None if unknown."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
 
-    def start_draw_circle(self):
-        self.drawing = "circle"
-        self.canvas.config(cursor="cross")
 
-    def on_mouse_press(self, event):
-        if self.drawing:
-            self.start_x = self.canvas.canvasx(event.x)
-            self.start_y = self.canvas.canvasy(event.y)
-            self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
-            self.current_shape = None
+def percentile(samples, percent):
+    """Return the nearest-rank percentile of a sorted list."""
+    return samples[min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))]
 
-    def on_mouse_drag(self, event):
-        if self.drawing and self.start_x is not None:
-            end_x = self.canvas.canvasx(event.x)
-            end_y = self.canvas.canvasy(event.y)
-            if self.current_shape:
-                self.canvas.delete(self.current_shape)
-            if self.drawing == "line":
-                self.current_shape = self.canvas.create_line(
-                    self.start_x, self.start_y, end_x, end_y, fill=self.accent_color, width=2
-                )
-            elif self.drawing == "rectangle":
-                self.current_shape = self.canvas.create_rectangle(
-                    self.start_x, self.start_y, end_x, end_y, outline=self.accent_color, width=2
-                )
-            elif self.drawing == "circle":
-                self.current_shape = self.canvas.create_oval(
-                    self.start_x, self.start_y, end_x, end_y, outline=self.accent_color, width=2
-                )
 
-    def on_mouse_release(self, event):
-        if self.drawing and self.start_x is not None:
-            end_x = self.canvas.canvasx(event.x)
-            end_y = self.canvas.canvasy(event.y)
-            if self.current_shape:
-                self.canvas.delete(self.current_shape)
-            if self.drawing == "line":
-                self.canvas.create_line(
-                    self.start_x, self.start_y, end_x, end_y, fill=self.accent_color, width=2
-                )
-            elif self.drawing == "rectangle":
-                self.canvas.create_rectangle(
-                    self.start_x, self.start_y, end_x, end_y, outline=self.accent_color, width=2
-                )
-            elif self.drawing == "circle":
-                self.canvas.create_oval(
-                    self.start_x, self.start_y, end_x, end_y, outline=self.accent_color, width=2
-                )
-            self.drawing = None
-            self.start_x = None
-            self.start_y = None
-            self.canvas.config(cursor="")
-            self.canvas.unbind("<B1-Motion>")
-            self.current_shape = None
+# Stand-in for the mouse events the drawing handlers receive
+Point = namedtuple("Point", "x y")
+
+
+class Benchmark:
+    """Time scripted actions against a running WordProcessor.
+
+    measure() runs an action, then pumps the Tk event loop until the work it
+    started has settled, and records the elapsed time, the number of Tcl
+    commands executed and the resident memory afterwards.
+    """
+
+    def __init__(self, app, timeout=300):
+        self.app = app
+        self.timeout = timeout
+        self.results = {}
+
+    def settle(self, until=None):
+        """Process Tk events until until() is true, or once when no condition is given."""
+        deadline = time.monotonic() + self.timeout
+        self.app.root.update()
+        while until is not None and not until():
+            if time.monotonic() > deadline:
+                raise TimeoutError("benchmark action did not settle")
+            time.sleep(0.001)
+            self.app.root.update()
+
+    def measure(self, name, action, until=None, repeat=1):
+        tk_app = self.app.root.tk
+        result = self.results.setdefault(name, {"samples": [], "tcl_commands": 0, "rss_bytes": None})
+        commands = int(tk_app.call("info", "cmdcount"))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            action()
+            self.settle(until)
+            result["samples"].append(time.perf_counter() - start)
+        result["tcl_commands"] += int(tk_app.call("info", "cmdcount")) - commands
+        result["rss_bytes"] = resident_memory()
+
+    def summary(self):
+        """Return per-scenario latency percentiles in milliseconds, Tcl counts and memory."""
+        summary = {}
+        for name, result in self.results.items():
+            samples = sorted(result["samples"])
+            summary[name] = {
+                "count": len(samples),
+                "mean_ms": sum(samples) / len(samples) * 1000,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p90_ms": percentile(samples, 90) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "max_ms": samples[-1] * 1000,
+                "tcl_commands": result["tcl_commands"],
+                "tcl_commands_per_op": result["tcl_commands"] / len(samples),
+                "rss_bytes": result["rss_bytes"],
+            }
+            # Extra figures recorded by the scenario itself
+            summary[name].update((key, value) for key, value in result.items()
+                                 if key not in ("samples", "tcl_commands", "rss_bytes"))
+        return summary
+
+
+def run_benchmark_scenarios(bench, work_dir, scale=1):
+    """Drive the editor through typing, pasting, files, search, formatting, tables, drawing, freehand
+    strokes, highlighting, navigation, replace all, native documents, tag batching, CSV import, streaming
+    opens and autosave."""
+    app = bench.app
+    tab = app.tab
+    words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+    lines = [" ".join(words[(i + j) % len(words)] for j in range(12)) for i in range(100000 * scale)]
+    source = os.path.join(work_dir, "large.txt")
+    write_atomic(source, (line + "\n" for line in lines))
+    steps = cycle(range(1, len(lines)))
+
+    def text_of_size(size):
+        written = 0
+        for line in cycle(lines):
+            if written >= size:
+                return
+            written += len(line) + 1
+            yield line + "\n"
+
+    keys = cycle("The quick brown fox jumps over the lazy dog. ")
+
+    def type_key():
+        tab.text_area.insert("insert", next(keys))
+        app.refresh.request("status")
+
+    bench.measure("typing", type_key, repeat=2000 * scale)
+
+    app.root.clipboard_clear()
+    app.root.clipboard_append("\n".join(lines[:5000]))
+    bench.measure("paste", tab.paste, repeat=5)
+
+    bench.measure("open_file", lambda: tab.load_file(source), until=lambda: tab.loader is None, repeat=3)
+    tab.file_path = os.path.join(work_dir, "saved.txt")
+    bench.measure("save_file", tab.save_file, until=lambda: not app.runner.busy, repeat=3)
+
+    app.find_var.set("tempor")
+    bench.measure("search", tab.run_search, until=lambda: not app.runner.busy, repeat=5)
+    app.close_find_bar()
+
+    def format_line():
+        row = next(steps) * 7919 % len(lines) + 1
+        tab.text_area.tag_remove("sel", "1.0", "end")
+        tab.text_area.tag_add("sel", f"{row}.0", f"{row}.40")
+        tab.bold_text()
+
+    bench.measure("format", format_line, repeat=200)
+    bench.measure("insert_table", lambda: tab.embed_table("end-1c", TableModel(50, 6)), repeat=20)
+
+    def draw_shape():
+        offset = next(steps) % 150
+        tab.start_draw_rectangle()
+        tab.on_mouse_press(Point(offset, offset))
+        for i in range(20):
+            tab.on_mouse_drag(Point(offset + i, offset + i * 2))
+        tab.on_mouse_release(Point(offset + 20, offset + 40))
+
+    bench.measure("draw", draw_shape, repeat=200)
+    bench.results["draw"]["drag_stats"] = dict(tab.drag_stats)
+
+    # 50k shapes: selecting goes through the grid index, and each drag frame must fit in a 60 Hz frame
+    tab.shapes.load([["rectangle", [x, y, x + 20, y + 20], {"outline": "#2c3e50", "width": 2}]
+                     for x in range(0, 250 * 24, 24) for y in range(0, 200 * scale * 24, 24)])
+    centers = cycle((x + 10, y + 10) for x in range(0, 240, 24) for y in range(0, 240, 24))
+
+    def select_shape():
+        x, y = next(centers)
+        tab.on_mouse_press(Point(x, y))
+        tab.on_mouse_release(Point(x, y))
+        if tab.selected_shape is None:
+            raise AssertionError(f"select_shape: nothing selected at {x}, {y}")
+
+    bench.measure("select_shape", select_shape, repeat=200)
+    x, y = next(centers)
+    tab.on_mouse_press(Point(x, y))
+    offsets = cycle([*range(20), *range(20, 0, -1)])
+
+    def drag_frame():
+        tab.on_mouse_drag(Point(x + next(offsets), y))
+        # Render inside the sample rather than on the drag refresh's next frame
+        tab.drag_refresh.flush()
+
+    bench.measure("drag_shape", drag_frame, repeat=200)
+    if tab.drag_refresh.executed < 200:
+        raise AssertionError(f"drag_shape: only {tab.drag_refresh.executed} of 200 frames were drawn")
+    tab.on_mouse_release(Point(x, y))
+    tab.deselect_shape()
+    tab.shapes.clear()
+
+    # A 5000-point freehand stroke, redrawn with one coords() call per motion event, then simplified
+    points = ((300 + 200 * math.cos(i / 400), 300 + 200 * math.sin(i / 400)) for i in range(5000))
+    tab.start_draw_freehand()
+    tab.on_mouse_press(Point(500, 300))
+
+    def stroke_frame():
+        tab.on_mouse_drag(Point(*next(points)))
+        tab.drag_refresh.flush()
+
+    bench.measure("freehand_redraw", stroke_frame, repeat=4999)
+    tab.on_mouse_release(Point(500, 300))
+    stroke = tab.shapes.shapes[max(tab.shapes.shapes)]
+    bench.results["freehand_redraw"]["stored_points"] = len(stroke.coords) // 2
+
+    bench.measure("open_large_file", lambda: tab.load_large_file(source), until=lambda: tab._large_open is None,
+                  repeat=3)
+    positions = cycle((0.1, 0.5, 0.9))
+    bench.measure("scroll_large_file", lambda: tab._on_large_scrollbar("moveto", next(positions)), repeat=30)
+    tab.close_large_file()
+
+    # A log of about 20 MB, highlighted in the background while it streams in
+    log_path = os.path.join(work_dir, "server.log")
+    levels = cycle(("INFO", "DEBUG", "WARN", "INFO", "ERROR"))
+    write_atomic(log_path, (f'2024-05-01 12:{i // 60 % 60:02d}:{i % 60:02d},{i % 1000:03d} {next(levels)} '
+                            f'[worker-{i % 8}] request "GET /api/items/{i}" took {i % 997} ms\n'
+                            for i in range(200000 * scale)))
+    bench.measure("highlight_open", lambda: tab.load_file(log_path),
+                  until=lambda: tab.loader is None and tab.highlighter.valid == len(tab.highlighter.spans))
+    tab.text_area.mark_set("insert", f"{100000 * scale}.0")
+    tab.text_area.see("insert")
+    bench.measure("highlight_typing", type_key, repeat=500)
+    bench.measure("go_to_line", lambda: tab.go_to_line(next(steps) * 7919 % tab.document.stats.lines + 1),
+                  repeat=200)
+
+    # Replace All of 100k matches in a 20 MB document, as one edit
+    replace_path = os.path.join(work_dir, "records.txt")
+    write_atomic(replace_path, (f"record {i:08d} status=ok {'.' * 170}\n" for i in range(100000 * scale)))
+    bench.measure("open_replace_doc", lambda: tab.load_file(replace_path), until=lambda: tab.loader is None)
+    app.find_var.set("status=ok")
+    app.replace_var.set("status=done")
+    bench.measure("replace_all", tab.replace_all, until=lambda: not app.runner.busy)
+    if app.find_count.cget("text") != f"Replaced {100000 * scale} matches":
+        raise AssertionError(f"replace_all: {app.find_count.cget('text')}")
+    app.close_find_bar()
+
+    # A 10 MB document with a style change every 20 characters, opened and saved in the native format
+    styles = [TextStyle("Arial", 11 + i % 3, ("normal", "bold")[i % 2], ("roman", "italic")[i // 2 % 2],
+                        i % 4 == 3, ("black", "#c0392b", "#2c3e50")[i % 3]) for i in range(8)]
+    doc_text = "".join(text_of_size(10 * scale << 20))
+    runs = [[i % len(styles), min(20, len(doc_text) - offset)] for i, offset in enumerate(range(0, len(doc_text), 20))]
+    doc_path = os.path.join(work_dir, "formatted.pwd")
+    write_atomic(doc_path, [pack_document({"version": 1, "text": doc_text, "styles": [list(style) for style in styles],
+                                           "runs": runs, "tags": {}, "shapes": []})], encoding=None)
+    bench.measure("load_formatted", lambda: tab.load_document(doc_path), until=lambda: not app.runner.busy)
+    bench.measure("save_formatted", tab.save_file, until=lambda: not app.runner.busy)
+    with open(doc_path, "rb") as file:
+        saved = unpack_document(file.read())
+    if saved["text"] != doc_text or len(saved["runs"]) != len(runs):
+        raise AssertionError("save_formatted: formatting did not survive the round trip")
+
+    # 100k tag ranges, one Tcl call each versus one batched call
+    rows = range(1, 100000 * scale + 1)
+
+    def add_each():
+        for row in rows:
+            tab.text_area.tag_add("bench", f"{row}.0", f"{row}.5")
+
+    def add_batched():
+        with TagBatch(tab.text_area) as batch:
+            for row in rows:
+                batch.add("bench", (row, 0), (row, 5))
+
+    bench.measure("tag_ranges_each", add_each)
+    tab.text_area.tag_delete("bench")
+    bench.measure("tag_ranges_batched", add_batched)
+    tab.text_area.tag_delete("bench")
+
+    # CSV import of 100k rows into a table, with the peak memory of the whole import
+    csv_path = os.path.join(work_dir, "rows.csv")
+    write_atomic(csv_path, (f"{i},item {i},{i * 7 % 1000}.{i % 100:02d},{words[i % len(words)]}\n"
+                            for i in range(100000 * scale)))
+    tab.text_area.mark_set("insert", "end-1c")
+    peak = 0
+
+    def sample_peak():
+        nonlocal peak
+        peak = max(peak, resident_memory() or 0)
+        return tab.loader is None
+
+    bench.measure("import_csv", lambda: tab.load_csv(csv_path), until=sample_peak)
+    bench.results["import_csv"]["peak_rss_bytes"] = peak
+    if not any(view.model.rows == 100000 * scale for view in tab._tables_in_order()):
+        raise AssertionError("import_csv: rows are missing from the table")
+
+    # Streaming open: time until the first chunk is on screen, then the peak memory of the whole load
+    for megabytes in (1, 50, 200):
+        path = os.path.join(work_dir, f"open-{megabytes}mb.txt")
+        write_atomic(path, text_of_size(megabytes * scale << 20))
+        name = f"first_paint_{megabytes}mb"
+        bench.measure(name, lambda: tab.load_file(path), until=lambda: tab.loader is None or tab.loader.bytes_read)
+        peak = resident_memory() or 0
+        bench.settle(sample_peak)
+        bench.results[name]["peak_rss_bytes"] = peak
+        os.remove(path)
+
+    # Autosave of a 50 MB document: each flush writes only the edits typed since the last one
+    big_path = os.path.join(work_dir, "big.txt")
+    write_atomic(big_path, text_of_size(50 * scale << 20))
+    bench.measure("open_50mb", lambda: tab.load_file(big_path), until=lambda: tab.loader is None)
+    tab.text_area.mark_set("insert", "350000.0")
+    for _ in range(50):
+        for _ in range(20):
+            type_key()
+        batches = tab.journal.batches
+        bench.measure("autosave", tab.journal.flush, until=lambda: tab.journal.batches > batches)
+
+
+# Latency budgets (p90, in milliseconds) stated by the requests behind the scenarios
+BENCHMARK_BUDGETS = {
+    "autosave": 50,
+    "replace_all": 2000,
+    "select_shape": 16,
+    "drag_shape": 16,
+}
+
+
+def check_budgets(current, budgets=BENCHMARK_BUDGETS):
+    """Return a message for each scenario whose p90 exceeds its budget."""
+    return [f"{name} p90_ms: {current['scenarios'][name]['p90_ms']:.2f} over budget of {budget}"
+            for name, budget in budgets.items()
+            if name in current["scenarios"] and current["scenarios"][name]["p90_ms"] > budget]
+
+
+def compare_benchmarks(current, baseline, threshold=0.2):
+    """Return a message for each scenario whose median or p90 is more than threshold slower than baseline."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p90_ms"):
+            if base[key] and result[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name} {key}: {base[key]:.2f} -> {result[key]:.2f}")
+    return regressions
+
+
+def run_benchmark(output, baseline=None, threshold=0.2, scale=1, show=False):
+    """Run the benchmark scenarios on a fresh editor and write the results as JSON.
+
+    Returns the scenarios over their budget and the regressions against the
+    baseline results file, if one is given.
+    """
+    work_dir = tempfile.mkdtemp(prefix="prowrite-bench-")
+    try:
+        start = time.perf_counter()
+        root = tk.Tk()
+        shown = []
+
+        def on_shown(event):
+            if event.widget is root and not shown:
+                shown.append(time.perf_counter())
+
+        root.bind("<Map>", on_shown, add="+")
+        root.bind("<Expose>", on_shown, add="+")
+        app = WordProcessor(root, journal_dir=os.path.join(work_dir, "journal"))
+        # One event at a time, so the clock stops at the first map or expose instead of after all idle work
+        deadline = time.monotonic() + 60
+        while not shown:
+            if time.monotonic() > deadline:
+                raise TimeoutError("the benchmark window was never mapped")
+            if not root.tk.dooneevent(_tkinter.DONT_WAIT):
+                time.sleep(0.001)
+        first_window = shown[0] - start
+        bench = Benchmark(app)
+        bench.settle(lambda: not app.runner.busy)
+        interactive = time.perf_counter() - start
+        if not show:
+            root.withdraw()
+
+        run_benchmark_scenarios(bench, work_dir, scale)
+        results = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "tk": root.tk.call("info", "patchlevel"),
+            "startup": {"first_window_ms": first_window * 1000, "interactive_ms": interactive * 1000},
+            "scenarios": bench.summary(),
+            "undo": {"steps": len(app.tab.history), "bytes": app.tab.history.memory,
+                     "evicted": app.tab.history.evicted},
+        }
+        app.exit_app()
+        root.destroy()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    write_atomic(output, [json.dumps(results, indent=2)])
+    failures = check_budgets(results)
+    if baseline is None:
+        return failures
+    with open(baseline, encoding="utf-8") as file:
+        return failures + compare_benchmarks(results, json.load(file), threshold)
 
-    def update_status_bar(self, event=None):
-        line, col = self.text_area.index("insert").split(".")
-        line = int(line)
-        col = int(col)
-        words = len(self.text_area.get("1.0", "end-1c").split())
-        wrap_status = "On" if self.word_wrap else "Off"
-        status = f"Line: {line} | Col: {col} | Words: {words} | Word Wrap: {wrap_status}"
-        self.status_bar.config(text=status)
 
 if __name__ == "__main__":
-    root = ThemedTk(theme="arc")
+    parser = argparse.ArgumentParser(description="ProWrite - Word Processor")
+    parser.add_argument("--benchmark", metavar="OUTPUT", help="run the benchmark scenarios and write JSON results")
+    parser.add_argument("--baseline", help="benchmark results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument("--scale", type=int, default=1, help="multiply benchmark document sizes")
+    parser.add_argument("--show", action="store_true", help="keep the benchmark window visible")
+    args = parser.parse_args()
+    if args.benchmark:
+        regressions = run_benchmark(args.benchmark, args.baseline, args.threshold, args.scale, args.show)
+        for regression in regressions:
+            print(f"Failed: {regression}")
+        sys.exit(1 if regressions else 0)
+    root = tk.Tk()
     app = WordProcessor(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeWidget:
+    """Stand-in for the after() scheduling of a Tk widget, run by pump().
+
+    Every call is checked to come from the thread that created the widget,
+    as Tk requires.
+    """
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.calls = 0
+        self.foreign_calls = 0
+        self.queue = {}
+        self.counter = 0
+
+    def _called(self):
+        self.calls += 1
+        if threading.get_ident() != self.thread:
+            self.foreign_calls += 1
+
+    def after(self, ms, func, *args):
+        self._called()
+        self.counter += 1
+        self.queue[self.counter] = (time.monotonic() + ms / 1000, func, args)
+        return self.counter
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, ident):
+        self._called()
+        self.queue.pop(ident, None)
+
+    def run_due(self):
+        """Run the callbacks that are due, in the order they were scheduled."""
+        now = time.monotonic()
+        for ident, (due, func, args) in sorted(self.queue.items()):
+            if due <= now and ident in self.queue:
+                del self.queue[ident]
+                func(*args)
+
+    def pump(self, until=None, timeout=30):
+        """Run due callbacks until until() is true, or until nothing is scheduled."""
+        deadline = time.monotonic() + timeout
+        while self.queue and not (until and until()):
+            assert time.monotonic() < deadline, "callbacks did not settle"
+            self.run_due()
+            time.sleep(0.001)
+
+
+class FakeTask:
+    """Task stand-in that collects progress reports."""
+
+    def __init__(self):
+        self.reports = []
+
+    def check(self):
+        pass
+
+    def progress(self, value):
+        self.reports.append(value)
+
+
+@pytest.fixture
+def widget():
+    return FakeWidget()
+
+
+def median_time(func, repeat=200):
+    """Return the median duration of func() in seconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2]
@@ -0,0 +1,154 @@
+import random
+from bisect import bisect_right
+from itertools import cycle
+
+import pytest
+
+from conftest import median_time
+from fwp import DocumentStats, LineIndex, PieceTable, TextDocument, TextEdit
+
+
+def typing_cost(document):
+    """Return the median time to type one character and read the status bar counts."""
+    line = document.stats.lines // 2
+    keys = cycle("typing a few words ")
+
+    def keystroke():
+        col = document.stats.line_index.length(line - 1)
+        document.apply(TextEdit("insert", (line, col), None, next(keys)))
+        return document.position(document.offset(line, col)), document.stats.words
+
+    return median_time(keystroke, repeat=500)
+
+
+def test_status_update_cost_does_not_grow_with_document_size():
+    line = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor\n"
+    small = TextDocument(line * 128)
+    large = TextDocument(line * (10_000_000 // len(line)))
+    assert len(large) > 9_900_000
+    assert typing_cost(large) < max(5 * typing_cost(small), 0.0005)
+
+
+def test_status_counts_follow_edits():
+    document = TextDocument("one two\nthree")
+    document.apply(TextEdit("insert", (2, 5), None, " four\nfive"))
+    assert (document.stats.words, document.stats.lines, document.stats.chars) == (5, 3, len(document))
+    document.apply(TextEdit("delete", (1, 3), (3, 0), "\n"))
+    assert document.get_text() == "onefive"
+    assert (document.stats.words, document.stats.lines) == (1, 1)
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 64])
+def test_piece_table_matches_a_string(block_size):
+    rng = random.Random(block_size)
+    for _ in range(200):
+        model = "".join(rng.choice("abc\n") for _ in range(rng.randrange(40)))
+        table = PieceTable(model, block_size=block_size)
+        snapshot = None
+        for step in range(60):
+            pos = rng.randint(0, len(model))
+            if rng.random() < 0.55:
+                items = "".join(rng.choice("xyz") for _ in range(rng.randrange(6)))
+                table.insert(pos, items)
+                model = model[:pos] + items + model[pos:]
+            else:
+                length = rng.randrange(12)
+                table.delete(pos, length)
+                model = model[:pos] + model[pos + length:]
+            start = rng.randint(0, len(model))
+            stop = rng.randint(start, len(model) + 2)
+            assert len(table) == len(model)
+            assert table.slice(start, stop) == model[start:stop]
+            assert all(0 < len(block) <= 2 * block_size + 2 for block in table.blocks)
+            if step == 30:
+                snapshot, frozen = table.copy(), model
+        assert "".join(table.chunks()) == model
+        assert "".join(snapshot.chunks()) == frozen
+
+
+def test_piece_table_edit_cost_does_not_grow_with_pieces():
+    rng = random.Random(5)
+
+    def insert_cost(pieces):
+        table = PieceTable("x" * 1_000_000)
+        for _ in range(pieces):
+            table.insert(rng.randrange(len(table)), "ab")
+        return median_time(lambda: table.insert(rng.randrange(len(table)), "ab"), repeat=2000)
+
+    assert insert_cost(100_000) < 5 * insert_cost(1000)
+
+
+def test_piece_table_drops_the_deleted_original():
+    original = "o" * 1000
+    table = PieceTable(original)
+    table.delete(0, len(original))
+    table.insert(0, "new")
+    assert all(buf is not original for buf, start, length in table.pieces)
+    assert all(value is not original for value in vars(table).values())
+    assert table.slice(0, 3) == "new"
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 8])
+def test_line_index_matches_a_list_of_lengths(block_size):
+    rng = random.Random(block_size)
+    for _ in range(50):
+        lengths = [rng.randint(0, 5) for _ in range(rng.randint(1, 40))]
+        index = LineIndex(lengths, block_size=block_size)
+        for _ in range(30):
+            first = rng.randrange(len(lengths))
+            stop = rng.randint(first + 1, min(len(lengths), first + rng.choice([1, 2, 10, 50])))
+            new = [rng.randint(0, 5) for _ in range(rng.randint(1, rng.choice([1, 3, 60])))]
+            lengths[first:stop] = new
+            index.replace(first, stop, new)
+            assert len(index) == len(lengths)
+            starts = [0]
+            for length in lengths:
+                starts.append(starts[-1] + length + 1)
+            assert [index.start(line) for line in range(len(lengths) + 1)] == starts
+            assert [index.length(line) for line in range(len(lengths))] == lengths
+            a = rng.randrange(len(lengths))
+            b = rng.randint(a, len(lengths))
+            assert index.lengths(a, b) == lengths[a:b]
+            for offset in rng.sample(range(starts[-1]), min(200, starts[-1])):
+                line = bisect_right(starts, offset) - 1
+                assert index.position(offset) == (line, offset - starts[line])
+            assert index.position(starts[-1] + 2) == (len(lengths) - 1, lengths[-1])
+
+
+def test_document_edits_match_a_string_and_fresh_stats():
+    rng = random.Random(11)
+    document = TextDocument("# a\nhello world\n## b")
+    text = document.get_text()
+    for _ in range(3000):
+        if rng.random() < 0.6 or len(text) < 2:
+            offset = rng.randint(0, len(text))
+            inserted = rng.choice(["x", "\n", "# h\n", "ab cd", "\n## t"])
+            line, col = document.position(offset)
+            assert document.offset(line, col) == offset
+            document.apply(TextEdit("insert", (line, col), None, inserted))
+            text = text[:offset] + inserted + text[offset:]
+        else:
+            start = rng.randint(0, len(text) - 1)
+            end = rng.randint(start + 1, min(len(text), start + 8))
+            document.apply(TextEdit("delete", document.position(start), document.position(end), text[start:end]))
+            text = text[:start] + text[end:]
+        assert document.get_text() == text
+        fresh = DocumentStats()
+        fresh.reset(text)
+        stats = document.stats
+        assert (stats.words, stats.chars, stats.lines, stats.line_headings, stats.headings) == \
+            (fresh.words, fresh.chars, fresh.lines, fresh.line_headings, fresh.headings)
+
+
+def test_line_lookups_do_not_grow_with_document_size():
+    def lookup_cost(lines):
+        document = TextDocument("\n".join(f"line {i} words here" for i in range(lines)))
+        steps = cycle(range(1, lines, 97))
+
+        def lookup():
+            line = next(steps)
+            return document.position(document.offset(line, 3))
+
+        return median_time(lookup, repeat=2000)
+
+    assert lookup_cost(300_000) < max(5 * lookup_cost(1000), 0.0001)
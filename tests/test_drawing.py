@@ -0,0 +1,79 @@
+import math
+import random
+import sys
+import time
+
+import pytest
+
+from fwp import GridIndex, segment_distance, simplify_stroke
+
+
+def overlaps(a, b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def random_box(rng):
+    x, y = rng.uniform(-500, 2000), rng.uniform(-500, 2000)
+    return x, y, x + rng.uniform(0, 300), y + rng.uniform(0, 300)
+
+
+def test_grid_index_matches_a_scan_of_all_boxes():
+    rng = random.Random(5)
+    index = GridIndex(cell_size=64)
+    boxes = {}
+    for step in range(5000):
+        action = rng.random()
+        if action < 0.5 or not boxes:
+            key = step
+            boxes[key] = random_box(rng)
+            index.insert(key, boxes[key])
+        elif action < 0.75:
+            key = rng.choice(list(boxes))
+            boxes[key] = random_box(rng)
+            index.update(key, boxes[key])
+        else:
+            key = rng.choice(list(boxes))
+            del boxes[key]
+            index.remove(key)
+        query = random_box(rng)
+        assert index.query(query) == {key for key, box in boxes.items() if overlaps(box, query)}
+    for key in list(boxes):
+        index.remove(key)
+    assert not index.cells
+
+
+def noisy_circle(count, rng):
+    coords = []
+    for i in range(count):
+        angle = 2 * math.pi * i / count
+        coords += (300 + 200 * math.cos(angle) + rng.uniform(-0.5, 0.5),
+                   300 + 200 * math.sin(angle) + rng.uniform(-0.5, 0.5))
+    return coords
+
+
+@pytest.fixture(params=["python", "numpy"])
+def implementation(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+    return request.param
+
+
+def test_simplified_stroke_keeps_the_shape_with_few_points(implementation):
+    coords = noisy_circle(10_000, random.Random(9))
+    start = time.perf_counter()
+    simplified = simplify_stroke(coords, tolerance=1.5)
+    elapsed = time.perf_counter() - start
+    assert len(simplified) < len(coords) * 0.05
+    assert simplified[:2] == coords[:2] and simplified[-2:] == coords[-2:]
+    kept = list(zip(simplified[0::2], simplified[1::2]))
+    segments = list(zip(kept, kept[1:]))
+    for x, y in zip(coords[0::2], coords[1::2]):
+        assert min(segment_distance(x, y, *a, *b) for a, b in segments) <= 1.5 + 1e-9
+    assert elapsed < 1.0
+
+
+def test_straight_stroke_collapses_to_its_end_points(implementation):
+    coords = [value for i in range(5000) for value in (i * 0.5, 10 + i * 0.25)]
+    assert simplify_stroke(coords) == [0.0, 10.0, 2499.5, 1259.75]
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from conftest import FakeTask
+from fwp import HIGHLIGHT_LANGUAGES, SyntaxHighlighter
+
+TOKENS = ["<a>", "<!--", "-->", "x", '"""', " ", 'b="q"', "</a>"]
+
+
+def lex_all(highlighter, lines):
+    """Return the spans of every line lexed from the top, as a fresh pass would."""
+    spans = []
+    state = 0
+    for line in lines:
+        line_spans, state = highlighter.lex_line(line, state)
+        spans.append(line_spans)
+    return spans
+
+
+def finish(highlighter, lines, batch_lines=7):
+    """Run the background pass from the first unlexed line, as the editor does after an edit."""
+    if highlighter.valid < len(lines):
+        task = FakeTask()
+        highlighter.lex_batches(task, "\n".join(lines[highlighter.valid:]), highlighter.valid,
+                                highlighter.states[highlighter.valid], batch_lines)
+        for batch in task.reports:
+            assert highlighter.apply_batch(*batch)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_relexing_matches_a_full_pass(seed):
+    rng = random.Random(seed)
+    rules = HIGHLIGHT_LANGUAGES["XML"]["rules"] + [["string", '"""', '"""']]
+
+    def random_line():
+        return "".join(rng.choice(TOKENS) for _ in range(rng.randint(0, 5)))
+
+    for _ in range(100):
+        lines = [random_line() for _ in range(rng.randint(1, 30))]
+        highlighter = SyntaxHighlighter(rules)
+        highlighter.reset(len(lines))
+        finish(highlighter, lines)
+        for _ in range(10):
+            first = rng.randrange(len(lines))
+            last = min(len(lines), first + rng.randint(1, 4))
+            new = [random_line() for _ in range(rng.randint(1, 4))]
+            lines[first:last] = new
+            highlighter.edit(first, last - first, len(new), lines.__getitem__, budget=rng.choice([1, 3, 500]))
+            if rng.random() < 0.5:
+                finish(highlighter, lines)
+        finish(highlighter, lines)
+        assert highlighter.spans == lex_all(highlighter, lines)
+        assert len(highlighter.states) == len(lines) + 1
+
+
+def test_editing_one_line_relexes_only_that_line():
+    line = '2024-05-01 12:00:01,123 ERROR [worker-7] request "GET /api/items" took 1532 ms'
+    lines = [line] * 100_000
+    highlighter = SyntaxHighlighter(HIGHLIGHT_LANGUAGES["Log"]["rules"])
+    highlighter.reset(len(lines))
+    finish(highlighter, lines, batch_lines=2000)
+    assert highlighter.valid == len(lines)
+    lexed = []
+
+    def line_text(i):
+        lexed.append(i)
+        return lines[i]
+
+    lines[50_000] = line.replace("ERROR", "WARN")
+    assert not highlighter.edit(50_000, 1, 1, line_text)
+    assert lexed == [50_000]
+    assert highlighter.spans[50_000] == highlighter.lex_line(lines[50_000])[0]
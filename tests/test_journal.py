@@ -0,0 +1,81 @@
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from fwp import OBJECT_CHAR, EditJournal, expand_objects, read_text_file
+
+
+def test_replaying_the_journal_reproduces_the_edits(tmp_path):
+    rng = random.Random(7)
+    base = "".join(rng.choice("abc \n") for _ in range(500))
+    base_path = tmp_path / "base.txt"
+    base_path.write_text(base)
+    executor = ThreadPoolExecutor(max_workers=1)
+    journal = EditJournal(str(tmp_path / f"{os.getpid()}-1.pwj"), executor, compact_size=2000)
+    journal.reset(str(base_path))
+    model = base
+    for step in range(2000):
+        pos = rng.randint(0, len(model))
+        if rng.random() < 0.6:
+            # Mostly typing at a cursor that moves now and then, as the coalescing expects
+            text = rng.choice("xyz \n")
+            journal.record_insert(pos, text)
+            model = model[:pos] + text + model[pos:]
+        elif rng.random() < 0.98:
+            length = min(rng.randrange(1, 4), len(model) - pos)
+            journal.record_delete(pos, length)
+            model = model[:pos] + model[pos + length:]
+        else:
+            model = "snapshot " + model[::2]
+            journal.record_snapshot(model)
+        if step % 25 == 0:
+            journal.flush()
+    journal.flush()
+    executor.shutdown(wait=True)
+    header, ops = EditJournal.read(journal.path)
+    assert header == {"path": str(base_path)}
+    assert EditJournal.replay(base, ops) == model
+
+
+def test_compaction_waits_for_the_journal_to_grow(tmp_path):
+    executor = ThreadPoolExecutor(max_workers=1)
+    journal = EditJournal(str(tmp_path / f"{os.getpid()}-2.pwj"), executor, compact_size=1000)
+    compactions = []
+    compact = journal._compact
+    journal._compact = lambda: compactions.append(compact())
+    journal.reset(None)
+    for i in range(2000):
+        # Edits far apart never merge, so compaction cannot shrink the file
+        journal.record_insert(i * 7919 % 5000, "abc")
+        journal.flush()
+    executor.shutdown(wait=True)
+    assert os.path.getsize(journal.path) > 30_000
+    assert 1 <= len(compactions) <= 8
+    header, ops = EditJournal.read(journal.path)
+    assert len(ops) == 2000
+
+
+def test_owner_alive_reads_the_pid_from_the_file_name(tmp_path):
+    assert EditJournal.owner_alive(str(tmp_path / f"{os.getpid()}-1.pwj"))
+    assert not EditJournal.owner_alive(str(tmp_path / "notes.pwj"))
+    pid = 4_000_000
+    while os.path.exists(f"/proc/{pid}"):
+        pid += 1
+    assert not EditJournal.owner_alive(str(tmp_path / f"{pid}-1.pwj"))
+
+
+def test_recovery_over_a_text_save_with_an_embedded_table(tmp_path):
+    document = "before\n" + OBJECT_CHAR + "\nafter"
+    base_path = tmp_path / "saved.txt"
+    # A plain text save writes the table out as tab-separated rows
+    base_path.write_text("".join(expand_objects([document], ["a\tb\nc\td"])), encoding="utf-8")
+    executor = ThreadPoolExecutor(max_workers=1)
+    journal = EditJournal(str(tmp_path / f"{os.getpid()}-2.pwj"), executor)
+    journal.reset(str(base_path), document)
+    offset = document.index("after")
+    journal.record_insert(offset, "typed ")
+    journal.flush()
+    executor.shutdown(wait=True)
+    header, ops = EditJournal.read(journal.path)
+    recovered = EditJournal.replay(read_text_file(header["path"]), ops)
+    assert recovered == document[:offset] + "typed " + document[offset:]
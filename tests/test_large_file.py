@@ -0,0 +1,123 @@
+import io
+import os
+import random
+import stat
+import time
+
+from fwp import DocumentTab, LargeFileView, MappedLines, TaskRunner, replace_file
+
+
+def write_lines(path, lines):
+    path.write_bytes("\n".join(lines).encode("utf-8"))
+    return str(path)
+
+
+def test_mapped_lines_slices_match_split(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_bytes("first\r\nsécond\n\nlast".encode("utf-8"))
+    lines = MappedLines(str(path))
+    try:
+        assert len(lines) == 4
+        assert lines[0:4] == ["first", "sécond", "", "last"]
+        assert lines[1:3] == ["sécond", ""]
+        assert lines[3:9] == ["last"]
+    finally:
+        lines.close()
+
+
+def test_window_edits_match_a_list_of_lines(tmp_path):
+    rng = random.Random(4)
+    model = [f"line {i} " + "x" * rng.randrange(30) for i in range(5000)]
+    view = LargeFileView(write_lines(tmp_path / "big.txt", model), window_lines=200)
+    try:
+        for _ in range(100):
+            window = view.window(rng.randrange(len(model)))
+            assert window == model[view.start:view.start + view.count]
+            edited = list(window)
+            for _ in range(rng.randrange(4)):
+                i = rng.randrange(len(edited) + 1)
+                action = rng.random()
+                if action < 0.4:
+                    edited.insert(i, f"new {rng.random()}")
+                elif action < 0.7 and i < len(edited):
+                    del edited[i]
+                elif i < len(edited):
+                    edited[i] += " edited"
+            model[view.start:view.start + view.count] = edited
+            view.commit(edited)
+            assert view.total == len(model)
+        output = io.BytesIO()
+        view.write(output)
+        assert output.getvalue().decode("utf-8") == "\n".join(model)
+    finally:
+        view.close()
+
+
+def test_unedited_file_is_written_back_unchanged(tmp_path):
+    data = "alpha\r\nbeta\ngamma\n".encode("utf-8")
+    path = tmp_path / "crlf.txt"
+    path.write_bytes(data)
+    view = LargeFileView(str(path))
+    try:
+        output = io.BytesIO()
+        view.write(output)
+        assert output.getvalue() == data
+    finally:
+        view.close()
+
+
+def test_edited_crlf_file_keeps_its_line_endings(tmp_path):
+    path = tmp_path / "crlf.txt"
+    path.write_bytes(b"one\r\ntwo\r\nthree\r\n")
+    view = LargeFileView(str(path))
+    try:
+        window = view.window(0)
+        view.commit(["ONE", "inserted"] + window[1:])
+        output = io.BytesIO()
+        view.write(output)
+        assert output.getvalue() == b"ONE\r\ninserted\r\ntwo\r\nthree\r\n"
+    finally:
+        view.close()
+
+
+def test_save_writes_a_temporary_file_next_to_the_target(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"one\ntwo\nthree")
+    path.chmod(0o640)
+    view = LargeFileView(str(path))
+    window = view.window(0)
+    view.commit(window[:1] + ["2"] + window[2:])
+    temp_path = DocumentTab._write_large_file(None, view, str(path))
+    view.close()
+    assert os.path.dirname(temp_path) == str(tmp_path)
+    assert stat.S_IMODE(os.stat(temp_path).st_mode) == 0o640
+    replace_file(temp_path, str(path))
+    assert path.read_bytes() == b"one\n2\nthree"
+    assert os.listdir(tmp_path) == ["log.txt"]
+
+
+def test_line_index_is_built_off_the_main_loop(tmp_path, widget):
+    path = tmp_path / "big.log"
+    with open(path, "w") as file:
+        for _ in range(100):
+            file.write("2024-05-01 12:00:01 INFO request took 12 ms\n" * 25_000)
+    runner = TaskRunner(widget)
+    results = []
+    runner.submit(DocumentTab._open_large_file, str(path), on_done=lambda view, error: results.append((view, error)))
+    ticks = [time.monotonic()]
+
+    def tick():
+        ticks.append(time.monotonic())
+        widget.after(5, tick)
+
+    widget.after(5, tick)
+    widget.pump(until=lambda: results)
+    runner.shutdown()
+    view, error = results[0]
+    try:
+        assert error is None
+        assert view.total == 2_500_001
+    finally:
+        view.close()
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    assert max(gaps) < 0.25
@@ -0,0 +1,36 @@
+import time
+
+from fwp import RefreshScheduler
+
+
+def test_requests_are_merged_into_one_pass(widget):
+    scheduler = RefreshScheduler(widget)
+    runs = []
+    scheduler.register("status", lambda: runs.append("status"))
+    scheduler.register("outline", lambda: runs.append("outline"))
+    scheduler.register("viewport", lambda: runs.append("viewport"))
+    for _ in range(100):
+        scheduler.request("status")
+    scheduler.request("outline", "status")
+    widget.pump()
+    assert runs == ["status", "outline"]
+    assert (scheduler.requested, scheduler.executed) == (101, 1)
+    scheduler.request()
+    scheduler.flush()
+    assert runs[2:] == ["status", "outline", "viewport"]
+    assert not widget.queue
+
+
+def test_passes_never_exceed_max_rate(widget):
+    scheduler = RefreshScheduler(widget, max_rate=30)
+    passes = []
+    scheduler.register("status", lambda: passes.append(time.monotonic()))
+    end = time.monotonic() + 0.5
+    while time.monotonic() < end:
+        scheduler.request("status")
+        widget.run_due()
+        time.sleep(0.001)
+    widget.pump()
+    gaps = [later - earlier for earlier, later in zip(passes, passes[1:])]
+    assert 10 <= len(passes) <= 0.5 * 30 + 2
+    assert min(gaps) >= 1 / 30 - 0.001
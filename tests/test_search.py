@@ -0,0 +1,41 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from fwp import OBJECT_CHAR, DocumentTab, SearchEngine
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_replace_all_matches_re_sub(seed):
+    rng = random.Random(seed)
+    for _ in range(400):
+        text = "".join(rng.choice("ab c" + OBJECT_CHAR) for _ in range(rng.randint(0, 40)))
+        pattern = SearchEngine.compile(rng.choice(["a", "ab", "b+", "c a"]), regex=True)
+        replacement = rng.choice(["", "X", "YYY"])
+        segments = SearchEngine.replace_all(text, pattern, replacement, regex=True)
+        result = text
+        for start, end, new_text, matches in reversed(segments):
+            result = result[:start] + new_text + result[end:]
+        assert result == pattern.sub(replacement, text)
+        for start, end, new_text, matches in segments:
+            # Embedded objects between matches are never rewritten
+            assert not any(OBJECT_CHAR in text[a[1]:b[0]] for a, b in zip(matches, matches[1:]))
+            shift = SearchEngine.offset_map(matches)
+            for offset in range(start, end):
+                if not any(a <= offset < b for a, b, length in matches):
+                    assert new_text[shift(offset) - start] == text[offset]
+
+
+def test_replace_all_retries_a_changed_document_a_bounded_number_of_times():
+    restarts = []
+    status = []
+    tab = SimpleNamespace(document=SimpleNamespace(version=5),
+                          app=SimpleNamespace(find_count=SimpleNamespace(config=lambda text: status.append(text))))
+    tab._start_replace_all = lambda *request, retries: restarts.append((request, retries))
+    request = (SearchEngine.compile("old"), "new", False)
+    DocumentTab._apply_replace_all(tab, 4, request, 2, [], None)
+    assert restarts == [(request, 1)]
+    DocumentTab._apply_replace_all(tab, 4, request, 0, [], None)
+    assert restarts == [(request, 1)]
+    assert status == ["Document changed; nothing replaced"]
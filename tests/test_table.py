@@ -0,0 +1,87 @@
+import time
+from types import SimpleNamespace
+
+from fwp import TableModel, TableView
+
+
+class FakeCanvas:
+    """Canvas stand-in that tracks live items and the scroll position."""
+
+    def __init__(self):
+        self.top = 0
+        self.items = set()
+        self.counter = 0
+
+    def canvasy(self, y):
+        return self.top + y
+
+    def _create(self, *args, **options):
+        self.counter += 1
+        self.items.add(self.counter)
+        return self.counter
+
+    create_rectangle = create_text = _create
+
+    def delete(self, *items):
+        self.items.difference_update(items)
+
+
+def table_view(model):
+    """Return a TableView stand-in that runs the real rendering code on a FakeCanvas."""
+    view = SimpleNamespace(model=model, canvas=FakeCanvas(), col_width=110, row_height=24, max_height=360,
+                           overscan=5, selected=None, _rows={})
+    view._draw_row = lambda row: TableView._draw_row(view, row)
+    view._draw_selection = lambda: None
+    view.redraw_row = lambda row: TableView.redraw_row(view, row)
+    return view
+
+
+def large_model():
+    model = TableModel(1000, 20)
+    for row in range(1000):
+        model.cells[row] = [f"r{row}c{col}" for col in range(20)]
+    return model
+
+
+def test_only_rows_near_the_viewport_are_drawn():
+    view = table_view(large_model())
+    start = time.perf_counter()
+    TableView.render(view)
+    assert time.perf_counter() - start < 0.05
+    assert sorted(view._rows) == list(range(0, 21))
+    assert len(view.canvas.items) == 21 * 20 * 2
+    view.canvas.top = 600 * view.row_height
+    TableView.render(view)
+    assert sorted(view._rows) == list(range(595, 621))
+    assert len(view.canvas.items) == 26 * 20 * 2
+    view.canvas.top = 985 * view.row_height
+    TableView.render(view)
+    assert sorted(view._rows) == list(range(980, 1000))
+
+
+def test_edit_then_sort_a_large_table():
+    model = large_model()
+    view = table_view(model)
+    TableView.render(view)
+    model.cells[3][2] = "edited"
+    view.redraw_row(3)
+    assert len(view.canvas.items) == 21 * 20 * 2
+    for row in range(1000):
+        model.cells[row][5] = str((row * 7919) % 1000 - 500)
+    model.shading[(10, 5)] = "#ffcc00"
+    model.sort_rows(5)
+    values = [float(row[5]) for row in model.cells]
+    assert values == sorted(values)
+    moved = next(i for i, row in enumerate(model.cells) if row[0] == "r10c0")
+    assert model.shading == {(moved, 5): "#ffcc00"}
+    model.sort_rows(2, reverse=True)
+    assert [row[2] for row in model.cells] == sorted((f"r{row}c2" for row in range(1000) if row != 3),
+                                                     reverse=True) + ["edited"]
+    assert sorted(row[0] for row in model.cells) == sorted(f"r{row}c0" for row in range(1000))
+
+
+def test_numbers_sort_before_text():
+    model = TableModel(0, 0)
+    model.append_rows([["b"], ["10"], ["a"], ["9.5"], [""]])
+    model.sort_rows(0)
+    assert [row[0] for row in model.cells] == ["9.5", "10", "", "a", "b"]
@@ -0,0 +1,42 @@
+import random
+
+from fwp import TagBatch
+
+
+class FakeText:
+    """Text widget stand-in recording the Tcl commands TagBatch sends."""
+
+    _w = ".text"
+
+    def __init__(self):
+        self.tk = self
+        self.commands = []
+
+    def call(self, *args):
+        self.commands.append(args)
+
+
+def covered(indices):
+    cells = set()
+    for start, end in zip(indices[::2], indices[1::2]):
+        line, start_col = map(int, start.split("."))
+        end_col = int(end.split(".")[1])
+        cells.update((line, col) for col in range(start_col, end_col))
+    return cells
+
+
+def test_batch_sends_one_command_per_tag_covering_every_range():
+    rng = random.Random(3)
+    text = FakeText()
+    expected = {"bold": set(), "italic": set()}
+    with TagBatch(text) as batch:
+        for _ in range(100_000):
+            tag = rng.choice(("bold", "italic"))
+            line, col = rng.randrange(1, 2000), rng.randrange(80)
+            length = rng.randrange(1, 10)
+            batch.add(tag, f"{line}.{col}", (line, col + length))
+            expected[tag].update((line, c) for c in range(col, col + length))
+    assert batch.calls == len(text.commands) == 2
+    for widget, command, action, tag, *indices in text.commands:
+        assert (command, action) == ("tag", "add")
+        assert covered(indices) == expected[tag]
@@ -0,0 +1,205 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from fwp import ChunkedLoader, CsvLoader, DocumentTab, FileFollower, PieceTable, SearchEngine, TaskRunner
+
+
+def test_main_loop_keeps_running_during_a_100_mb_save(tmp_path, widget):
+    runner = TaskRunner(widget)
+    text = PieceTable("lorem ipsum dolor sit amet " * 3_900_000)
+    for offset in range(0, len(text), len(text) // 50):
+        text.insert(offset, "edited ")
+    path = tmp_path / "saved.txt"
+    errors = []
+    runner.submit(DocumentTab._write_snapshot, str(path), text.copy(), serial=True,
+                  on_done=lambda result, error: errors.append(error))
+    ticks = [time.monotonic()]
+
+    def tick():
+        ticks.append(time.monotonic())
+        widget.after(5, tick)
+
+    widget.after(5, tick)
+    widget.pump(until=lambda: errors)
+    runner.shutdown()
+    assert errors == [None]
+    assert os.path.getsize(path) == len(text) > 100_000_000
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    assert len(gaps) > 10
+    assert max(gaps) < 0.25
+
+
+def test_callbacks_run_on_the_tk_thread(tmp_path, widget):
+    runner = TaskRunner(widget)
+    threads = []
+    results = []
+
+    def record(value):
+        threads.append(threading.get_ident())
+        results.append(value)
+
+    path = tmp_path / "notes.txt"
+    path.write_text("lorem ipsum\n" * 100_000)
+    chunks = []
+    loader = ChunkedLoader(runner, str(path), lambda text, fraction: chunks.append(text) or record(fraction),
+                           record, chunk_size=1 << 14)
+    loader.start()
+    pattern = SearchEngine.compile("ipsum")
+    spans = []
+    runner.submit(lambda task, text: SearchEngine.find_spans(text, pattern), "lorem ipsum " * 1000,
+                  on_done=lambda result, error: spans.append(result) or record(error))
+    runner.submit(DocumentTab._write_snapshot, str(tmp_path / "saved.txt"), PieceTable("saved"), serial=True,
+                  on_done=lambda result, error: record(error))
+    widget.pump(until=lambda: not runner.busy)
+    runner.shutdown()
+    assert "".join(chunks) == path.read_text()
+    assert len(spans[0][0]) == 1000
+    assert results.count(None) == 3
+    assert set(threads) == {widget.thread}
+    assert widget.foreign_calls == 0
+
+
+def open_handles(path):
+    fd_dir = f"/proc/{os.getpid()}/fd"
+    return [fd for fd in os.listdir(fd_dir) if os.path.realpath(os.path.join(fd_dir, fd)) == str(path)]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc to list open files")
+def test_loader_cancelled_before_it_runs_leaves_no_open_file(tmp_path, widget):
+    runner = TaskRunner(widget, max_workers=1)
+    busy = threading.Event()
+    runner.submit(lambda task: busy.wait(5))
+    path = tmp_path / "notes.txt"
+    path.write_text("lorem ipsum\n" * 1000)
+    done = []
+    loader = ChunkedLoader(runner, str(path), lambda text, fraction: None, done.append)
+    loader.start()
+    loader.cancel()
+    assert open_handles(path) == []
+    busy.set()
+    widget.pump(until=lambda: not runner.busy)
+    runner.shutdown()
+    assert done == [None]
+    assert open_handles(path) == []
+
+
+def test_loader_reports_a_missing_file_through_on_done(tmp_path, widget):
+    runner = TaskRunner(widget)
+    done = []
+    ChunkedLoader(runner, str(tmp_path / "missing.txt"), lambda text, fraction: None, done.append).start()
+    widget.pump(until=lambda: done)
+    runner.shutdown()
+    assert isinstance(done[0], FileNotFoundError)
+
+
+def test_csv_loader_delivers_every_row_in_batches(tmp_path, widget):
+    runner = TaskRunner(widget)
+    path = tmp_path / "rows.csv"
+    path.write_text("".join(f'{i},"item, {i}",{i * 7 % 1000}\n' for i in range(100_000)))
+    batches = []
+    errors = []
+    CsvLoader(runner, str(path), lambda rows, fraction: batches.append(rows), errors.append).start()
+    widget.pump(until=lambda: errors)
+    runner.shutdown()
+    assert errors == [None]
+    assert max(map(len, batches)) <= 1000
+    received = [row for rows in batches for row in rows]
+    assert received == [[str(i), f"item, {i}", str(i * 7 % 1000)] for i in range(100_000)]
+
+
+def test_deliveries_match_a_model_of_submit_and_cancel(widget):
+    rng = random.Random(7)
+    runner = TaskRunner(widget, max_workers=3, poll_interval=1)
+    delivered = []
+    expected = {}
+    serial_order = []
+    tasks = []
+
+    def work(task, key, steps, serial):
+        if serial:
+            serial_order.append(key)
+        for step in range(steps):
+            task.check()
+            task.progress(step)
+            time.sleep(0.0005)
+        return key
+
+    for key in range(200):
+        steps = rng.randrange(5)
+        serial = rng.random() < 0.3
+        task = runner.submit(work, key, steps, serial, serial=serial,
+                             on_progress=lambda value, key=key: delivered.append((key, "progress", value)),
+                             on_done=lambda result, error, key=key: delivered.append((key, "done", result)))
+        tasks.append((key, task, serial))
+        expected[key] = [(key, "progress", step) for step in range(steps)] + [(key, "done", key)]
+        if rng.random() < 0.2:
+            widget.pump(until=lambda: rng.random() < 0.5, timeout=5)
+        if rng.random() < 0.2:
+            cancelled_key, cancelled, _ = rng.choice(tasks)
+            cancelled.cancel()
+            # Nothing is delivered after cancel()
+            expected[cancelled_key] = [event for event in delivered if event[0] == cancelled_key]
+    widget.pump(until=lambda: not runner.busy)
+    runner.shutdown()
+    for key, task, serial in tasks:
+        assert [event for event in delivered if event[0] == key] == expected[key]
+    assert serial_order == sorted(serial_order)
+    assert widget.foreign_calls == 0
+
+
+def test_follower_reads_growth_and_restarts_after_truncation(tmp_path, widget):
+    runner = TaskRunner(widget)
+    path = tmp_path / "app.log"
+    path.write_bytes(b"first\r\n")
+    received = []
+    resets = []
+    follower = FileFollower(runner, widget, str(path), 0, received.append, lambda: resets.append(len(received)),
+                            interval=5, chunk_size=4, max_pending=1)
+    follower.start()
+    widget.pump(until=lambda: "".join(received) == "first\n")
+    with open(path, "ab") as file:
+        file.write("second \u00e9\r\n".encode("utf-8"))
+    widget.pump(until=lambda: "".join(received) == "first\nsecond \u00e9\n")
+    assert resets == []
+
+    path.write_bytes(b"new\n")
+    widget.pump(until=lambda: resets and "".join(received[resets[0]:]) == "new\n")
+    follower.stop()
+    runner.shutdown()
+    assert resets == [resets[0]] and follower.offset == 4
+
+
+class FlakyDecoder:
+    """Decoder whose first call fails like a read error."""
+
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.failures = 0
+
+    def decode(self, data, final=False):
+        if not self.failures:
+            self.failures += 1
+            raise OSError("read failed")
+        return self.decoder.decode(data, final)
+
+
+def test_follower_keeps_reading_after_a_failed_read(tmp_path, widget):
+    runner = TaskRunner(widget)
+    path = tmp_path / "app.log"
+    path.write_bytes(b"one\n")
+    received = []
+    follower = FileFollower(runner, widget, str(path), 0, received.append, lambda: None,
+                            interval=5, chunk_size=2, max_pending=1)
+    follower._decoder = FlakyDecoder(follower._decoder)
+    follower.start()
+    widget.pump(until=lambda: "".join(received) == "one\n")
+    with open(path, "ab") as file:
+        file.write(b"two\n")
+    widget.pump(until=lambda: "".join(received) == "one\ntwo\n")
+    follower.stop()
+    runner.shutdown()
+    assert follower._decoder.failures == 1
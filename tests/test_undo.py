@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+from conftest import FakeWidget
+from fwp import DocumentTab, UndoManager
+
+
+class FakeText(FakeWidget):
+    def __init__(self):
+        super().__init__()
+        self.bindings = {}
+
+    def bind(self, sequence, func, add=None):
+        self.bindings[sequence] = func
+
+
+def make_tab():
+    applied = []
+    tab = SimpleNamespace(text_area=FakeText(), app=SimpleNamespace(refresh=SimpleNamespace(request=lambda what: None)))
+    tab.history = UndoManager(tab.text_area, lambda op, undo: applied.append((op[1], undo)))
+    for name in ("undo", "redo", "on_undo_key", "on_redo_key", "on_new_tab_key"):
+        setattr(tab, name, getattr(DocumentTab, name).__get__(tab))
+    DocumentTab._bind_keys(tab)
+    return tab, applied
+
+
+def test_undo_and_redo_keys_reach_the_history():
+    tab, applied = make_tab()
+    tab.history.record(["insert", "1.0", "hello", [], []])
+    tab.text_area.run_due()
+
+    assert tab.text_area.bindings["<<Undo>>"](None) == "break"
+    assert applied == [("1.0", True)]
+    assert tab.text_area.bindings["<<Redo>>"](None) == "break"
+    assert applied == [("1.0", True), ("1.0", False)]
+    assert len(tab.history) == 1 and tab.history.redo_steps == 0
+
+
+def test_new_tab_key_does_not_reach_the_text_class():
+    tab, applied = make_tab()
+    opened = []
+    tab.app.new_tab = lambda: opened.append(True)
+    assert tab.text_area.bindings["<Control-t>"](None) == "break"
+    assert opened == [True] and len(tab.history) == 0